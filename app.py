@@ -1,11 +1,30 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox, simpledialog
 import docx
-import re
+import bisect
 from typing import List, Tuple, Optional
-import unicodedata
 import os
+import sys
+import time
 from llm_providers import LLMModelRegistry, ClaudeProvider, OpenAIProvider
+from llm_routing import HedgedRouter, CircuitBreaker, LatencyTelemetry, AutoModelSelector
+from batch_jobs import BatchJobManager
+from stream_checkpoint import join_continuation
+from masking import (PlaceholderRestorer, NormalizedText, text_diff_opcodes,
+                     normalize_text, find_word_position, find_name_occurrences,
+                     default_masking_workers, scan_pii, PII_CATEGORIES)
+from document import PieceTable
+from name_candidates import load_gazetteer, find_name_candidates
+from masking_profiles import ProfileStore
+from sections import SectionSegmenter, load_headings, selected_ranges
+from fuzzy_search import find_approximate
+from template_store import TemplateStore, INSTRUCTION, CHAT
+from session_journal import restore_occurrences
+from workspace import Workspace, DocumentAttribute
+from pipeline import mask_names, mask_pii, DEFAULT_INSTRUCTION
+from perf_trace import PerfRecorder
+from memory_diagnostics import MemoryProfiler
+from windowed_text import WindowedText
 
 # Try to import tkinterdnd2 for drag-and-drop support
 try:
@@ -17,7 +36,30 @@ except ImportError:
     print("Install it with: pip install tkinterdnd2")
 
 
+class AnswerStopped(Exception):
+    """Raised from the streaming callbacks to stop the answer being received"""
+
+
 class WordProcessorApp:
+    # Per-document state: read from and written to the active document of the workspace
+    # (see workspace.DocumentState for what each one holds)
+    document = DocumentAttribute()
+    masked_pieces = DocumentAttribute()
+    extracted_text_dirty = DocumentAttribute()
+    masking_preview_stale = DocumentAttribute()
+    occurrences = DocumentAttribute()
+    changes_listbox_slots = DocumentAttribute()
+    live_mask_index = DocumentAttribute()
+    live_mask_cache = DocumentAttribute()
+    name_suggestions = DocumentAttribute()
+    name_suggestions_text = DocumentAttribute()
+    conversation_history = DocumentAttribute()
+    is_first_message = DocumentAttribute()
+    resume_state = DocumentAttribute()
+    stream_checkpoint = DocumentAttribute()
+    session_journal = DocumentAttribute()
+    journaled_edited_text = DocumentAttribute()
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Word Document Processor with LLM API")
@@ -43,6 +85,9 @@ class WordProcessorApp:
         # Load API keys from private.txt
         self.claude_api_key = None
         self.openai_api_key = None
+        # Optional API base URLs (e.g. a local stand-in server from llm_standin.py)
+        self.claude_base_url = None
+        self.openai_base_url = None
         self.load_api_keys()
         
         # Initialize LLM Registry
@@ -51,14 +96,14 @@ class WordProcessorApp:
         # Register providers with their respective API keys
         try:
             if self.claude_api_key:
-                claude_provider = ClaudeProvider(self.claude_api_key)
+                claude_provider = ClaudeProvider(self.claude_api_key, base_url=self.claude_base_url)
                 self.llm_registry.register_provider("claude", claude_provider)
         except Exception as e:
             print(f"Warning: Could not initialize Claude provider: {e}")
         
         try:
             if self.openai_api_key:
-                openai_provider = OpenAIProvider(self.openai_api_key)
+                openai_provider = OpenAIProvider(self.openai_api_key, base_url=self.openai_base_url)
                 self.llm_registry.register_provider("openai", openai_provider)
         except Exception as e:
             print(f"Warning: Could not initialize OpenAI provider: {e}")
@@ -67,40 +112,139 @@ class WordProcessorApp:
         available_models = self.llm_registry.get_all_models()
         self.selected_model = available_models[0] if available_models else None
         
+        # Routing configuration - hedged requests and failover between providers
+        # If the selected model has not streamed a first token within the deadline,
+        # a backup model on another provider is launched and the first to stream wins.
+        # Providers that failed several times in a row are skipped for a while.
+        self.first_token_deadline = 10.0  # Seconds to wait for a first token before hedging
+        self.backup_models = [  # Preferred backup models, in order
+            "claude-sonnet-4-5-20250929",
+            "gpt-5.2",
+        ]
+        self.latency_telemetry = LatencyTelemetry("latency_telemetry.json")
+        self.llm_router = HedgedRouter(
+            self.llm_registry,
+            first_token_deadline=self.first_token_deadline,
+            backup_models=self.backup_models,
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=120.0),
+            telemetry=self.latency_telemetry
+        )
+        
+        # Automatic model selection - the "Auto" entry in the model dropdown picks a model
+        # from prompt size, instruction label and past latency to finish within the target
+        self.auto_model_label = "Auto (fastest fit)"
+        self.auto_model_enabled = False
+        self.latency_target_seconds = 90.0
+        # Optional, per instruction label: expected answer length as a fraction of the prompt, and
+        # the best tier to use. Labels not listed learn their ratio from past answers (telemetry)
+        self.auto_model_label_output_ratio = {}  # e.g. {"summary": 0.1}
+        self.auto_model_label_tiers = {}  # e.g. {"summary": 2}
+        self.auto_model_selector = AutoModelSelector(
+            self.llm_registry,
+            self.latency_telemetry,
+            target_seconds=self.latency_target_seconds,
+            breaker=self.llm_router.breaker
+        )
+        self.auto_model_selector.label_output_ratio.update(self.auto_model_label_output_ratio)
+        self.auto_model_selector.label_tiers.update(self.auto_model_label_tiers)
+        
+        # Batch mode - prepared prompts are collected and sent through the providers' batch APIs
+        self.batch_manager = BatchJobManager(self.llm_registry, jobs_dir="batches")
+        
         # Development/Testing: Hardcoded file path (set to None to disable, or provide full path)
         # Example: self.hardcoded_file_path = r"C:\Users\bob\Documents\test_document.docx"
         #self.hardcoded_file_path = r"C:\Users\bob\Music\test.docx"  # Set this to your test file path for development
         self.hardcoded_file_path = None
         
         # Data storage
-        self.full_text = ""
-        self.extracted_text = ""
-        self.masked_text = ""
-        self.masking_changes = []  # List of individual occurrence changes
-        self.current_changes = []  # Current list of changes for undo
-        self.name_to_id = {}  # Maps normalized name to its unique ID
-        self.name_occurrences = {}  # Maps normalized name to list of occurrences
-        
-        # Instructions storage
+        # The loaded text is kept once: the extraction is an offset view into it
+        # and the masked text is a piece table over the extraction.
+        # Several documents can be open: each one's extraction, masking, conversation and
+        # session journal (session.db, session-2.db, ...) live in the workspace; the provider
+        # pool, masking profile, templates and caches below are shared by all documents
+        self.session_file = "session.db"
+        self.session_compact_every = 200  # Deltas journaled before a document's journal is compacted
+        # Streamed output is checkpointed to disk so an interrupted answer can be resumed,
+        # one checkpoint per document (stream_checkpoint, stream_checkpoint-2, ...)
+        self.stream_checkpoint_file = "stream_checkpoint"
+        self.workspace = Workspace(self.session_file, self.session_compact_every, self.stream_checkpoint_file)
+        # PII categories detected by "Mask PII" (see masking.PII_PATTERNS), e.g. remove "ADDRESS"
+        self.pii_categories = list(PII_CATEGORIES)
+        
+        # Masking profiles (names, PII values and their IDs for one case), stored locally
+        self.profile_store = ProfileStore("masking_profiles.json")
+        self.profile_store.load()
+        self.active_profile = None  # Profile whose placeholders are used for the current document
+        # Texts longer than this (in characters) are masked in parallel shards
+        self.parallel_masking_threshold = 2_000_000
+        self.masking_workers = default_masking_workers()  # Worker processes for sharded masking
+        
+        # Live masking preview: matches of the names being typed are highlighted
+        # in the preview, after a short pause in typing
+        self.live_masking_var = tk.BooleanVar(value=True)
+        self.live_mask_delay_ms = 250  # Debounce delay after the last keystroke
+        self.live_mask_max_highlights = 5000  # Highlight at most this many matches
+        self.live_mask_after_id = None
+        
+        # Text panes (extracted text, masking preview, result) only hold a window of their text
+        # around the visible region, so 5-10 MB reports are inserted and scrolled quickly
+        self.text_window_chars = 100_000  # Characters in the widget; longer texts are windowed
+        
+        # Name suggestions: names after honorifics and names found in the gazetteer
+        self.gazetteer_file = "gazetteer.bin"  # Memory-mapped trie, rebuilt from the seed list when needed
+        self.gazetteer_seed_file = "gazetteer_seed.txt"
+        self.gazetteer = None  # Opened on first use
+        self.max_name_suggestions = 12  # Number of suggestion buttons shown
+        
+        # Report sections (headings configured in headings.txt, found in one pass, cached per document)
+        self.marker_max_distance = 2  # Typing/OCR errors tolerated in the start and end markers
+        self.headings_file = "headings.txt"
+        self.section_segmenter = None  # Built from the heading dictionary on first use
+        
+        # Instruction and chat message templates (SQLite; texts are loaded when selected)
+        self.template_store = TemplateStore("templates.db")
+        
+        # Instructions storage (instructions.txt is only read once, to import it)
         self.instructions_file = "instructions.txt"
-        self.instructions_dict = {}  # Dictionary to store instructions: {label: text}
         self.current_instruction_label = "basic"
         
-        # Chat messages storage
+        # Chat messages storage (chat.txt is only read once, to import it)
         self.chat_file = "chat.txt"
-        self.chat_dict = {}  # Dictionary to store chat messages: {label: text}
         self.current_chat_label = "basic"
         
-        # Conversation history for chat functionality
-        self.conversation_history = []  # List of messages: [{"role": "user"/"assistant", "content": "..."}]
-        self.is_first_message = True  # Track if this is the first API call
+        self.api_busy = False  # True while an answer is being streamed
+        self.close_requested = False  # Window closed while streaming: the answer is stopped, then the app closes
+        
+        # Performance panel (hidden tab, shown with Ctrl+Shift+P): timings of the hot paths,
+        # event loop stalls and export to a trace file that can be attached to tickets.
+        # Recording is off by default (start with --perf, or tick the box in the panel)
+        self.perf = PerfRecorder(capacity=5000)  # Most recent spans kept
+        self.perf_tick_ms = 50  # Event loop heartbeat while recording
+        self.perf_stall_threshold_ms = 150  # A heartbeat this late is reported as a stall
+        self.perf_tick_after_id = None
+        self.perf_panel_refresh_ms = 1000  # Refresh of the panel while it is shown
+        self.perf_panel_refreshed = 0.0
+        self.perf_trace_file = "perf_trace.json"  # Default export file name
+        
+        # Memory diagnostics (python app.py --memory): a tracemalloc snapshot after each pipeline
+        # step, attributed to the texts, indexes and conversation of the active document.
+        # One line is printed per step; the full report is printed and saved on exit
+        self.memory_profiler: Optional[MemoryProfiler] = None  # Set while the mode is on
+        self.memory_report_file = "memory_report.txt"
         
         # Load saved instructions and chat messages
         self.load_instructions()
         self.load_chat_messages()
         
+        # Reopen the documents of the previous session (or start with an empty one)
+        self.restore_session()
+        
         # Create GUI
         self.create_widgets()
+        # After the session: interrupted answers are restored with their document's masking
+        self.load_stream_checkpoints()
+        self.show_active_document()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Auto-load hardcoded file if specified (for development/testing)
         if self.hardcoded_file_path:
@@ -111,6 +255,25 @@ class WordProcessorApp:
             else:
                 print(f"Warning: Hardcoded file path does not exist: {self.hardcoded_file_path}")
     
+    @property
+    def full_text(self) -> str:
+        """The whole loaded document text"""
+        return self.document.source
+    
+    @property
+    def extracted_text(self) -> str:
+        """The extracted (possibly edited) text that is masked and sent"""
+        return self.document.extracted
+    
+    @extracted_text.setter
+    def extracted_text(self, text: str):
+        self.document.set_extracted(text)
+    
+    @property
+    def masked_text(self) -> str:
+        """The masked text, materialized from its pieces"""
+        return self.masked_pieces.text()
+    
     def load_api_keys(self):
         """Load API keys from private.txt file"""
         private_file = "private.txt"
@@ -136,6 +299,10 @@ class WordProcessorApp:
                             self.claude_api_key = value
                         elif key_name == 'openai_api_key':
                             self.openai_api_key = value
+                        elif key_name == 'claude_base_url':
+                            self.claude_base_url = value
+                        elif key_name == 'openai_base_url':
+                            self.openai_base_url = value
         except Exception as e:
             messagebox.showerror("Error", f"Failed to read API keys from '{private_file}': {str(e)}")
     
@@ -146,11 +313,22 @@ class WordProcessorApp:
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(0, weight=1)
-        main_frame.rowconfigure(0, weight=1)
+        main_frame.rowconfigure(1, weight=1)
+        
+        # Open documents of the workspace (switching keeps each one's extraction, masking and chat)
+        documents_frame = ttk.Frame(main_frame)
+        documents_frame.grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
+        ttk.Label(documents_frame, text="Document:").pack(side=tk.LEFT, padx=(0, 5))
+        self.document_var = tk.StringVar()
+        self.document_combo = ttk.Combobox(documents_frame, textvariable=self.document_var, width=40, state="readonly")
+        self.document_combo.pack(side=tk.LEFT)
+        self.document_combo.bind('<<ComboboxSelected>>', self.on_document_selected)
+        ttk.Button(documents_frame, text="New", command=self.new_document).pack(side=tk.LEFT, padx=2)
+        ttk.Button(documents_frame, text="Close", command=self.close_document).pack(side=tk.LEFT, padx=2)
         
         # Create notebook for tabs
         self.notebook = ttk.Notebook(main_frame)
-        self.notebook.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.notebook.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # Tab 1: Text Extraction
         self.tab1 = ttk.Frame(self.notebook, padding="10")
@@ -166,6 +344,14 @@ class WordProcessorApp:
         self.tab3 = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(self.tab3, text="3. CHATGPT")
         self.create_tab3()
+        
+        # Performance panel: hidden until Ctrl+Shift+P
+        self.perf_tab = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(self.perf_tab, text="PERFORMANCE")
+        self.create_perf_tab()
+        self.notebook.hide(self.perf_tab)
+        self.root.bind_all('<Control-P>', self.toggle_perf_tab)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_notebook_tab_changed)
     
     def create_tab1(self):
         """Create Tab 1: Text Extraction"""
@@ -215,6 +401,7 @@ class WordProcessorApp:
         button_frame.grid(row=2, column=2, padx=5, sticky=tk.W)
         ttk.Button(button_frame, text="Extract", command=self.extract_text).pack(side=tk.LEFT, padx=2)
         ttk.Button(button_frame, text="Undo", command=self.undo_extraction).pack(side=tk.LEFT, padx=2)
+        ttk.Button(button_frame, text="Sections...", command=self.choose_sections).pack(side=tk.LEFT, padx=2)
         
         # Extracted text display (editable)
         extracted_label_frame = ttk.Frame(self.tab1)
@@ -226,7 +413,10 @@ class WordProcessorApp:
         nav_frame.grid(row=3, column=2, padx=5, sticky=tk.N)
         ttk.Button(nav_frame, text="CONTINUE →", command=self.sync_to_masking).pack(side=tk.TOP, pady=2)
         
-        self.extracted_text_area = scrolledtext.ScrolledText(self.tab1, height=15, width=80, wrap=tk.WORD)
+        # Track user edits so the widget is only copied back out when it changed
+        self.extracted_text_area = WindowedText(self.tab1, window_chars=self.text_window_chars,
+                                                on_modify=self.on_extracted_text_modified,
+                                                height=15, width=80, wrap=tk.WORD)
         self.extracted_text_area.grid(row=3, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
         
         # Configure grid weights for resizing
@@ -238,25 +428,51 @@ class WordProcessorApp:
         
         # Navigation button to previous tab
         nav_frame_top = ttk.Frame(self.tab2)
-        nav_frame_top.grid(row=0, column=0, columnspan=3, sticky=tk.W, pady=5)
+        nav_frame_top.grid(row=0, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
         ttk.Button(nav_frame_top, text="← Back", command=self.go_to_extraction_tab).pack(side=tk.LEFT, padx=5)
         
+        # Masking profile (top right): the same placeholders for every document of a case
+        ttk.Button(nav_frame_top, text="Save profile", command=self.save_masking_profile).pack(side=tk.RIGHT, padx=2)
+        ttk.Button(nav_frame_top, text="Apply profile", command=self.apply_masking_profile).pack(side=tk.RIGHT, padx=2)
+        self.profile_var = tk.StringVar()
+        self.profile_combo = ttk.Combobox(nav_frame_top, textvariable=self.profile_var, width=25,
+                                          values=self.profile_store.profile_names())
+        self.profile_combo.pack(side=tk.RIGHT, padx=2)
+        ttk.Label(nav_frame_top, text="Profile:").pack(side=tk.RIGHT, padx=2)
+        
         # Names to mask section
         ttk.Label(self.tab2, text="Names:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        names_frame = ttk.Frame(self.tab2)
+        names_frame.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5)
+        names_frame.columnconfigure(0, weight=1)
         self.names_var = tk.StringVar()
-        ttk.Entry(self.tab2, textvariable=self.names_var, width=50).grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5)
-        ttk.Button(self.tab2, text="APPLY", command=self.apply_masking).grid(row=1, column=2, padx=5)
+        ttk.Entry(names_frame, textvariable=self.names_var, width=50).grid(row=0, column=0, sticky=(tk.W, tk.E))
+        ttk.Checkbutton(names_frame, text="Live", variable=self.live_masking_var,
+                        command=self.schedule_live_mask_preview).grid(row=0, column=1, padx=5)
+        # Occurrence counts of the names being typed (live mode)
+        self.live_mask_info_var = tk.StringVar(value="")
+        ttk.Label(names_frame, textvariable=self.live_mask_info_var, foreground="gray").grid(row=1, column=0, columnspan=2, sticky=tk.W)
+        self.names_var.trace_add('write', lambda *args: self.schedule_live_mask_preview())
+        # One-click name suggestions (filled when the masking tab is opened)
+        self.name_suggestions_frame = ttk.Frame(names_frame)
+        self.name_suggestions_frame.grid(row=2, column=0, columnspan=2, sticky=tk.W)
+        mask_buttons_frame = ttk.Frame(self.tab2)
+        mask_buttons_frame.grid(row=1, column=2, padx=5, sticky=tk.N)
+        ttk.Button(mask_buttons_frame, text="APPLY", command=self.apply_masking).pack(fill=tk.X)
+        ttk.Button(mask_buttons_frame, text="Mask PII", command=self.apply_pii_masking).pack(fill=tk.X, pady=(2, 0))
         
         # Masking preview
         ttk.Label(self.tab2, text=".").grid(row=2, column=0, sticky=(tk.W, tk.N), pady=5)
-        self.masking_preview_area = scrolledtext.ScrolledText(self.tab2, height=10, width=80, wrap=tk.WORD)
+        self.masking_preview_area = WindowedText(self.tab2, window_chars=self.text_window_chars,
+                                                 height=10, width=80, wrap=tk.WORD)
         self.masking_preview_area.grid(row=2, column=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        self.masking_preview_area.tag_configure("live_match", background="#fff3a0")
         
         # Changes list
         ttk.Label(self.tab2, text="Changes :").grid(row=3, column=0, sticky=(tk.W, tk.N), pady=5)
         changes_frame = ttk.Frame(self.tab2)
         changes_frame.grid(row=3, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
-        self.changes_listbox = tk.Listbox(changes_frame, height=5, width=50)
+        self.changes_listbox = tk.Listbox(changes_frame, height=5, width=50, selectmode=tk.EXTENDED)
         self.changes_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.changes_listbox.bind('<Double-Button-1>', self.undo_change)
         ttk.Button(changes_frame, text="Cancel", command=self.undo_selected_change).pack(side=tk.LEFT, padx=5)
@@ -288,6 +504,9 @@ class WordProcessorApp:
                                         width=30, state="readonly")
         self.model_combo.pack(side=tk.LEFT, padx=5)
         self.model_combo.bind('<<ComboboxSelected>>', self.on_model_selected)
+        # Shows the model chosen by "Auto" and why
+        self.auto_model_info_var = tk.StringVar()
+        ttk.Label(model_selection_frame, textvariable=self.auto_model_info_var, foreground="gray").pack(side=tk.LEFT, padx=5)
         self.update_model_combo()
         
         instructions_label_frame = ttk.Frame(self.tab3)
@@ -308,18 +527,26 @@ class WordProcessorApp:
         ttk.Button(buttons_frame, text="Save", command=self.save_instruction).pack(side=tk.LEFT, padx=2)
         ttk.Button(buttons_frame, text="Create New", command=self.create_new_instruction).pack(side=tk.LEFT, padx=2)
         ttk.Button(buttons_frame, text="Delete", command=self.delete_instruction).pack(side=tk.LEFT, padx=2)
+        ttk.Button(buttons_frame, text="Search...", command=self.search_templates).pack(side=tk.LEFT, padx=2)
         
         # Instruction text area (editable)
         ttk.Label(self.tab3, text="Instructions:").grid(row=3, column=0, sticky=(tk.W, tk.N), pady=5)
         self.instructions_text_area = scrolledtext.ScrolledText(self.tab3, height=6, width=80, wrap=tk.WORD)
         self.instructions_text_area.grid(row=3, column=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
         
-        # Send button
-        ttk.Button(self.tab3, text="SEND", command=self.send_to_api).grid(row=4, column=1, columnspan=2, pady=5)
+        # Send button, plus batch mode buttons for overnight runs
+        send_frame = ttk.Frame(self.tab3)
+        send_frame.grid(row=4, column=1, columnspan=2, pady=5)
+        ttk.Button(send_frame, text="SEND", command=self.send_to_api).pack(side=tk.LEFT, padx=5)
+        self.resume_button = ttk.Button(send_frame, text="Resume", command=self.resume_interrupted_answer, state=tk.DISABLED)
+        self.resume_button.pack(side=tk.LEFT, padx=2)
+        ttk.Button(send_frame, text="Add to batch", command=self.add_to_batch).pack(side=tk.LEFT, padx=2)
+        ttk.Button(send_frame, text="Submit batch", command=self.submit_batch).pack(side=tk.LEFT, padx=2)
+        ttk.Button(send_frame, text="Check batches", command=self.check_batches).pack(side=tk.LEFT, padx=2)
         
         # Update instruction combo and load default
         self.update_instruction_combo()
-        if "basic" in self.instructions_dict:
+        if self.template_store.exists(INSTRUCTION, "basic"):
             self.instruction_label_var.set("basic")
             self.on_instruction_label_selected()
         
@@ -327,7 +554,8 @@ class WordProcessorApp:
         ttk.Label(self.tab3, text="Result:").grid(row=5, column=0, sticky=(tk.W, tk.N), pady=5)
         final_text_frame = ttk.Frame(self.tab3)
         final_text_frame.grid(row=5, column=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-        self.final_text_area = scrolledtext.ScrolledText(final_text_frame, height=29, width=80, wrap=tk.WORD)
+        self.final_text_area = WindowedText(final_text_frame, window_chars=self.text_window_chars,
+                                            height=29, width=80, wrap=tk.WORD)
         self.final_text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         ttk.Button(final_text_frame, text="COPY", command=self.copy_final_text).pack(side=tk.LEFT, padx=5)
         
@@ -366,7 +594,7 @@ class WordProcessorApp:
         
         # Update chat combo and load default
         self.update_chat_combo()
-        if "basic" in self.chat_dict:
+        if self.template_store.exists(CHAT, "basic"):
             self.chat_label_var.set("basic")
             self.on_chat_label_selected()
         
@@ -376,63 +604,496 @@ class WordProcessorApp:
         self.tab3.rowconfigure(5, weight=2)  # Final text area (more weight)
         # Rows 0, 1, 2, 4, 6, 7, 8 have no weight (fixed size elements)
     
+    def create_perf_tab(self):
+        """Create the performance panel: span summary, event loop stalls and recent spans"""
+        self.perf_tab.columnconfigure(0, weight=1)
+        
+        controls_frame = ttk.Frame(self.perf_tab)
+        controls_frame.grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.perf_enabled_var = tk.BooleanVar(value=self.perf.enabled)
+        ttk.Checkbutton(controls_frame, text="Record timings", variable=self.perf_enabled_var,
+                        command=self.on_perf_toggled).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="Refresh", command=self.refresh_perf_panel).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls_frame, text="Clear", command=self.clear_perf_data).pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls_frame, text="Export trace...", command=self.export_perf_trace).pack(side=tk.LEFT, padx=2)
+        self.perf_info_var = tk.StringVar()
+        ttk.Label(controls_frame, textvariable=self.perf_info_var, foreground="gray").pack(side=tk.LEFT, padx=10)
+        
+        # One row per span name (slowest mean first)
+        columns = ("category", "count", "last", "mean", "max")
+        self.perf_summary_tree = ttk.Treeview(self.perf_tab, columns=columns, height=12)
+        self.perf_summary_tree.heading("#0", text="Span")
+        self.perf_summary_tree.column("#0", width=280)
+        for column, title in zip(columns, ("Category", "Count", "Last (ms)", "Mean (ms)", "Max (ms)")):
+            self.perf_summary_tree.heading(column, text=title)
+            self.perf_summary_tree.column(column, width=90, anchor=tk.E if column != "category" else tk.W)
+        self.perf_summary_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        
+        ttk.Label(self.perf_tab, text="Event loop stalls (most recent first):").grid(row=2, column=0, sticky=tk.W)
+        self.perf_stalls_listbox = tk.Listbox(self.perf_tab, height=6)
+        self.perf_stalls_listbox.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(self.perf_tab, text="Recent spans:").grid(row=4, column=0, sticky=tk.W)
+        self.perf_recent_listbox = tk.Listbox(self.perf_tab, height=10)
+        self.perf_recent_listbox.grid(row=5, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        
+        self.perf_tab.rowconfigure(1, weight=2)
+        self.perf_tab.rowconfigure(5, weight=1)
+    
+    def toggle_perf_tab(self, event=None):
+        """Show or hide the performance panel"""
+        if self.notebook.tab(self.perf_tab, "state") == "hidden":
+            self.notebook.add(self.perf_tab)
+            self.notebook.select(self.perf_tab)
+        else:
+            self.notebook.hide(self.perf_tab)
+    
+    def on_notebook_tab_changed(self, event=None):
+        if self.notebook.select() == str(self.perf_tab):
+            self.refresh_perf_panel()
+    
+    def set_perf_enabled(self, enabled: bool):
+        """Start or stop recording timings (and the event loop heartbeat used to detect stalls)"""
+        self.perf.set_enabled(enabled)
+        self.perf_enabled_var.set(enabled)
+        if self.perf_tick_after_id is not None:
+            self.root.after_cancel(self.perf_tick_after_id)
+            self.perf_tick_after_id = None
+        if enabled:
+            self.perf_tick()
+    
+    def on_perf_toggled(self):
+        self.set_perf_enabled(self.perf_enabled_var.get())
+    
+    def perf_tick(self):
+        """Event loop heartbeat: a late tick means the loop was blocked (recorded as a stall)"""
+        self.perf_tick_after_id = None
+        if not self.perf.enabled:
+            return
+        self.perf.tick(self.perf_tick_ms / 1000, self.perf_stall_threshold_ms / 1000)
+        # Keep the panel current while it is shown
+        now = time.perf_counter()
+        if (now - self.perf_panel_refreshed) * 1000 >= self.perf_panel_refresh_ms \
+                and self.notebook.select() == str(self.perf_tab):
+            self.refresh_perf_panel()
+        self.perf_tick_after_id = self.root.after(self.perf_tick_ms, self.perf_tick)
+    
+    def refresh_perf_panel(self):
+        """Fill the performance panel from the recorded spans"""
+        self.perf_panel_refreshed = time.perf_counter()
+        self.perf_summary_tree.delete(*self.perf_summary_tree.get_children())
+        for entry in self.perf.summary():
+            self.perf_summary_tree.insert("", tk.END, text=entry["name"], values=(
+                entry["cat"], entry["count"], f"{entry['last'] * 1000:.1f}",
+                f"{entry['mean'] * 1000:.1f}", f"{entry['max'] * 1000:.1f}"))
+        
+        stalls = self.perf.stalls()
+        self.perf_stalls_listbox.delete(0, tk.END)
+        for stall in stalls:
+            culprit = f" during {stall['culprit']}" if stall['culprit'] else ""
+            self.perf_stalls_listbox.insert(tk.END, f"{stall['start']:10.3f} s   blocked {stall['duration'] * 1000:.0f} ms{culprit}")
+        
+        events = self.perf.snapshot()
+        self.perf_recent_listbox.delete(0, tk.END)
+        for event in reversed(events[-200:]):
+            details = ", ".join(f"{key}={value}" for key, value in event["args"].items())
+            self.perf_recent_listbox.insert(tk.END, f"{event['start']:10.3f} s   {event['duration'] * 1000:8.1f} ms   "
+                                                    f"{event['name']}" + (f" ({details})" if details else ""))
+        
+        state = "recording" if self.perf.enabled else "not recording"
+        self.perf_info_var.set(f"{len(events)} events, {len(stalls)} stall{'s' if len(stalls) != 1 else ''} ({state})")
+    
+    def clear_perf_data(self):
+        self.perf.clear()
+        self.refresh_perf_panel()
+    
+    def export_perf_trace(self):
+        """Save the recorded spans as a trace file (opens in chrome://tracing or Perfetto)"""
+        if not self.perf.snapshot():
+            messagebox.showwarning("Warning", "No timings recorded yet. Tick 'Record timings' and reproduce the problem.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            title="Export performance trace",
+            initialfile=self.perf_trace_file,
+            defaultextension=".json",
+            filetypes=[("Trace files", "*.json"), ("All Files", "*.*")]
+        )
+        if not file_path:
+            return
+        # Sizes only: the trace never contains document text
+        metadata = {
+            "documents_open": len(self.workspace.documents),
+            "document_chars": len(self.full_text),
+            "extracted_chars": len(self.extracted_text),
+            "masked_names": len(self.occurrences.name_index),
+            "conversation_messages": len(self.conversation_history),
+            "model": self.selected_model,
+            "stall_threshold_ms": self.perf_stall_threshold_ms,
+        }
+        try:
+            self.perf.export(file_path, metadata)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export the trace: {str(e)}")
+            return
+        messagebox.showinfo("Performance", f"Trace written to {file_path}")
+    
+    def memory_checkpoint(self, step: str, prompt: Optional[str] = None):
+        """Measure the memory footprint after a pipeline step (memory diagnostics mode only)"""
+        if self.memory_profiler is None:
+            return
+        active = self.workspace.active
+        # Measured in this order: a string shared with an earlier structure is not counted again
+        structures = {
+            "full_text": self.document.source,
+            "extracted": self.extracted_text,
+            "masked": self.masked_pieces,
+            "prompt": prompt,
+            "conversation": [self.conversation_history, self.resume_state],
+            # Normalized texts and their position maps (once its texts are counted, what the
+            # document still holds is its normalized index)
+            "indexes": [self.document, self.live_mask_index, self.live_mask_cache],
+            "occurrences": self.occurrences,
+            "other documents": [state for state in self.workspace.documents if state is not active],
+        }
+        try:
+            widget_chars = {name: self.widget_char_count(getattr(self, name))
+                            for name in ("extracted_text_area", "masking_preview_area", "final_text_area",
+                                         "instructions_text_area")}
+            row = self.memory_profiler.checkpoint(step, structures, widget_chars)
+        except Exception as e:
+            print(f"Warning: Could not measure memory: {e}")
+            return
+        print(self.memory_profiler.format_step(row))
+    
+    def widget_char_count(self, widget) -> int:
+        """Characters held by a text widget (counted by Tk, the text is not copied)"""
+        count = widget.count("1.0", tk.END, "chars")
+        return count[0] if isinstance(count, tuple) else int(count or 0)
+    
+    def save_memory_report(self):
+        """Print the memory footprint report and write it next to the app"""
+        report = self.memory_profiler.format_report()
+        print(report)
+        try:
+            with open(self.memory_report_file, 'w', encoding='utf-8') as f:
+                f.write(report + "\n")
+        except Exception as e:
+            print(f"Warning: Could not save the memory report: {e}")
+    
+    def update_document_combo(self):
+        """Refresh the document selector from the workspace"""
+        self.document_combo['values'] = [state.label for state in self.workspace.documents]
+        self.document_combo.current(self.workspace.index())
+    
+    def store_active_document_view(self):
+        """Keep the widget contents of the active document before another one is shown"""
+        if self.extracted_text_dirty:
+            current_text = self.read_extracted_widget_text()
+            if current_text.strip() and current_text != self.extracted_text:
+                self.apply_extracted_text_edit(current_text)
+        self.workspace.active.view.update({
+            "file_path": self.file_path_var.get(),
+            "start_word": self.start_word_var.get(),
+            "end_word": self.end_word_var.get(),
+            "names": self.names_var.get(),
+            "result": self.final_text_area.get_text().rstrip('\n'),
+        })
+    
+    def show_active_document(self):
+        """Fill the widgets from the active document (nothing is parsed or masked again)"""
+        view = self.workspace.active.view
+        self.file_path_var.set(view["file_path"])
+        # A new document keeps the markers of the previous one (often the same report type)
+        if view["start_word"] is not None:
+            self.start_word_var.set(view["start_word"])
+            self.end_word_var.set(view["end_word"])
+        self.names_var.set(view["names"])
+        self.set_extracted_widget_text(self.extracted_text)
+        self.update_changes_listbox()
+        if self.notebook.index("current") == 1:
+            self.refresh_masking_preview()
+        else:
+            # Filled when the masking tab is opened
+            self.masking_preview_area.clear()
+            self.masking_preview_stale = True
+        self.show_name_suggestions()
+        self.final_text_area.set_text(view["result"])
+        self.resume_button.config(state=tk.NORMAL if self.resume_state else tk.DISABLED)
+        self.update_document_combo()
+    
+    def refuse_while_busy(self, action: str) -> bool:
+        """Warn and return True while an answer is streaming. The event loop keeps running
+        during the request, so the buttons that change the document or its conversation check this"""
+        if self.api_busy:
+            messagebox.showwarning("Warning", f"Please wait for the answer to finish before {action}.")
+            return True
+        return False
+    
+    def switch_document(self, change):
+        """Store the active document's widgets, apply `change` to the workspace and show the result"""
+        if self.refuse_while_busy("switching documents"):
+            self.update_document_combo()
+            return
+        self.store_active_document_view()
+        change()
+        self.show_active_document()
+        self.memory_checkpoint("document switched")
+    
+    def on_document_selected(self, event=None):
+        index = self.document_combo.current()
+        if index < 0 or index == self.workspace.index():
+            return
+        self.switch_document(lambda: self.workspace.select(index))
+    
+    def new_document(self):
+        """Open an empty document next to the others"""
+        self.switch_document(self.workspace.open)
+    
+    def close_document(self):
+        """Close the active document, discarding its extraction, masking and conversation"""
+        if self.refuse_while_busy("closing the document"):
+            return
+        if self.full_text or self.conversation_history:
+            if not messagebox.askyesno("Confirm", "Close this document? Its extraction, masking and conversation will be discarded."):
+                return
+        self.switch_document(lambda: self.workspace.close(self.workspace.active))
+    
     def go_to_extraction_tab(self):
         """Navigate to Tab 1: Text Extraction"""
         self.notebook.select(0)
     
     def go_to_masking_tab(self):
         """Navigate to Tab 2: Name Masking"""
-        # Sync extracted text to masking if needed (read from text area to get any edits)
-        if self.extracted_text_area.get(1.0, tk.END).strip():
-            # Get current text from the text area (may have been edited)
-            current_text = self.extracted_text_area.get(1.0, tk.END).rstrip('\n')
-            if current_text:
-                # Update extracted_text with current text from widget
-                self.extracted_text = current_text
-                # Update masked_text if not already set or if text changed
-                if not self.masked_text or self.masked_text != self.extracted_text:
-                    self.masked_text = self.extracted_text
-                    # Update the masking preview
-                    self.masking_preview_area.delete(1.0, tk.END)
-                    self.masking_preview_area.insert(1.0, self.masked_text)
+        # Sync extracted text to masking if needed (the widget is only read when it was edited)
+        if self.extracted_text_dirty:
+            current_text = self.read_extracted_widget_text()
+            if current_text.strip() and current_text != self.extracted_text:
+                # The text was edited: carry the existing masking over to the new text
+                self.apply_extracted_text_edit(current_text)
+        if self.masking_preview_stale:
+            # The preview is filled lazily (e.g. after loading a document)
+            self.refresh_masking_preview()
+        if self.name_suggestions_text is not self.extracted_text:
+            self.update_name_suggestions()
         self.notebook.select(1)
     
+    def on_extracted_text_modified(self):
+        """Mark the extracted text as edited (programmatic inserts are not reported by the pane)"""
+        self.extracted_text_dirty = True
+    
+    def read_extracted_widget_text(self) -> str:
+        """Copy the extracted text back out of the widget and clear the dirty flag"""
+        self.extracted_text_dirty = False
+        return self.extracted_text_area.get_text().rstrip('\n')
+    
+    def set_extracted_widget_text(self, text: str):
+        """Show text in the extracted text area without marking it as edited"""
+        with self.perf.span("insert extracted text", "widget", chars=len(text)):
+            self.extracted_text_area.set_text(text)
+        self.extracted_text_dirty = False
+    
+    def refresh_masking_preview(self):
+        """Show the masked text in the preview (the pane reads its window from the pieces)"""
+        with self.perf.span("insert masking preview", "widget", chars=len(self.masked_pieces)):
+            self.masking_preview_area.set_text(self.masked_pieces)
+        self.masking_preview_stale = False
+        # Inserting the text dropped the highlights of the names being typed
+        if self.names_var.get().strip():
+            self.update_live_mask_preview()
+    
+    def update_name_suggestions(self):
+        """Scan extracted_text for likely names and rebuild the suggestion buttons"""
+        if self.gazetteer is None:
+            self.gazetteer = load_gazetteer(self.gazetteer_file, self.gazetteer_seed_file)
+        self.name_suggestions_text = self.extracted_text
+        self.name_suggestions = find_name_candidates(self.extracted_text, self.gazetteer) if self.extracted_text else []
+        self.show_name_suggestions()
+    
+    def show_name_suggestions(self):
+        """Show suggestion buttons for candidates that are neither typed nor masked yet"""
+        for widget in self.name_suggestions_frame.winfo_children():
+            widget.destroy()
+        typed = {self.normalize_text(name.strip()) for name in self.names_var.get().split(",") if name.strip()}
+        shown = 0
+        for candidate in self.name_suggestions:
+            normalized_name = self.normalize_text(candidate['name'])
+            if normalized_name in typed or self.occurrences.get_slot(normalized_name) is not None:
+                continue
+            if shown == 0:
+                ttk.Label(self.name_suggestions_frame, text="Suggestions:").pack(side=tk.LEFT)
+            ttk.Button(self.name_suggestions_frame, text=f"{candidate['name']} ({candidate['count']})",
+                       command=lambda name=candidate['name']: self.add_suggested_name(name)).pack(side=tk.LEFT, padx=1)
+            shown += 1
+            if shown >= self.max_name_suggestions:
+                break
+    
+    def add_suggested_name(self, name: str):
+        """Append a suggested name to the names field"""
+        current = self.names_var.get().strip().rstrip(",")
+        self.names_var.set(f"{current}, {name}" if current else name)
+        self.show_name_suggestions()
+    
+    def schedule_live_mask_preview(self):
+        """Debounce live preview updates: run once typing pauses"""
+        if self.live_mask_after_id is not None:
+            self.root.after_cancel(self.live_mask_after_id)
+        self.live_mask_after_id = self.root.after(self.live_mask_delay_ms, self.update_live_mask_preview)
+    
+    def get_live_mask_index(self) -> NormalizedText:
+        """Normalized index of extracted_text, rebuilt only when the text changes"""
+        text = self.extracted_text
+        if self.live_mask_index is None or self.live_mask_index.text is not text:
+            with self.perf.span("normalize extracted text", "normalize", chars=len(text)):
+                self.live_mask_index = NormalizedText(text)
+            self.live_mask_cache = {}
+        return self.live_mask_index
+    
+    def update_live_mask_preview(self):
+        """Highlight matches of the typed (not yet applied) names in the masking preview.
+        The normalized text and the matches of each name are cached, so a keystroke
+        only searches the name being typed."""
+        self.live_mask_after_id = None
+        with self.perf.span("live mask preview", "mask"):
+            self._update_live_mask_preview()
+    
+    def _update_live_mask_preview(self):
+        """Body of update_live_mask_preview (timed as one span)"""
+        self.masking_preview_area.remove_tag("live_match")
+        self.live_mask_info_var.set("")
+        if not self.live_masking_var.get() or self.masking_preview_stale or not self.extracted_text:
+            return
+        
+        names = [name.strip() for name in self.names_var.get().split(",") if name.strip()]
+        index = self.get_live_mask_index()
+        
+        accepted_starts = []  # Sorted starts/ends of the spans kept so far (earlier names win)
+        accepted_ends = []
+        counts = []
+        seen_names = set()
+        for name in names:
+            normalized_name = self.normalize_text(name)
+            if len(normalized_name) < 2 or normalized_name in seen_names:
+                continue
+            seen_names.add(normalized_name)
+            if self.occurrences.get_slot(normalized_name) is not None:
+                continue  # Already applied: shown as a placeholder
+            
+            occurrences = self.live_mask_cache.get(normalized_name)
+            if occurrences is None:
+                occurrences = find_name_occurrences(index, name)
+                self.live_mask_cache[normalized_name] = occurrences
+            
+            count = 0
+            for start_pos, end_pos, _ in occurrences:
+                if self.occurrences.overlaps(start_pos, end_pos):
+                    continue
+                i = bisect.bisect_right(accepted_starts, start_pos)
+                if (i > 0 and accepted_ends[i - 1] > start_pos) or (i < len(accepted_starts) and accepted_starts[i] < end_pos):
+                    continue
+                accepted_starts.insert(i, start_pos)
+                accepted_ends.insert(i, end_pos)
+                count += 1
+            counts.append(f"{name}: {count}")
+        
+        if counts:
+            self.live_mask_info_var.set(" · ".join(counts))
+        if not accepted_starts:
+            return
+        
+        # Map extracted_text positions to preview positions (skipping placeholders) in one walk
+        shown = min(len(accepted_starts), self.live_mask_max_highlights)
+        positions = []
+        for start_pos, end_pos in zip(accepted_starts[:shown], accepted_ends[:shown]):
+            positions.append(start_pos)
+            positions.append(end_pos - 1)
+        mapped = self.masked_pieces.map_original_positions(positions)
+        ranges = []
+        for i in range(0, len(mapped), 2):
+            if mapped[i] is not None and mapped[i + 1] is not None:
+                ranges.append((mapped[i], mapped[i + 1] + 1))
+        if ranges:
+            # Kept as preview offsets: the pane tags the ones in its window (in one Tk call)
+            self.masking_preview_area.add_tag("live_match", ranges)
+    
+    def apply_extracted_text_edit(self, edited_text: str):
+        """Replace extracted_text with an edited version, keeping the masking.
+        Stored spans are remapped through a diff of the edit and only the edited
+        regions are rescanned, so the cost is proportional to the edit."""
+        if len(self.occurrences):
+            with self.perf.span("remap masking through edit", "mask", chars=len(edited_text)):
+                opcodes = text_diff_opcodes(self.extracted_text, edited_text)
+                edited_regions = self.occurrences.remap(opcodes, edited_text)
+                self.extracted_text = edited_text
+                self.rescan_masking_regions(edited_regions)
+        else:
+            self.extracted_text = edited_text
+        
+        # Update masked_text and the masking preview
+        self.rebuild_masked_text()
+        self.refresh_masking_preview()
+        self.update_changes_listbox()
+        self.memory_checkpoint("extraction edited")
+    
+    def rescan_masking_regions(self, regions: List[Tuple[int, int]]):
+        """Search the active names again, but only around the given (start, end) regions"""
+        slots = self.occurrences.slots_by_id()
+        if not regions or not slots:
+            return
+        
+        text = self.extracted_text
+        name_slots = [slot for slot in slots if self.occurrences.names[slot]['category'] == "NAME"]
+        pii_categories = {self.occurrences.names[slot]['category'] for slot in slots} - {"NAME"}
+        # A name can straddle the edge of an edited region: widen by the longest name
+        margin = max(len(self.occurrences.names[slot]['original_name']) for slot in slots) + 1
+        windows = []
+        for start, end in sorted(regions):
+            start = max(0, start - margin)
+            end = min(len(text), end + margin)
+            # Snap outward to whitespace so word boundaries inside the window are real ones
+            while start > 0 and not text[start - 1].isspace():
+                start -= 1
+            while end < len(text) and not text[end].isspace():
+                end += 1
+            if windows and start <= windows[-1][1]:
+                windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+            else:
+                windows.append((start, end))
+        
+        # Earlier names keep priority, as in apply_masking
+        for slot in name_slots:
+            name = self.occurrences.names[slot]['original_name']
+            new_spans = []
+            for window_start, window_end in windows:
+                window_text = text[window_start:window_end]
+                for start_pos, end_pos, _ in self.find_name_ignore_case_accent(window_text, name):
+                    start_pos += window_start
+                    end_pos += window_start
+                    if not self.occurrences.overlaps(start_pos, end_pos):
+                        new_spans.append((start_pos, end_pos))
+            self.occurrences.add_occurrences(slot, new_spans)
+        
+        # PII values that are already masked elsewhere get their placeholder back
+        if pii_categories:
+            for window_start, window_end in windows:
+                for start_pos, end_pos, _, key in scan_pii(text[window_start:window_end], pii_categories):
+                    slot = self.occurrences.get_slot(key)
+                    start_pos += window_start
+                    end_pos += window_start
+                    if slot is not None and not self.occurrences.overlaps(start_pos, end_pos):
+                        self.occurrences.add_occurrences(slot, [(start_pos, end_pos)])
+    
     def go_to_api_tab(self):
         """Navigate to Tab 3: API & Results"""
         self.notebook.select(2)
         
     def normalize_text(self, text: str) -> str:
         """Normalize text to remove accents and convert to lowercase for comparison"""
-        # Remove accents
-        nfd = unicodedata.normalize('NFD', text)
-        text_no_accents = ''.join(c for c in nfd if unicodedata.category(c) != 'Mn')
-        return text_no_accents.lower()
+        return normalize_text(text)
     
     def find_word_ignore_case_accent(self, text: str, word: str) -> Optional[int]:
         """Find the first occurrence of a word ignoring case and accents"""
-        normalized_word = self.normalize_text(word)
-        normalized_text = self.normalize_text(text)
-        
-        # Find word boundaries
-        pattern = r'\b' + re.escape(normalized_word) + r'\b'
-        match = re.search(pattern, normalized_text)
-        
-        if match:
-            # Build position mapping
-            position_map = []
-            for orig_pos, char in enumerate(text):
-                nfd = unicodedata.normalize('NFD', char)
-                normalized_char = ''.join(c for c in nfd if unicodedata.category(c) != 'Mn')
-                normalized_lower = normalized_char.lower()
-                for _ in range(len(normalized_lower)):
-                    position_map.append(orig_pos)
-            
-            # Map normalized position to original
-            norm_start = match.start()
-            if norm_start < len(position_map):
-                return position_map[norm_start]
-        
-        return None
+        with self.perf.span("find marker", "normalize", chars=len(text)):
+            return find_word_position(text, word)
     
     def on_file_drop(self, event):
         """Handle file drop event"""
@@ -459,27 +1120,35 @@ class WordProcessorApp:
     
     def load_document(self, file_path: str):
         """Load and extract text from Word document"""
+        if self.refuse_while_busy("loading a document"):
+            return
         try:
-            doc = docx.Document(file_path)
-            self.full_text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+            with self.perf.span("parse docx", "load") as span:
+                doc = docx.Document(file_path)
+                span["paragraphs"] = len(doc.paragraphs)
             
             # Automatically extract the entire document content initially
-            self.extracted_text = self.full_text
-            self.masked_text = self.full_text
+            # (the extraction is a view over the loaded text, not a copy)
+            with self.perf.span("load text", "load") as span:
+                self.document.load("\n".join([paragraph.text for paragraph in doc.paragraphs]))
+                span["chars"] = len(self.full_text)
+            self.journal("record_document", file_path, self.full_text)
+            self.journaled_edited_text = None
+            self.workspace.active.view["file_path"] = file_path
+            self.update_document_combo()
             
             # Clear any existing masking data
-            self.masking_changes = []
-            self.current_changes = []
-            self.name_to_id = {}
-            self.name_occurrences = {}
+            self.occurrences.clear()
+            self.rebuild_masked_text()
             
             # Display the full text in the extracted text area
-            self.extracted_text_area.delete(1.0, tk.END)
-            self.extracted_text_area.insert(1.0, self.extracted_text)
+            self.set_extracted_widget_text(self.extracted_text)
             
-            # Clear masking preview and changes list
-            self.masking_preview_area.delete(1.0, tk.END)
+            # Clear masking preview (filled when the masking tab is opened) and changes list
+            self.masking_preview_area.clear()
+            self.masking_preview_stale = True
             self.changes_listbox.delete(0, tk.END)
+            self.memory_checkpoint("document loaded")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load document: {str(e)}")
@@ -500,38 +1169,103 @@ class WordProcessorApp:
         # Find start position
         start_pos = self.find_word_ignore_case_accent(self.full_text, start_word)
         if start_pos is None:
-            messagebox.showwarning("Warning", f"Start word '{start_word}' not found in document.")
-            return
+            # Tolerate typing/OCR errors: offer the closest spelling
+            start_pos = self.find_marker_approximately(start_word, "Start", 0)
+            if start_pos is None:
+                return
         
         # Find end position (search from start position)
         text_from_start = self.full_text[start_pos:]
         end_pos_relative = self.find_word_ignore_case_accent(text_from_start, end_word)
         if end_pos_relative is None:
-            messagebox.showwarning("Warning", f"End word '{end_word}' not found after start word.")
-            return
-        
-        # Exclude the end word from extraction - stop at the start of the end word
-        end_pos = start_pos + end_pos_relative
+            end_pos = self.find_marker_approximately(end_word, "End", start_pos + 1)
+            if end_pos is None:
+                return
+        else:
+            # Exclude the end word from extraction - stop at the start of the end word
+            end_pos = start_pos + end_pos_relative
         
-        # Extract text (excluding the end word)
-        self.extracted_text = self.full_text[start_pos:end_pos]
-        self.masked_text = self.extracted_text
-        self.masking_changes = []
-        self.current_changes = []
-        self.name_to_id = {}
-        self.name_occurrences = {}
+        # Extract text (excluding the end word) as an offset view into the loaded text
+        self.document.extract(start_pos, end_pos)
+        self.finish_extraction()
+    
+    def find_marker_approximately(self, word: str, role: str, min_position: int) -> Optional[int]:
+        """Look for a misspelled start/end marker and ask the user to confirm the closest one.
+        Returns its position, or None (after telling the user) if there is none or it is declined."""
+        with self.perf.span("normalize document", "normalize", chars=len(self.full_text)):
+            index = self.document.source_index()
+        with self.perf.span("find marker approximately", "extract"):
+            candidates = find_approximate(index, word, self.marker_max_distance, limit=20,
+                                          min_position=min_position)
+        if not candidates:
+            suffix = " after start word" if role == "End" else " in document"
+            messagebox.showwarning("Warning", f"{role} word '{word}' not found{suffix}.")
+            return None
+        best = candidates[0]
+        others = len(candidates) - 1
+        message = (f"{role} word '{word}' was not found exactly.\n\n"
+                   f"Closest match: '{best['text']}' ({best['distance']} difference{'s' if best['distance'] != 1 else ''})"
+                   + (f", {others} other candidate{'s' if others != 1 else ''}" if others else "")
+                   + ".\n\nUse it?")
+        if not messagebox.askyesno("Approximate match", message):
+            return None
+        return best['start']
+    
+    def finish_extraction(self):
+        """Reset the masking and display the new extraction"""
+        self.occurrences.clear()
+        self.rebuild_masked_text()
         
         # Display extracted text
-        self.extracted_text_area.delete(1.0, tk.END)
-        self.extracted_text_area.insert(1.0, self.extracted_text)
+        self.set_extracted_widget_text(self.extracted_text)
         
         # Clear masking preview
-        self.masking_preview_area.delete(1.0, tk.END)
-        self.masking_preview_area.insert(1.0, self.extracted_text)
+        self.refresh_masking_preview()
         
         # Clear changes list
         self.changes_listbox.delete(0, tk.END)
-        
+        self.memory_checkpoint("text extracted")
+    
+    def get_document_sections(self) -> List[dict]:
+        """Ordered section map of the loaded document"""
+        if self.section_segmenter is None:
+            self.section_segmenter = SectionSegmenter(load_headings(self.headings_file))
+        with self.perf.span("normalize document", "normalize", chars=len(self.full_text)):
+            index = self.document.source_index()
+        with self.perf.span("find sections", "extract"):
+            return self.section_segmenter.segment(self.full_text, index)
+    
+    def choose_sections(self):
+        """Let the user pick any combination of report sections to extract"""
+        if not self.full_text:
+            messagebox.showwarning("Warning", "Please load a document first.")
+            return
+        sections = self.get_document_sections()
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Sections")
+        dialog.transient(self.root)
+        ttk.Label(dialog, text="Select the sections to extract:").pack(anchor=tk.W, padx=10, pady=(10, 5))
+        sections_listbox = tk.Listbox(dialog, selectmode=tk.MULTIPLE, width=70, height=min(20, max(5, len(sections))),
+                                      exportselection=False)
+        sections_listbox.pack(fill=tk.BOTH, expand=True, padx=10)
+        for section in sections:
+            heading = f" — {section['heading']}" if section['heading'] and section['heading'] != section['label'] else ""
+            sections_listbox.insert(tk.END, f"{section['label']}{heading} ({section['end'] - section['start']} characters)")
+        
+        def extract_selected():
+            selected = list(sections_listbox.curselection())
+            if not selected:
+                messagebox.showwarning("Warning", "Please select at least one section.", parent=dialog)
+                return
+            dialog.destroy()
+            self.document.extract_ranges(selected_ranges(sections, selected))
+            self.finish_extraction()
+        
+        buttons_frame = ttk.Frame(dialog)
+        buttons_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(buttons_frame, text="Extract selected", command=extract_selected).pack(side=tk.RIGHT, padx=2)
+        ttk.Button(buttons_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=2)
     
     def undo_extraction(self):
         """Undo text extraction - clears extracted text and all masking"""
@@ -543,19 +1277,17 @@ class WordProcessorApp:
             return
         
         # Clear extracted text
-        self.extracted_text = ""
-        self.masked_text = ""
+        self.document.clear_extraction()
         
         # Clear all masking data
-        self.masking_changes = []
-        self.current_changes = []
-        self.name_to_id = {}
-        self.name_occurrences = {}
+        self.occurrences.clear()
+        self.rebuild_masked_text()
         
         # Clear all text areas
-        self.extracted_text_area.delete(1.0, tk.END)
-        self.masking_preview_area.delete(1.0, tk.END)
-        self.final_text_area.delete(1.0, tk.END)
+        self.set_extracted_widget_text("")
+        self.masking_preview_area.clear()
+        self.masking_preview_stale = False
+        self.final_text_area.clear()
         
         # Clear changes list
         self.changes_listbox.delete(0, tk.END)
@@ -563,34 +1295,22 @@ class WordProcessorApp:
     
     def sync_to_masking(self):
         """Sync the edited extracted text to the masking preview"""
-        # Get the current text from the extracted text area
-        edited_text = self.extracted_text_area.get(1.0, tk.END).rstrip('\n')
+        # Get the current text from the extracted text area (only if it was edited)
+        if self.extracted_text_dirty:
+            edited_text = self.read_extracted_widget_text()
+        else:
+            edited_text = self.extracted_text
         
         if not edited_text.strip():
             messagebox.showwarning("Warning", "Extracted text area is empty.")
             return
         
         # Update the extracted_text variable with the edited text
-        self.extracted_text = edited_text
-        
-        # Clear any existing masking when syncing new text
-        # Ask user if they want to keep existing masking
-        if self.current_changes:
-            if not messagebox.askyesno("Confirm", "This will clear all existing masking. Continue?"):
-                return
-            # Clear all masking data
-            self.masking_changes = []
-            self.current_changes = []
-            self.name_to_id = {}
-            self.name_occurrences = {}
-            self.changes_listbox.delete(0, tk.END)
-        
-        # Update masked_text to match the edited extracted text
-        self.masked_text = self.extracted_text
-        
-        # Update the masking preview
-        self.masking_preview_area.delete(1.0, tk.END)
-        self.masking_preview_area.insert(1.0, self.masked_text)
+        # Existing masking is remapped through the edit instead of being cleared
+        if edited_text != self.extracted_text:
+            self.apply_extracted_text_edit(edited_text)
+        elif self.masking_preview_stale:
+            self.refresh_masking_preview()
         
         # Navigate to masking tab
         self.go_to_masking_tab()
@@ -599,125 +1319,14 @@ class WordProcessorApp:
         """Find all occurrences of a name ignoring case and accents.
         Returns list of (start_pos, end_pos, original_text) tuples.
         Handles both single-word and multi-word names (e.g., "John" or "John Smith")."""
-        normalized_name = self.normalize_text(name)
-        results = []
-        
-        # Check if name contains spaces (multi-word name)
-        name_has_spaces = ' ' in name
-        
-        if name_has_spaces:
-            # For multi-word names, match the entire phrase with word boundaries at start and end
-            # Escape the name and replace spaces with \s+ to handle multiple spaces
-            escaped_name = re.escape(normalized_name)
-            # Replace escaped spaces with \s+ to handle variable whitespace
-            pattern = r'\b' + escaped_name.replace(r'\ ', r'\s+') + r'\b'
-        else:
-            # For single-word names, use word boundaries
-            pattern = r'\b' + re.escape(normalized_name) + r'\b'
-        
-        # Normalize the text for searching
-        normalized_text = self.normalize_text(text)
-        matches = list(re.finditer(pattern, normalized_text))
-        
-        # Build position mapping
-        position_map = []
-        for orig_pos, char in enumerate(text):
-            nfd = unicodedata.normalize('NFD', char)
-            normalized_char = ''.join(c for c in nfd if unicodedata.category(c) != 'Mn')
-            normalized_lower = normalized_char.lower()
-            for _ in range(len(normalized_lower)):
-                position_map.append(orig_pos)
-        
-        # Map back to original positions
-        for match in matches:
-            norm_start = match.start()
-            norm_end = match.end()
-            
-            # Find corresponding positions in original text
-            if norm_start < len(position_map) and norm_end <= len(position_map):
-                orig_start = position_map[norm_start] if norm_start < len(position_map) else position_map[-1]
-                # For end position, find the corresponding position in original text
-                if norm_end > 0 and norm_end <= len(position_map):
-                    orig_end = position_map[norm_end - 1] + 1
-                else:
-                    orig_end = orig_start
-                
-                # For multi-word names, we need to find the exact end of the phrase in original text
-                if name_has_spaces:
-                    # Find the end of the full phrase by looking for the last word
-                    # Start from orig_start and find the full phrase
-                    phrase_end = orig_start
-                    words = name.split()
-                    word_count = 0
-                    i = orig_start
-                    
-                    # Skip leading whitespace
-                    while i < len(text) and text[i].isspace():
-                        i += 1
-                    
-                    # Try to match all words in the phrase
-                    for word_idx, word in enumerate(words):
-                        if i >= len(text):
-                            break
-                        
-                        # Find the start of this word
-                        word_start = i
-                        # Find the end of this word (alphanumeric + apostrophes/hyphens)
-                        while i < len(text) and (text[i].isalnum() or text[i] in "'-"):
-                            i += 1
-                        word_end = i
-                        
-                        # Check if this word matches (case/accent insensitive)
-                        word_text = text[word_start:word_end]
-                        if self.normalize_text(word_text) == self.normalize_text(word):
-                            word_count += 1
-                            phrase_end = word_end
-                            # Skip whitespace between words
-                            while i < len(text) and text[i].isspace():
-                                i += 1
-                        else:
-                            break
-                    
-                    # If we matched all words, use the phrase_end
-                    if word_count == len(words):
-                        orig_end = phrase_end
-                    else:
-                        # Fallback: use the normalized position mapping
-                        if norm_end > 0 and norm_end <= len(position_map):
-                            orig_end = position_map[norm_end - 1] + 1
-                else:
-                    # For single-word names, find the end of the word
-                    if orig_start < len(text):
-                        word_end = orig_start
-                        while word_end < len(text) and (text[word_end].isalnum() or text[word_end] in "'-"):
-                            word_end += 1
-                        orig_end = word_end
-                
-                # Extract the original text
-                if orig_start < len(text) and orig_end <= len(text):
-                    original_text = text[orig_start:orig_end]
-                    results.append((orig_start, orig_end, original_text))
-        
-        return results
+        with self.perf.span("normalize and find name", "normalize", chars=len(text)):
+            return find_name_occurrences(NormalizedText(text), name)
     
     def map_normalized_to_original(self, text: str, normalized_pos: int) -> Optional[int]:
         """Map a position in normalized text back to original text position"""
-        # Build normalized text character by character and track positions
-        normalized_chars = []
-        position_map = []  # Maps normalized index to original index
-        
-        for orig_pos, char in enumerate(text):
-            nfd = unicodedata.normalize('NFD', char)
-            normalized_char = ''.join(c for c in nfd if unicodedata.category(c) != 'Mn')
-            normalized_lower = normalized_char.lower()
-            
-            # Map each normalized character position back to original
-            for _ in range(len(normalized_lower)):
-                position_map.append(orig_pos)
-                normalized_chars.append(normalized_lower[_] if _ < len(normalized_lower) else '')
-        
-        if normalized_pos < len(position_map):
-            return position_map[normalized_pos]
+        index = NormalizedText(text)
+        if normalized_pos < len(index):
+            return index.to_original(normalized_pos)
         return None
     
     def apply_masking(self):
@@ -730,6 +1339,7 @@ class WordProcessorApp:
         if not names_input:
             messagebox.showwarning("Warning", "Please enter names/surnames to mask.")
             return
+        self.journal("record_names_input", names_input)
         
         # Parse names (comma-separated)
         names = [name.strip() for name in names_input.split(",") if name.strip()]
@@ -737,183 +1347,237 @@ class WordProcessorApp:
             messagebox.showwarning("Warning", "No valid names found.")
             return
         
-        # Always search in extracted_text to get correct positions
-        # But we need to account for already-masked text when searching
-        # So we'll search in extracted_text and filter out already-masked areas
-        new_changes = []
-        total_occurrences = 0
+        # Find all occurrences in extracted_text (ignoring case and accents), for all names at once,
+        # and mask them in input order (earlier names win overlaps, already masked names are skipped)
+        # IMPORTANT: Always search in extracted_text, never in masked_text
+        # Very large texts are split into paragraph-aligned shards searched in parallel
+        with self.perf.span("mask names", "mask", chars=len(self.extracted_text), names=len(names)) as span:
+            new_occurrence_count = mask_names(self.extracted_text, self.occurrences, names, self.get_profile_id,
+                                              workers=self.masking_workers,
+                                              parallel_threshold=self.parallel_masking_threshold)
+            span["occurrences"] = new_occurrence_count
+        
+        if not new_occurrence_count:
+            return
+        self.update_active_profile()
         
-        # Build a set of already-masked positions to avoid re-masking
-        masked_positions = set()
-        for change in self.current_changes:
-            for pos in range(change['position'], change['position'] + change['length']):
-                masked_positions.add(pos)
+        # Rebuild masked text from extracted_text with all changes
+        self.rebuild_masked_text()
         
-        # Mask each name (handling accents and case)
-        for name in names:
-            # Normalize name for consistent lookup
-            normalized_name = self.normalize_text(name)
-            
-            # Check if this name is already masked
-            if normalized_name in self.name_to_id:
-                # Name already masked, skip
-                continue
-            
-            # Find all occurrences in extracted_text (ignoring case and accents)
-            # IMPORTANT: Always search in extracted_text, never in masked_text
-            occurrences = self.find_name_ignore_case_accent(self.extracted_text, name)
-            
-            # Filter out occurrences that are already masked
-            new_occurrences = []
-            for start_pos, end_pos, original_text in occurrences:
-                # Check if this occurrence overlaps with already-masked text
-                is_masked = any(pos in masked_positions for pos in range(start_pos, end_pos))
-                if not is_masked:
-                    # Additional check: verify the text at this position matches what we expect
-                    actual_text = self.extracted_text[start_pos:end_pos]
-                    # The actual_text might have different case/accents, so we normalize for comparison
-                    normalized_actual = self.normalize_text(actual_text)
-                    normalized_name = self.normalize_text(name)
-                    normalized_original = self.normalize_text(original_text)
-                    
-                    # Only add if it matches (accounting for normalization)
-                    if (normalized_actual == normalized_name or 
-                        normalized_actual == normalized_original or 
-                        actual_text == original_text):
-                        # Double-check: ensure this position doesn't conflict with any existing change
-                        conflicts = False
-                        for existing_change in self.current_changes:
-                            ex_start = existing_change['position']
-                            ex_end = ex_start + existing_change['length']
-                            # Check for any overlap
-                            if not (end_pos <= ex_start or ex_end <= start_pos):
-                                conflicts = True
-                                break
-                        
-                        if not conflicts:
-                            new_occurrences.append((start_pos, end_pos, original_text))
-            
-            if not new_occurrences:
-                continue
-            
-            # Assign a unique ID for this name (based on number of already masked names)
-            name_id = len(self.name_to_id) + 1
-            masked = f"[NAME_{name_id}]"
-            
-            # Store the mapping
-            self.name_to_id[normalized_name] = {
-                'id': name_id,
-                'masked': masked,
-                'original_name': name  # Keep original for display
-            }
-            
-            # Store all occurrences for this name
-            name_occurrence_list = []
-            for start_pos, end_pos, original_text in new_occurrences:
-                change_info = {
-                    'original': original_text,
-                    'masked': masked,
-                    'position': start_pos,
-                    'length': len(original_text),
-                    'normalized_name': normalized_name
-                }
-                new_changes.append(change_info)
-                name_occurrence_list.append(change_info)
-                total_occurrences += 1
-                
-                # Mark these positions as masked
-                for pos in range(start_pos, end_pos):
-                    masked_positions.add(pos)
-            
-            self.name_occurrences[normalized_name] = name_occurrence_list
+        # Update preview
+        self.refresh_masking_preview()
         
-        if not new_changes:
+        # Update changes listbox
+        self.update_changes_listbox()
+        self.show_name_suggestions()
+        self.memory_checkpoint("names masked")
+    
+    def apply_pii_masking(self):
+        """Mask personal identifiers (NIR, phone, email, address, date of birth) found in one scan.
+        Each distinct value gets a typed placeholder such as [PHONE_1]; different spellings
+        of the same value (e.g. "06 12 34 56 78" and "+33 6.12.34.56.78") share it."""
+        if not self.extracted_text:
+            messagebox.showwarning("Warning", "Please extract text first.")
             return
         
-        # Add to changes list
-        self.current_changes.extend(new_changes)
-        self.masking_changes.extend(new_changes)
+        # Occurrences that overlap already-masked text are skipped
+        with self.perf.span("mask PII", "mask", chars=len(self.extracted_text)) as span:
+            span["occurrences"] = mask_pii(self.extracted_text, self.occurrences, self.pii_categories, self.get_profile_id)
+        if not span["occurrences"]:
+            messagebox.showinfo("Info", "No personal identifiers found.")
+            return
+        self.update_active_profile()
         
-        # Rebuild masked text from extracted_text with all changes
         self.rebuild_masked_text()
+        self.refresh_masking_preview()
+        self.update_changes_listbox()
+        self.memory_checkpoint("PII masked")
+    
+    def get_profile_id(self, key: str) -> Optional[int]:
+        """ID given to a name or PII value by the active profile (None if new or no profile)"""
+        if not self.active_profile:
+            return None
+        self.profile_store.reserve_ids(self.active_profile, self.occurrences)
+        return self.profile_store.lookup_id(self.active_profile, key)
+    
+    def update_active_profile(self):
+        """Record newly masked names and values in the active profile"""
+        if not self.active_profile:
+            return
+        try:
+            self.profile_store.update_from_store(self.active_profile, self.occurrences)
+        except Exception as e:
+            print(f"Warning: Could not update masking profile: {e}")
+    
+    def apply_masking_profile(self):
+        """Mask the extracted text with the selected profile (one scan for all its names)"""
+        profile_name = self.profile_var.get().strip()
+        if profile_name not in self.profile_store.profiles:
+            messagebox.showwarning("Warning", "Please select a saved profile.")
+            return
+        if not self.extracted_text:
+            messagebox.showwarning("Warning", "Please extract text first.")
+            return
         
-        # Update preview
-        self.masking_preview_area.delete(1.0, tk.END)
-        self.masking_preview_area.insert(1.0, self.masked_text)
+        self.active_profile = profile_name
+        with self.perf.span("mask profile names", "mask", chars=len(self.extracted_text)) as span:
+            count = self.profile_store.apply(profile_name, self.extracted_text, self.occurrences)
+            span["occurrences"] = count
+        if not count:
+            # Names masked earlier may still have been renumbered to the profile's IDs
+            self.rebuild_masked_text()
+            self.refresh_masking_preview()
+            self.update_changes_listbox()
+            messagebox.showinfo("Info", f"No occurrence of the names in profile '{profile_name}' was found.")
+            return
         
-        # Update changes listbox
+        # PII values seen for the first time get new IDs: keep them for the next documents
+        self.update_active_profile()
+        self.rebuild_masked_text()
+        self.refresh_masking_preview()
         self.update_changes_listbox()
+        self.show_name_suggestions()
+        self.memory_checkpoint("profile applied")
+    
+    def save_masking_profile(self):
+        """Save the names and values masked in this document to a profile (new or existing)"""
+        profile_name = self.profile_var.get().strip()
+        if not profile_name:
+            profile_name = simpledialog.askstring("Save profile", "Profile name (e.g. the case reference):")
+            if not profile_name or not profile_name.strip():
+                return
+            profile_name = profile_name.strip()
+        if not len(self.occurrences.name_index):
+            messagebox.showwarning("Warning", "Nothing is masked yet.")
+            return
         
+        # The profile scans the PII categories that were masked in this document
+        masked_categories = {self.occurrences.names[slot]['category'] for slot in self.occurrences.slots_by_id()}
+        try:
+            self.profile_store.update_from_store(profile_name, self.occurrences,
+                                                 [c for c in self.pii_categories if c in masked_categories])
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save profile: {str(e)}")
+            return
+        self.active_profile = profile_name
+        self.profile_var.set(profile_name)
+        self.profile_combo['values'] = self.profile_store.profile_names()
+        # Names whose ID the profile already gave to someone else were renumbered
+        self.rebuild_masked_text()
+        self.refresh_masking_preview()
+        self.update_changes_listbox()
     
     def rebuild_masked_text(self):
         """Rebuild masked text from extracted_text using all current changes"""
         # Always start from extracted_text to ensure clean rebuild
-        self.masked_text = self.extracted_text
-        
-        # Sort changes by position (reverse order to avoid position shifts)
-        sorted_changes = sorted(self.current_changes, key=lambda x: x['position'], reverse=True)
+        # Occurrences are stored sorted and non-overlapping, so this is a single pass
+        # that only records pieces (no string copy of the text)
+        with self.perf.span("rebuild masked text", "mask", chars=len(self.extracted_text)):
+            self.masked_pieces = PieceTable.from_replacements(self.extracted_text, self.occurrences.replacements())
+        with self.perf.span("journal session", "mask"):
+            self.journal_session()
+    
+    def journal(self, method: str, *args):
+        """Call a SessionJournal recording method; journaling problems never interrupt the user"""
+        if self.session_journal is None:
+            return
+        try:
+            getattr(self.session_journal, method)(*args)
+        except Exception as e:
+            print(f"Warning: Could not journal the session: {e}")
+    
+    def journal_session(self):
+        """Journal what changed in the extraction and the masking (called on every rebuild)"""
+        if self.session_journal is None:
+            return
+        document = self.document
+        state = self.session_journal.state
+        # The edited text is compared by identity: it is only rewritten when it was replaced
+        if (document.edited_text is not self.journaled_edited_text
+                or state["view_start"] != document.view_start or state["view_end"] != document.view_end):
+            self.journal("record_extraction", document.view_start, document.view_end, document.edited_text)
+            self.journaled_edited_text = document.edited_text
+        self.journal("record_masking", self.occurrences)
+    
+    def restore_session(self):
+        """Reopen the documents journaled by the previous session, with their extraction,
+        masking and conversation; start with an empty document if there are none"""
+        for doc_id in self.workspace.saved_document_ids():
+            state = self.workspace.open(doc_id)
+            if not self.restore_document():
+                # A journal without a document (e.g. left by an older version): forget it
+                self.workspace.discard(state)
+        if not self.workspace.documents:
+            self.workspace.open()
+        self.workspace.select(0)
+    
+    def restore_document(self) -> bool:
+        """Restore the active document from its session journal (widgets are filled later).
+        Returns False when the journal holds no document"""
+        if self.session_journal is None:
+            return True  # Unreadable journal: the warning was printed when opening it
+        try:
+            state = self.session_journal.load()
+            source = self.session_journal.get_blob("source")
+            if source is None:
+                return False
+            self.document.load(source)
+            self.document.extract(state["view_start"], state["view_end"])
+            if state["edited"]:
+                self.document.set_extracted(self.session_journal.get_blob("edited") or "")
+            self.journaled_edited_text = self.document.edited_text
+            restore_occurrences(self.occurrences, state["masking"])
+        except Exception as e:
+            print(f"Warning: Could not restore the previous session: {e}")
+            self.document.load("")
+            self.occurrences.clear()
+            return True
         
-        # Verify no overlapping changes and validate positions
-        for i, change1 in enumerate(sorted_changes):
-            pos1 = change1['position']
-            len1 = change1['length']
-            
-            # Check bounds
-            if pos1 < 0 or pos1 + len1 > len(self.extracted_text):
-                print(f"Warning: Change position out of bounds: {change1}")
-                continue
-            
-            # Check for overlaps with other changes
-            for change2 in sorted_changes[i+1:]:
-                pos2 = change2['position']
-                len2 = change2['length']
-                # Check if ranges overlap
-                if not (pos1 + len1 <= pos2 or pos2 + len2 <= pos1):
-                    print(f"Warning: Overlapping changes detected: {change1} and {change2}")
-        
-        # Apply changes in reverse order (from end to beginning)
-        for change in sorted_changes:
-            pos = change['position']
-            length = change['length']
-            
-            # Skip if out of bounds
-            if pos < 0 or pos + length > len(self.masked_text):
-                continue
-            
-            # Verify we're replacing the expected original text
-            expected_original = self.extracted_text[pos:pos+length]
-            current_text = self.masked_text[pos:pos+length]
-            
-            # Only replace if we're still at the original text (not already masked)
-            # This prevents double-replacement
-            if current_text == expected_original:
-                self.masked_text = (
-                    self.masked_text[:pos] +
-                    change['masked'] +
-                    self.masked_text[pos + length:]
-                )
+        self.rebuild_masked_text()
+        self.masking_preview_stale = True
+        self.conversation_history = list(state["conversation"])
+        self.is_first_message = not self.conversation_history
+        view = self.workspace.active.view
+        view["file_path"] = state["source_path"] or ""
+        view["names"] = state["names_input"]
+        if self.conversation_history and self.conversation_history[-1]["role"] == "assistant":
+            view["result"] = self.format_result_text(
+                self.get_placeholder_restorer().restore(self.conversation_history[-1]["content"]))
+        return True
+    
+    def on_close(self):
+        """Compact the session journals so the next launch reads one snapshot per document"""
+        if self.api_busy:
+            # The answer is stopped from the streaming callbacks, which close the window once it has
+            # (destroying it here would leave them updating widgets that no longer exist)
+            if messagebox.askyesno("Confirm", "An answer is still arriving. Stop it and quit?\n"
+                                              "The part received so far can be resumed at the next launch."):
+                self.close_requested = True
+            return
+        try:
+            self.workspace.compact_all()
+        except Exception as e:
+            print(f"Warning: Could not save the session: {e}")
+        if self.memory_profiler is not None:
+            self.save_memory_report()
+        self.root.destroy()
     
     def update_changes_listbox(self):
         """Update the changes listbox with current changes - one entry per name"""
-        self.changes_listbox.delete(0, tk.END)
-        
-        # Group changes by normalized name
-        name_groups = {}
-        for change in self.current_changes:
-            norm_name = change.get('normalized_name', '')
-            if norm_name not in name_groups:
-                name_groups[norm_name] = []
-            name_groups[norm_name].append(change)
-        
-        # Display one entry per name with occurrence count
-        for norm_name, changes in sorted(name_groups.items(), key=lambda x: self.name_to_id.get(x[0], {}).get('id', 0)):
-            if norm_name in self.name_to_id:
-                name_info = self.name_to_id[norm_name]
-                original_name = name_info['original_name']
-                masked = name_info['masked']
-                count = len(changes)
-                display_text = f"{original_name} → {masked} ({count} occurrence{'s' if count != 1 else ''})"
+        with self.perf.span("update changes list", "widget", names=len(self.occurrences.name_index)):
+            self.changes_listbox.delete(0, tk.END)
+            
+            # Display one entry per name with occurrence count
+            counts = self.occurrences.counts()
+            self.changes_listbox_slots = []
+            for slot in self.occurrences.slots_by_id():
+                name_info = self.occurrences.names[slot]
+                count = counts.get(slot, 0)
+                if not count:
+                    continue
+                display_text = f"{name_info['original_name']} → {name_info['masked']} ({count} occurrence{'s' if count != 1 else ''})"
                 self.changes_listbox.insert(tk.END, display_text)
+                self.changes_listbox_slots.append(slot)
     
     def undo_change(self, event=None):
         """Undo a change when double-clicked"""
@@ -922,71 +1586,43 @@ class WordProcessorApp:
             self.undo_selected_change()
     
     def undo_selected_change(self):
-        """Undo the selected change - removes all occurrences of the selected name"""
+        """Undo the selected changes - removes all occurrences of the selected names"""
         selection = self.changes_listbox.curselection()
         if not selection:
             messagebox.showwarning("Warning", "Please select a change to undo.")
             return
         
-        # Get the selected index
-        display_index = selection[0]
-        
-        # Get the normalized name from the listbox entry
-        # Build the same grouping as in update_changes_listbox
-        name_groups = {}
-        for change in self.current_changes:
-            norm_name = change.get('normalized_name', '')
-            if norm_name not in name_groups:
-                name_groups[norm_name] = []
-            name_groups[norm_name].append(change)
-        
-        # Get the normalized name at the selected index
-        sorted_names = sorted(name_groups.items(), key=lambda x: self.name_to_id.get(x[0], {}).get('id', 0))
-        if display_index >= len(sorted_names):
+        # Get the selected names (several can be selected with Shift/Ctrl)
+        slots = [self.changes_listbox_slots[display_index] for display_index in selection
+                 if display_index < len(self.changes_listbox_slots)]
+        if not slots:
             return
         
-        norm_name_to_undo, changes_to_remove = sorted_names[display_index]
-        
-        # Remove all occurrences of this name from current_changes
-        self.current_changes = [c for c in self.current_changes if c.get('normalized_name') != norm_name_to_undo]
-        self.masking_changes = [c for c in self.masking_changes if c.get('normalized_name') != norm_name_to_undo]
-        
-        # Remove from name mappings
-        if norm_name_to_undo in self.name_to_id:
-            del self.name_to_id[norm_name_to_undo]
-        if norm_name_to_undo in self.name_occurrences:
-            del self.name_occurrences[norm_name_to_undo]
-        
-        # Reassign IDs to be sequential
-        sorted_names = sorted(self.name_to_id.items(), key=lambda x: x[1]['id'])
-        for idx, (norm_name, name_info) in enumerate(sorted_names, 1):
-            old_id = name_info['id']
-            new_id = idx
-            new_masked = f"[NAME_{new_id}]"
-            
-            # Update the ID and masked value
-            name_info['id'] = new_id
-            name_info['masked'] = new_masked
+        # Remove the names and all of their occurrences in one pass
+        with self.perf.span("undo masked name", "mask", names=len(slots)):
+            self.occurrences.remove_names(slots)
             
-            # Update all changes for this name
-            for change in self.current_changes:
-                if change.get('normalized_name') == norm_name:
-                    change['masked'] = new_masked
+            # Reassign IDs to be sequential
+            if not self.active_profile:
+                # With a profile, IDs stay those of the case so documents keep matching
+                self.occurrences.renumber()
         
         # Rebuild masked text from scratch with remaining changes
         self.rebuild_masked_text()
         
         # Update preview
-        self.masking_preview_area.delete(1.0, tk.END)
-        self.masking_preview_area.insert(1.0, self.masked_text)
+        self.refresh_masking_preview()
         
         # Update changes listbox
         self.update_changes_listbox()
-        
+        self.show_name_suggestions()
+        self.memory_checkpoint("masked name undone")
     
     def send_to_api(self):
         """Send masked text to Claude API (initial request)"""
-        if not self.masked_text:
+        if self.refuse_while_busy("sending a new request"):
+            return
+        if not len(self.masked_pieces):
             messagebox.showwarning("Warning", "Please extract and mask text first.")
             return
         
@@ -995,23 +1631,76 @@ class WordProcessorApp:
             return
         
         # Get instructions from text area
-        instructions = self.instructions_text_area.get(1.0, tk.END).strip()
-        if not instructions:
-            instructions = "Fais un récit chronologique de ce rapport d'expertise medicale. Utilise le discour rapporté. Garde une connotation technique. Fais un récit continu."
+        instructions = self.get_instructions_text()
         
         # Clear conversation history for new request
         self.conversation_history = []
+        self.journal("record_chat_reset")
         self.is_first_message = True
         
         # Prepare the initial prompt
         prompt = f"{instructions}\n\nText:\n{self.masked_text}"
+        self.memory_checkpoint("prompt built", prompt)
         
         # Send the message
         self._send_api_message(prompt, is_first=True)
     
+    def get_masking_map(self) -> dict:
+        """Return {placeholder: original text} for the current masking"""
+        return dict(self.get_placeholder_restorer().table)
+    
+    def get_instructions_text(self) -> str:
+        """Return the instructions from the text area, or the default instruction"""
+        instructions = self.instructions_text_area.get(1.0, tk.END).strip()
+        if not instructions:
+            instructions = DEFAULT_INSTRUCTION
+        return instructions
+    
+    def add_to_batch(self):
+        """Add the current masked document and its masking map to the pending batch"""
+        if not len(self.masked_pieces):
+            messagebox.showwarning("Warning", "Please extract and mask text first.")
+            return
+        
+        prompt = f"{self.get_instructions_text()}\n\nText:\n{self.masked_text}"
+        try:
+            count = self.batch_manager.add_item(
+                messages=[{"role": "user", "content": prompt}],
+                masking_map=self.get_masking_map(),
+                source_path=self.file_path_var.get() or None
+            )
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to add document to batch: {str(e)}")
+            return
+        messagebox.showinfo("Batch", f"Document added. The pending batch now holds {count} document(s).")
+    
+    def submit_batch(self):
+        """Submit the pending batch to the selected model's batch API"""
+        if not self.selected_model:
+            messagebox.showerror("Error", "No model selected. Please select a model from the dropdown.")
+            return
+        
+        model_display = self.llm_registry.get_model_display_name(self.selected_model)
+        try:
+            job = self.batch_manager.submit_draft(self.selected_model, max_tokens=64000)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to submit batch to {model_display}: {str(e)}")
+            return
+        messagebox.showinfo("Batch", f"Submitted {len(job['items'])} document(s) to {model_display}.\n\nUse 'Check batches' later to collect the results.")
+    
+    def check_batches(self):
+        """Poll submitted batches and write unmasked results for those that have ended"""
+        lines = self.batch_manager.check_all()
+        if not lines:
+            messagebox.showinfo("Batch", "No submitted batches.")
+            return
+        messagebox.showinfo("Batch", "\n".join(lines))
+    
     def send_chat_message(self):
         """Send a follow-up message in the chat conversation"""
-        if not self.masked_text:
+        if self.refuse_while_busy("sending a message"):
+            return
+        if not len(self.masked_pieces):
             messagebox.showwarning("Warning", "Please extract and mask text first.")
             return
         
@@ -1029,119 +1718,265 @@ class WordProcessorApp:
         self.chat_input.delete(0, tk.END)
         
         # Clear final text area before new chat request
-        self.final_text_area.delete(1.0, tk.END)
+        self.final_text_area.clear()
         
         # Send the message
         self._send_api_message(chat_message, is_first=False)
     
-    def _send_api_message(self, user_message: str, is_first: bool = False):
-        """Internal method to send message to LLM API and handle response"""
+    def _send_api_message(self, user_message: str, is_first: bool = False, resume: bool = False):
+        """Internal method to send message to LLM API and handle response.
+        With resume=True, continues the answer that was interrupted mid-stream."""
+        # The UI stays responsive while streaming: the handlers that would change the
+        # document or its conversation refuse meanwhile (see refuse_while_busy)
+        self.api_busy = True
         try:
+            # Let "Auto" pick the model for this request (a resumed answer keeps its model)
+            if self.auto_model_enabled and not resume:
+                self.choose_auto_model(user_message, is_first)
+            elif not self.auto_model_enabled:
+                self.auto_model_info_var.set("")  # Drops the backup note of the previous answer
+            
             # Validate model selection
             if not self.selected_model:
                 messagebox.showerror("Error", "No model selected. Please select a model from the dropdown.")
                 return
             
+            model = self.resume_state['model'] if resume else self.selected_model
+            instruction_label = self.current_instruction_label  # The combobox stays live while streaming
+            
             # Get provider for selected model
-            provider = self.llm_registry.get_provider_for_model(self.selected_model)
+            provider = self.llm_registry.get_provider_for_model(model)
             if not provider:
-                messagebox.showerror("Error", f"No provider found for model: {self.selected_model}")
+                messagebox.showerror("Error", f"No provider found for model: {model}")
                 return
             
-            # Clear final text area and show processing message
-            self.final_text_area.delete(1.0, tk.END)
-            self.final_text_area.insert(tk.END, "Processing... Please wait.")
-            self.root.update()
+            if resume:
+                # Keep the partial answer on screen and continue from it
+                partial_text = self.resume_state['partial']
+                messages = provider.build_continuation_messages(self.conversation_history, partial_text)
+                self.resume_state = None
+                self.resume_button.config(state=tk.DISABLED)
+            else:
+                # A new request discards any interrupted answer
+                self.resume_state = None
+                self.resume_button.config(state=tk.DISABLED)
+                
+                # Clear final text area and show processing message
+                self.final_text_area.set_text("Processing... Please wait.")
+                self.root.update()
+                
+                # Add user message to conversation history
+                self.conversation_history.append({
+                    "role": "user",
+                    "content": user_message
+                })
+                self.journal("record_chat", self.conversation_history[-1])
+                partial_text = ""
+                messages = self.conversation_history
             
-            # Add user message to conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_message
-            })
+            # Checkpoint the (masked) stream to disk as it arrives, in this document's checkpoint
+            stream_checkpoint = self.stream_checkpoint
+            stream_checkpoint.start(model, self.conversation_history, partial=partial_text)
             
             # Track accumulated text for formatting
-            accumulated_text = ""
-            is_first_chunk = True
+            accumulated_text = partial_text
+            continuation_text = ""
+            
+            # Masked names are restored chunk by chunk in a single pass
+            restorer = self.get_placeholder_restorer()
+            stream_restorer = restorer.stream()
+            restored_partial = restorer.restore(partial_text)
+            restored_text = ""
+            
+            # Timings: time to first token, then the render time of each chunk
+            request_started = time.perf_counter()
+            chunk_count = 0
             
             def stream_callback(text_chunk):
                 """Callback function to handle streaming text chunks"""
-                nonlocal accumulated_text, is_first_chunk
+                nonlocal accumulated_text, continuation_text, restored_text, chunk_count
                 
                 if not text_chunk:
                     return
+                chunk_started = time.perf_counter()
+                if not chunk_count:
+                    self.perf.add("time to first token", "stream", request_started,
+                                  chunk_started - request_started, {"model": model})
+                    served_by = self.llm_router.last_model
+                    if served_by and served_by != model:
+                        # The router hedged or failed over: say which model is answering
+                        self.auto_model_info_var.set(f"→ answered by backup {self.get_model_display_label(served_by)} "
+                                                     f"({self.get_model_display_label(model)} was slow or failed)")
+                chunk_count += 1
                 
-                # Add chunk to accumulated text
-                accumulated_text += text_chunk
-                
-                # Restore masked names in accumulated text
-                restored_text = accumulated_text
-                for change in reversed(self.current_changes):
-                    restored_text = restored_text.replace(change['masked'], change['original'])
-                
-                # Format text with indentation
-                # Split into paragraphs and indent
-                paragraphs = restored_text.split('\n')
-                formatted_paragraphs = []
-                for para in paragraphs:
-                    if para.strip():  # Only indent non-empty paragraphs
-                        formatted_paragraphs.append('\t' + para)
-                    else:
-                        formatted_paragraphs.append(para)  # Keep empty lines as-is
-                formatted_text = '\n'.join(formatted_paragraphs)
-                
-                # Update UI with formatted text
-                if is_first_chunk:
-                    # Replace "Processing..." message
-                    self.final_text_area.delete(1.0, tk.END)
-                    is_first_chunk = False
+                # Add chunk to accumulated text (a resumed stream is joined to the partial answer)
+                if partial_text:
+                    continuation_text += text_chunk
+                    accumulated_text = join_continuation(partial_text, continuation_text)
                 else:
-                    # Clear and update with full accumulated text
-                    self.final_text_area.delete(1.0, tk.END)
+                    accumulated_text += text_chunk
+                stream_checkpoint.append(text_chunk)
                 
-                self.final_text_area.insert(1.0, formatted_text)
-                self.final_text_area.see(tk.END)
-                self.root.update()  # Update UI to show incremental text
+                # Restore masked names in the new chunk only
+                restored_text += stream_restorer.feed(text_chunk)
+                display_text = restored_text
+                if restored_partial:
+                    display_text = join_continuation(restored_partial, restored_text)
+                
+                # Replaces the "Processing..." message on the first chunk
+                self.display_result_text(display_text)
+                wait_callback()  # Update UI to show incremental text
+                self.perf.add("render chunk", "stream", chunk_started, time.perf_counter() - chunk_started,
+                              {"chunk": chunk_count, "chars": len(text_chunk), "shown_chars": len(display_text)})
+            
+            def wait_callback():
+                """Keep the window responsive; stop the answer if the window was closed meanwhile"""
+                self.root.update()
+                if self.close_requested:
+                    raise AnswerStopped("the window was closed")
             
             # Call LLM API with streaming enabled
-            response_text = provider.send_message(
-                messages=self.conversation_history,
-                model=self.selected_model,
-                max_tokens=64000,
-                stream=True,
-                stream_callback=stream_callback
-            )
+            # The router hedges to a backup model if the first token is late
+            # and fails over if the selected provider errors. A resumed answer
+            # must stay on its model: the continuation messages are in the format
+            # of its provider (e.g. an assistant prefix that only Claude continues)
+            try:
+                response_text = self.llm_router.send_message(
+                    messages=messages,
+                    model=model,
+                    max_tokens=64000,
+                    stream=True,
+                    stream_callback=stream_callback,
+                    wait_callback=wait_callback,
+                    allow_backup=not resume
+                )
+            except Exception:
+                # Keep what was received so far so the answer can be resumed
+                if accumulated_text:
+                    self.resume_state = {
+                        'model': self.llm_router.last_model or model,
+                        'partial': accumulated_text
+                    }
+                    self.resume_button.config(state=tk.NORMAL)
+                stream_checkpoint.close()
+                raise
+            self.perf.add("stream answer", "stream", request_started, time.perf_counter() - request_started,
+                          {"model": self.llm_router.last_model or model, "chunks": chunk_count,
+                           "chars": len(response_text)})
+            # Show any placeholder text still held back at the end of the stream
+            if stream_restorer.pending:
+                restored_text += stream_restorer.flush()
+                display_text = restored_text
+                if restored_partial:
+                    display_text = join_continuation(restored_partial, restored_text)
+                self.display_result_text(display_text)
+            
+            if partial_text:
+                response_text = join_continuation(partial_text, response_text)
             
             # Add assistant response to conversation history
             self.conversation_history.append({
                 "role": "assistant",
                 "content": response_text
             })
+            self.journal("record_chat", self.conversation_history[-1])
+            stream_checkpoint.clear()
+            if is_first:
+                # Teaches "Auto" how long this instruction's answers are (see AutoModelSelector)
+                self.latency_telemetry.record_output_ratio(instruction_label, len(user_message), len(response_text))
             
             self.is_first_message = False
-            model_display = self.llm_registry.get_model_display_name(self.selected_model)
+            model_display = self.llm_registry.get_model_display_name(model)
+            self.memory_checkpoint("answer received")
             
+        except AnswerStopped:
+            pass  # The window is closing; the checkpoint keeps what was received
         except Exception as e:
             model_display = self.llm_registry.get_model_display_name(self.selected_model) if self.selected_model else "LLM"
             messagebox.showerror("Error", f"Failed to process message with {model_display}: {str(e)}")
             # Remove processing message and show error
-            content = self.final_text_area.get(1.0, tk.END)
+            content = self.final_text_area.get_text()
             if "Processing... Please wait." in content:
-                self.final_text_area.delete(1.0, tk.END)
-            self.final_text_area.insert(1.0, f"Error: {str(e)}")
+                self.final_text_area.clear()
+            if self.resume_state:
+                # Partial answer stays on screen; note the interruption after it
+                self.final_text_area.append(f"\n\n[Interrupted: {str(e)} - press Resume to continue]")
+            else:
+                self.final_text_area.set_text(f"Error: {str(e)}" + self.final_text_area.get_text())
+        finally:
+            self.api_busy = False
+            if self.close_requested:
+                self.on_close()
+    
+    def get_placeholder_restorer(self) -> PlaceholderRestorer:
+        """Return a restorer mapping each placeholder to its name's canonical spelling"""
+        return PlaceholderRestorer.from_store(self.occurrences, self.extracted_text)
+    
+    def display_result_text(self, restored_text: str):
+        """Show the (already restored) result with indented paragraphs"""
+        # Clear and update with full accumulated text
+        with self.perf.span("insert result", "widget", chars=len(restored_text)):
+            # Only the end of a long answer is put in the widget while it streams
+            formatted_text = self.format_result_text(restored_text)
+            self.final_text_area.set_text(formatted_text, top=len(formatted_text))
+            self.final_text_area.see_end()
+    
+    def format_result_text(self, restored_text: str) -> str:
+        """Indent the paragraphs of a result"""
+        # Format text with indentation
+        # Split into paragraphs and indent
+        paragraphs = restored_text.split('\n')
+        formatted_paragraphs = []
+        for para in paragraphs:
+            if para.strip():  # Only indent non-empty paragraphs
+                formatted_paragraphs.append('\t' + para)
+            else:
+                formatted_paragraphs.append(para)  # Keep empty lines as-is
+        return '\n'.join(formatted_paragraphs)
+    
+    def resume_interrupted_answer(self):
+        """Continue an answer whose stream was interrupted"""
+        if self.refuse_while_busy("resuming"):
+            return
+        if not self.resume_state:
+            messagebox.showwarning("Warning", "There is no interrupted answer to resume.")
+            return
+        self._send_api_message("", resume=True)
+    
+    def load_stream_checkpoints(self):
+        """Offer to resume the answers left over from a previous run, each in its own document
+        (shown when the document is)"""
+        active = self.workspace.active
+        for state in self.workspace.documents:
+            checkpoint = state.stream_checkpoint.load()
+            if not checkpoint:
+                continue
+            # The per-document attributes read the active document: restore with its masking
+            self.workspace.active = state
+            self.conversation_history = checkpoint['messages']
+            self.resume_state = {'model': checkpoint['model'], 'partial': checkpoint['partial']}
+            restored = self.get_placeholder_restorer().restore(checkpoint['partial'])
+            state.view["result"] = (self.format_result_text(restored)
+                                    + "\n\n[Interrupted answer from a previous session - press Resume to continue]")
+        self.workspace.active = active
     
     def clear_conversation_history(self):
         """Clear the conversation history"""
-        if not self.conversation_history:
+        if not self.conversation_history or self.refuse_while_busy("clearing the conversation"):
             return
         
         #if messagebox.askyesno("Confirm", "CLEAR ?"):
         self.conversation_history = []
+        self.journal("record_chat_reset")
         self.is_first_message = True
-        self.final_text_area.delete(1.0, tk.END)
+        self.resume_state = None
+        self.resume_button.config(state=tk.DISABLED)
+        self.stream_checkpoint.clear()
+        self.final_text_area.clear()
     
     def copy_final_text(self):
         """Copy final text to clipboard"""
-        final_text = self.final_text_area.get(1.0, tk.END).strip()
+        final_text = self.final_text_area.get_text().strip()
         if not final_text:
             messagebox.showwarning("Warning", "No text to copy.")
             return
@@ -1150,48 +1985,18 @@ class WordProcessorApp:
         self.root.clipboard_append(final_text)
     
     def load_chat_messages(self):
-        """Load saved chat messages from chat.txt file"""
+        """Import chat.txt into the template store once, and make sure one chat message exists"""
         try:
-            if os.path.exists(self.chat_file):
-                with open(self.chat_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        # Parse format: "label" :: "text"
-                        if ' :: ' in line:
-                            parts = line.split(' :: ', 1)
-                            if len(parts) == 2:
-                                label = parts[0].strip().strip('"')
-                                text = parts[1].strip().strip('"')
-                                # Handle escaped quotes and newlines
-                                text = text.replace('\\n', '\n').replace('\\"', '"')
-                                self.chat_dict[label] = text
-            else:
+            self.template_store.import_legacy_file(CHAT, self.chat_file)
+            if not self.template_store.count(CHAT):
                 # Initialize with default "basic" chat message
-                self.chat_dict = {"basic": ""}
-                self.save_chat_messages()
+                self.template_store.put(CHAT, "basic", "")
         except Exception as e:
             print(f"Error loading chat messages: {e}")
-            # Initialize with default "basic" chat message
-            self.chat_dict = {"basic": ""}
-            self.save_chat_messages()
-    
-    def save_chat_messages(self):
-        """Save chat messages to chat.txt file"""
-        try:
-            with open(self.chat_file, 'w', encoding='utf-8') as f:
-                for label, text in sorted(self.chat_dict.items()):
-                    # Escape quotes and newlines for storage
-                    escaped_text = text.replace('"', '\\"').replace('\n', '\\n')
-                    f.write(f'"{label}" :: "{escaped_text}"\n')
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save chat messages: {str(e)}")
     
     def update_chat_combo(self):
         """Update the chat label combobox with current labels"""
-        labels = sorted(self.chat_dict.keys())
+        labels = self.template_store.labels(CHAT)
         self.chat_label_combo['values'] = labels
         if labels:
             # Set current label if available
@@ -1204,8 +2009,8 @@ class WordProcessorApp:
     def on_chat_label_selected(self, event=None):
         """Handle chat label selection from combobox"""
         selected_label = self.chat_label_var.get()
-        if selected_label and selected_label in self.chat_dict:
-            chat_text = self.chat_dict[selected_label]
+        chat_text = self.template_store.get(CHAT, selected_label) if selected_label else None
+        if chat_text is not None:
             self.chat_input.delete(0, tk.END)
             self.chat_input.insert(0, chat_text)
             self.current_chat_label = selected_label
@@ -1220,9 +2025,12 @@ class WordProcessorApp:
         # Get current text from chat input
         chat_text = self.chat_input.get().strip()
         
-        # Save to dictionary
-        self.chat_dict[selected_label] = chat_text
-        self.save_chat_messages()
+        # Save this template only (single-row update)
+        try:
+            self.template_store.put(CHAT, selected_label, chat_text)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save chat messages: {str(e)}")
+            return
         self.current_chat_label = selected_label
     
     def create_new_chat_message(self):
@@ -1234,13 +2042,16 @@ class WordProcessorApp:
         new_label = new_label.strip()
         
         # Check if label already exists
-        if new_label in self.chat_dict:
+        if self.template_store.exists(CHAT, new_label):
             messagebox.showwarning("Warning", f"Label '{new_label}' already exists.")
             return
         
         # Create new chat message with blank text
-        self.chat_dict[new_label] = ""
-        self.save_chat_messages()
+        try:
+            self.template_store.put(CHAT, new_label, "")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save chat messages: {str(e)}")
+            return
         
         # Update combo and select new label
         self.update_chat_combo()
@@ -1256,7 +2067,7 @@ class WordProcessorApp:
             return
         
         # Prevent deleting "basic" if it's the only one
-        if selected_label == "basic" and len(self.chat_dict) == 1:
+        if selected_label == "basic" and self.template_store.count(CHAT) == 1:
             messagebox.showwarning("Warning", "Cannot delete the 'basic' chat message. At least one message must exist.")
             return
         
@@ -1265,59 +2076,66 @@ class WordProcessorApp:
             return
         
         # Delete the chat message
-        del self.chat_dict[selected_label]
-        self.save_chat_messages()
+        try:
+            self.template_store.delete(CHAT, selected_label)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save chat messages: {str(e)}")
+            return
         
         # Update combo and select another label
         self.update_chat_combo()
-        if self.chat_dict:
+        labels = self.template_store.labels(CHAT)
+        if labels:
             # Select first available label
-            first_label = sorted(self.chat_dict.keys())[0]
+            first_label = labels[0]
             self.chat_label_var.set(first_label)
             self.on_chat_label_selected()
         
     
     def load_instructions(self):
-        """Load saved instructions from instructions.txt file"""
+        """Import instructions.txt into the template store once, and make sure one instruction exists"""
         try:
-            if os.path.exists(self.instructions_file):
-                with open(self.instructions_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        # Parse format: "label" :: "text"
-                        if ' :: ' in line:
-                            parts = line.split(' :: ', 1)
-                            if len(parts) == 2:
-                                label = parts[0].strip().strip('"')
-                                text = parts[1].strip().strip('"')
-                                # Handle escaped quotes and newlines
-                                text = text.replace('\\n', '\n').replace('\\"', '"')
-                                self.instructions_dict[label] = text
-            else:
+            self.template_store.import_legacy_file(INSTRUCTION, self.instructions_file)
+            if not self.template_store.count(INSTRUCTION):
                 # Initialize with default "basic" instruction
                 default_text = "Fais un récit chronologique de ce rapport d'expertise medicale. Utilise le discour rapporté. Garde une connotation technique. Fais un récit continu."
-                self.instructions_dict = {"basic": default_text}
-                self.save_instructions()
+                self.template_store.put(INSTRUCTION, "basic", default_text)
         except Exception as e:
             print(f"Error loading instructions: {e}")
-            # Initialize with default "basic" instruction
-            default_text = "Fais un récit chronologique de ce rapport d'expertise medicale. Utilise le discour rapporté. Garde une connotation technique. Fais un récit continu."
-            self.instructions_dict = {"basic": default_text}
-            self.save_instructions()
     
-    def save_instructions(self):
-        """Save instructions to instructions.txt file"""
-        try:
-            with open(self.instructions_file, 'w', encoding='utf-8') as f:
-                for label, text in sorted(self.instructions_dict.items()):
-                    # Escape quotes and newlines for storage
-                    escaped_text = text.replace('"', '\\"').replace('\n', '\\n')
-                    f.write(f'"{label}" :: "{escaped_text}"\n')
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save instructions: {str(e)}")
+    def search_templates(self):
+        """Full-text search across instruction and chat templates; selecting a result loads it"""
+        query = simpledialog.askstring("Search templates", "Words to search in labels and texts:")
+        if not query or not query.strip():
+            return
+        results = self.template_store.search(query)
+        if not results:
+            messagebox.showinfo("Search templates", f"No template matches '{query}'.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Search templates")
+        dialog.transient(self.root)
+        results_listbox = tk.Listbox(dialog, width=60, height=min(15, len(results)))
+        results_listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for kind, label in results:
+            results_listbox.insert(tk.END, f"{'Instruction' if kind == INSTRUCTION else 'Chat message'}: {label}")
+        
+        def open_selected(event=None):
+            selection = results_listbox.curselection()
+            if not selection:
+                return
+            kind, label = results[selection[0]]
+            dialog.destroy()
+            if kind == INSTRUCTION:
+                self.instruction_label_var.set(label)
+                self.on_instruction_label_selected()
+            else:
+                self.chat_label_var.set(label)
+                self.on_chat_label_selected()
+        
+        results_listbox.bind('<Double-Button-1>', open_selected)
+        ttk.Button(dialog, text="Open", command=open_selected).pack(pady=(0, 10))
     
     def update_model_combo(self):
         """Update the model selection dropdown with available models"""
@@ -1340,11 +2158,14 @@ class WordProcessorApp:
             display_values.append(display_name)
             model_display_map[display_name] = model
         
-        self.model_combo['values'] = display_values
+        # "Auto" entry lets the app choose the model per request
+        self.model_combo['values'] = [self.auto_model_label] + display_values
         self.model_display_map = model_display_map  # Store mapping for selection
         
         # Set default selection if not already set
-        if self.selected_model and self.selected_model in available_models:
+        if self.auto_model_enabled:
+            self.model_var.set(self.auto_model_label)
+        elif self.selected_model and self.selected_model in available_models:
             # Use custom display name if configured
             if self.selected_model in self.model_display_names_custom:
                 display_name = self.model_display_names_custom[self.selected_model]
@@ -1366,13 +2187,39 @@ class WordProcessorApp:
         if not selection:
             return
         
+        if selection == self.auto_model_label:
+            self.auto_model_enabled = True
+            self.auto_model_info_var.set("(chosen on send)")
+            return
+        
         # Get model ID from display name mapping
         if hasattr(self, 'model_display_map') and selection in self.model_display_map:
+            self.auto_model_enabled = False
+            self.auto_model_info_var.set("")
             self.selected_model = self.model_display_map[selection]
     
+    def get_model_display_label(self, model: str) -> str:
+        """Return the dropdown label for a model (custom name if configured)"""
+        if model in self.model_display_names_custom:
+            return self.model_display_names_custom[model]
+        return self.llm_registry.get_model_display_name(model)
+    
+    def choose_auto_model(self, user_message: str, is_first: bool):
+        """Pick the model for this request when "Auto" is selected and show the reason"""
+        prompt_chars = sum(len(msg["content"]) for msg in self.conversation_history) + len(user_message)
+        model, reason = self.auto_model_selector.choose(
+            prompt_chars=prompt_chars,
+            last_message_chars=len(user_message),
+            is_first=is_first,
+            instruction_label=self.current_instruction_label
+        )
+        if model:
+            self.selected_model = model
+            self.auto_model_info_var.set(f"→ {self.get_model_display_label(model)}: {reason}")
+    
     def update_instruction_combo(self):
         """Update the instruction label combobox with current labels"""
-        labels = sorted(self.instructions_dict.keys())
+        labels = self.template_store.labels(INSTRUCTION)
         self.instruction_label_combo['values'] = labels
         if labels:
             # Set current label if available
@@ -1385,8 +2232,8 @@ class WordProcessorApp:
     def on_instruction_label_selected(self, event=None):
         """Handle instruction label selection from combobox"""
         selected_label = self.instruction_label_var.get()
-        if selected_label and selected_label in self.instructions_dict:
-            instruction_text = self.instructions_dict[selected_label]
+        instruction_text = self.template_store.get(INSTRUCTION, selected_label) if selected_label else None
+        if instruction_text is not None:
             self.instructions_text_area.delete(1.0, tk.END)
             self.instructions_text_area.insert(1.0, instruction_text)
             self.current_instruction_label = selected_label
@@ -1401,9 +2248,12 @@ class WordProcessorApp:
         # Get current text from text area
         instruction_text = self.instructions_text_area.get(1.0, tk.END).strip()
         
-        # Save to dictionary
-        self.instructions_dict[selected_label] = instruction_text
-        self.save_instructions()
+        # Save this template only (single-row update)
+        try:
+            self.template_store.put(INSTRUCTION, selected_label, instruction_text)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save instructions: {str(e)}")
+            return
         self.current_instruction_label = selected_label
     
     def create_new_instruction(self):
@@ -1415,13 +2265,16 @@ class WordProcessorApp:
         new_label = new_label.strip()
         
         # Check if label already exists
-        if new_label in self.instructions_dict:
+        if self.template_store.exists(INSTRUCTION, new_label):
             messagebox.showwarning("Warning", f"Label '{new_label}' already exists.")
             return
         
         # Create new instruction with blank text
-        self.instructions_dict[new_label] = ""
-        self.save_instructions()
+        try:
+            self.template_store.put(INSTRUCTION, new_label, "")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save instructions: {str(e)}")
+            return
         
         # Update combo and select new label
         self.update_instruction_combo()
@@ -1437,7 +2290,7 @@ class WordProcessorApp:
             return
         
         # Prevent deleting "basic" if it's the only one
-        if selected_label == "basic" and len(self.instructions_dict) == 1:
+        if selected_label == "basic" and self.template_store.count(INSTRUCTION) == 1:
             messagebox.showwarning("Warning", "Cannot delete the 'basic' instruction. At least one instruction must exist.")
             return
         
@@ -1446,26 +2299,58 @@ class WordProcessorApp:
             return
         
         # Delete the instruction
-        del self.instructions_dict[selected_label]
-        self.save_instructions()
+        try:
+            self.template_store.delete(INSTRUCTION, selected_label)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save instructions: {str(e)}")
+            return
         
         # Update combo and select another label
         self.update_instruction_combo()
-        if self.instructions_dict:
+        labels = self.template_store.labels(INSTRUCTION)
+        if labels:
             # Select first available label
-            first_label = sorted(self.instructions_dict.keys())[0]
+            first_label = labels[0]
             self.instruction_label_var.set(first_label)
             self.on_instruction_label_selected()
         
 
 
 def main():
+    # Service mode: python app.py --serve [options of service.py]
+    if "--serve" in sys.argv[1:]:
+        import service
+        service.main([arg for arg in sys.argv[1:] if arg != "--serve"])
+        return
+    # Watch-folder mode: python app.py --watch FOLDER [options of watch_folder.py]
+    if "--watch" in sys.argv[1:]:
+        import watch_folder
+        watch_folder.main([arg for arg in sys.argv[1:] if arg != "--watch"])
+        return
+    # Batch processing mode: python app.py --process REPORT.docx ... [options of scheduler.py]
+    if "--process" in sys.argv[1:]:
+        import scheduler
+        scheduler.main([arg for arg in sys.argv[1:] if arg != "--process"])
+        return
+    
+    # Memory diagnostics: tracing starts before the previous session is restored
+    memory_profiler = None
+    if "--memory" in sys.argv[1:]:
+        memory_profiler = MemoryProfiler()
+        memory_profiler.start()
+    
     # Use TkinterDnD if available, otherwise use regular Tk
     if DND_AVAILABLE:
         root = TkinterDnD.Tk()
     else:
         root = tk.Tk()
     app = WordProcessorApp(root)
+    # Record timings from the start (python app.py --perf): Ctrl+Shift+P shows them
+    if "--perf" in sys.argv[1:]:
+        app.set_perf_enabled(True)
+    if memory_profiler is not None:
+        app.memory_profiler = memory_profiler
+        app.memory_checkpoint("session restored")
     root.mainloop()
 
 
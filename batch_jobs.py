@@ -0,0 +1,174 @@
+"""
+Batch Jobs
+
+Collects prepared (already masked) prompts into batch jobs, submits them to a
+provider's asynchronous batch API, and writes the unmasked results once the
+batch has ended. Each job is a JSON file in the jobs directory, so a batch
+submitted in the evening can be collected after a restart the next morning.
+"""
+
+import json
+import os
+import time
+from typing import List, Dict, Optional
+
+from llm_providers import LLMModelRegistry
+from masking import PlaceholderRestorer
+
+
+class BatchJobManager:
+    """Creates, submits, polls and collects batch jobs stored as JSON files"""
+
+    def __init__(self, registry: LLMModelRegistry, jobs_dir: str = "batches"):
+        self.registry = registry
+        self.jobs_dir = jobs_dir
+        self.draft_name = "draft"  # Job that collects prompts until it is submitted
+
+    def _job_path(self, job_name: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_name}.json")
+
+    def load_job(self, job_name: str) -> Optional[Dict]:
+        """Load a job from disk, or None if it does not exist"""
+        path = self._job_path(job_name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_job(self, job: Dict):
+        """Write a job atomically"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = self._job_path(job["name"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def list_jobs(self) -> List[Dict]:
+        """Return all jobs, oldest first"""
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        jobs = []
+        for file_name in sorted(os.listdir(self.jobs_dir)):
+            if file_name.endswith(".json"):
+                job = self.load_job(file_name[:-len(".json")])
+                if job:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: job.get("created", 0))
+
+    def add_item(self, messages: List[Dict[str, str]], masking_map: Dict[str, str],
+                 source_path: Optional[str] = None) -> int:
+        """Add a prepared prompt and its masking map to the draft job.
+
+        Returns the number of items in the draft.
+        """
+        job = self.load_job(self.draft_name) or {
+            "name": self.draft_name,
+            "status": "draft",
+            "created": time.time(),
+            "items": []
+        }
+        custom_id = f"doc_{len(job['items']) + 1:04d}"
+        job["items"].append({
+            "custom_id": custom_id,
+            "source_path": source_path,
+            "messages": messages,
+            "masking_map": masking_map
+        })
+        self.save_job(job)
+        return len(job["items"])
+
+    def submit_draft(self, model: str, max_tokens: int = 64000) -> Dict:
+        """Submit the draft job to the model's provider and rename it after the batch id"""
+        job = self.load_job(self.draft_name)
+        if not job or not job["items"]:
+            raise ValueError("The batch is empty. Add documents first.")
+
+        provider = self.registry.get_provider_for_model(model)
+        if not provider:
+            raise ValueError(f"No provider found for model: {model}")
+
+        requests = [{"custom_id": item["custom_id"], "messages": item["messages"]} for item in job["items"]]
+        batch_id = provider.submit_batch(requests, model=model, max_tokens=max_tokens)
+
+        job.update({
+            "name": f"batch_{time.strftime('%Y%m%d_%H%M%S')}_{batch_id[-8:]}",
+            "status": "submitted",
+            "model": model,
+            "batch_id": batch_id,
+            "submitted": time.time()
+        })
+        self.save_job(job)
+        os.remove(self._job_path(self.draft_name))
+        return job
+
+    def poll_job(self, job: Dict) -> Dict:
+        """Refresh the provider status of a submitted job"""
+        provider = self.registry.get_provider_for_model(job["model"])
+        if not provider:
+            raise ValueError(f"No provider found for model: {job['model']}")
+        info = provider.poll_batch(job["batch_id"])
+        job["provider_status"] = info
+        if info["status"] == "failed":
+            job["status"] = "failed"
+        self.save_job(job)
+        return info
+
+    def collect_job(self, job: Dict, results_dir: Optional[str] = None) -> List[str]:
+        """Fetch the results of an ended job, unmask them and write one file per document.
+
+        Results are written next to each source document (or into `results_dir`).
+        Returns the list of written file paths.
+        """
+        provider = self.registry.get_provider_for_model(job["model"])
+        if not provider:
+            raise ValueError(f"No provider found for model: {job['model']}")
+        results = provider.fetch_batch_results(job["batch_id"])
+
+        written = []
+        for item in job["items"]:
+            result = results.get(item["custom_id"])
+            if result is None:
+                item["error"] = "missing from batch results"
+                continue
+            if "error" in result:
+                item["error"] = result["error"]
+                continue
+
+            text = PlaceholderRestorer(item["masking_map"]).restore(result["text"])
+            source_path = item.get("source_path")
+            if source_path and not results_dir:
+                base = os.path.splitext(source_path)[0]
+            else:
+                base = os.path.join(results_dir or self.jobs_dir, f"{job['name']}_{item['custom_id']}")
+            output_path = f"{base}_result.txt"
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            item["output_path"] = output_path
+            written.append(output_path)
+
+        job["status"] = "collected"
+        job["collected"] = time.time()
+        self.save_job(job)
+        return written
+
+    def check_all(self) -> List[str]:
+        """Poll every submitted job and collect those that have ended.
+
+        Returns one human-readable status line per job.
+        """
+        lines = []
+        for job in self.list_jobs():
+            if job.get("status") != "submitted":
+                continue
+            try:
+                info = self.poll_job(job)
+                if info["status"] == "ended":
+                    written = self.collect_job(job)
+                    lines.append(f"{job['name']}: collected {len(written)}/{len(job['items'])} result(s)")
+                else:
+                    lines.append(f"{job['name']}: {info['status']} "
+                                 f"({info.get('succeeded', 0)}/{info.get('total', len(job['items']))} done)")
+            except Exception as e:
+                lines.append(f"{job['name']}: error - {e}")
+        return lines
@@ -0,0 +1,121 @@
+"""
+Benchmark: memory footprint of a large document
+
+Runs the pipeline of one document (load, extract, index, mask, build the
+prompt, receive and restore an answer) on a synthetic report under
+tracemalloc, with the same structures the app's memory diagnostics mode
+measures, and prints the footprint report. The run fails (exit code 1)
+when the highest traced peak exceeds the budget, given in bytes per
+character of the report. Text held by Tk widgets is not part of this
+headless run.
+
+Run with: python benchmarks/bench_memory.py [--size 10m] [--budget 12]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from document import TextDocument, PieceTable  # noqa: E402
+from masking import NormalizedText, OccurrenceStore, PlaceholderRestorer, find_word_position  # noqa: E402
+from memory_diagnostics import MemoryProfiler, format_bytes  # noqa: E402
+from pipeline import read_docx_text, mask_names, build_prompt, DEFAULT_INSTRUCTION  # noqa: E402
+from synthetic_reports import NAMES  # noqa: E402
+from bench_pipeline import parse_size, size_label, report_docx, BENCH_DIR  # noqa: E402
+
+RESULTS_FILE = os.path.join(BENCH_DIR, "last_memory_run.json")
+
+
+def run_pipeline(path: str, answer_chars: int) -> Tuple[MemoryProfiler, int]:
+    """One document through the pipeline, with a memory checkpoint after each step.
+    Returns the profiler and the length of the report."""
+    profiler = MemoryProfiler()
+    profiler.start()
+    document = TextDocument()
+    masked_pieces = PieceTable()
+    occurrences = OccurrenceStore()
+    live_mask_index = None
+    prompt = None
+    conversation = []
+
+    def checkpoint(step: str):
+        # Same structures, in the same order, as WordProcessorApp.memory_checkpoint
+        row = profiler.checkpoint(step, {
+            "full_text": document.source,
+            "extracted": document.extracted,
+            "masked": masked_pieces,
+            "prompt": prompt,
+            "conversation": conversation,
+            "indexes": [document, live_mask_index],
+            "occurrences": occurrences,
+        })
+        print(profiler.format_step(row))
+
+    document.load(read_docx_text(path))
+    checkpoint("document loaded")
+
+    # Extraction from the second heading to the end: a real copy of most of the text
+    start = find_word_position(document.source, "COMMÉMORATIFS") or 0
+    document.extract(start, len(document.source))
+    document.source_index()  # Built by the marker and section searches
+    checkpoint("text extracted")
+
+    live_mask_index = NormalizedText(document.extracted)  # Live preview of the typed names
+    mask_names(document.extracted, occurrences, NAMES)
+    masked_pieces = PieceTable.from_replacements(document.extracted, occurrences.replacements())
+    checkpoint("names masked")
+
+    prompt = build_prompt(DEFAULT_INSTRUCTION, masked_pieces.text())
+    checkpoint("prompt built")
+
+    # The answer echoes part of the masked text; it is restored for display
+    conversation = [{"role": "user", "content": prompt}]
+    answer = prompt[len(DEFAULT_INSTRUCTION):len(DEFAULT_INSTRUCTION) + answer_chars]
+    stream = PlaceholderRestorer.from_store(occurrences, document.extracted).stream()
+    restored = "".join(stream.feed(answer[i:i + 64]) for i in range(0, len(answer), 64)) + stream.flush()
+    conversation.append({"role": "assistant", "content": answer})
+    checkpoint("answer received")
+    del restored
+    prompt = None
+    checkpoint("prompt released")
+    profiler.stop()
+    return profiler, len(document.source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", default="10m", help="Report size in characters")
+    parser.add_argument("--answer-chars", type=int, default=50_000, help="Size of the simulated answer")
+    parser.add_argument("--budget", type=float, default=12.0,
+                        help="Highest traced peak allowed, in bytes per report character")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the results")
+    args = parser.parse_args()
+
+    size = parse_size(args.size)
+    path = report_docx(size)
+    profiler, chars = run_pipeline(path, args.answer_chars)
+    print()
+    print(profiler.format_report())
+
+    peak = profiler.peak()
+    budget = args.budget * chars
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "size": size_label(size), "peak": peak, "budget": budget, "steps": profiler.rows}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+
+    print(f"\nPeak {format_bytes(peak)} for a {size_label(size)} report "
+          f"({peak / chars:.1f} bytes/char, budget {args.budget:g} = {format_bytes(budget)})")
+    if peak > budget:
+        print("Over the memory budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark: document pipeline stages
+
+Times each stage of the pipeline separately on synthetic reports from
+10 KB to 10 MB (see synthetic_reports.py): loading the .docx, the marker
+search (exact and approximate), the name search, masking, rebuilding the masked text, undoing a
+name and streaming restoration. Results are written as JSON; with a
+baseline, the run fails (exit code 1) when a stage is slower than the
+baseline by more than the threshold.
+
+Run with: python benchmarks/bench_pipeline.py [--sizes 10k,100k,1m,10m] [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, Callable, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from document import TextDocument, PieceTable  # noqa: E402
+from fuzzy_search import find_approximate  # noqa: E402
+from masking import (NormalizedText, OccurrenceStore, PlaceholderRestorer, find_word_position,  # noqa: E402
+                     find_name_occurrences)
+from pipeline import read_docx_text, mask_names  # noqa: E402
+from synthetic_reports import NAMES, write_docx  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BENCH_DIR, ".cache")  # Generated .docx files, reused between runs
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_FILE = os.path.join(BENCH_DIR, "last_run.json")
+
+SIZE_UNITS = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(label: str) -> int:
+    label = label.strip().lower().rstrip("b")
+    if label[-1:] in SIZE_UNITS:
+        return int(float(label[:-1]) * SIZE_UNITS[label[-1]])
+    return int(label)
+
+
+def size_label(size: int) -> str:
+    if size >= 1_000_000:
+        return f"{size // 1_000_000}MB"
+    return f"{size // 1_000}KB"
+
+
+def measure(func: Callable, setup: Optional[Callable] = None, repeat: int = 3) -> float:
+    """Best time of `repeat` runs; setup() runs before each one, untimed, and its result is passed to func"""
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        func(state) if setup else func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report_docx(size: int) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"report-{size}.docx")
+    if not os.path.exists(path):
+        write_docx(path, size)
+    return path
+
+
+def bench_size(size: int, repeat: int) -> Dict[str, float]:
+    """Time every stage on one report size. Returns {stage: seconds}."""
+    path = report_docx(size)
+    text = read_docx_text(path)
+    results = {}
+
+    def load():
+        document = TextDocument()
+        document.load(read_docx_text(path))
+    results["load_document"] = measure(load, repeat=repeat)
+
+    # Markers that are absent: the whole text is searched (worst case)
+    results["find_word_ignore_case_accent"] = measure(
+        lambda: find_word_position(text, "signature de l'expert"), repeat=repeat)
+    results["find_name_ignore_case_accent"] = measure(
+        lambda: find_name_occurrences(NormalizedText(text), "Marie-Hélène Dupont de la Tour"), repeat=repeat)
+    # Misspelled markers: a heading found in every other paragraph, and a phrase that is absent
+    index = NormalizedText(text)
+    results["find_marker_approximate"] = measure(
+        lambda: (find_approximate(index, "antecedants", 2, limit=20), find_approximate(index, "patient vuu", 2, limit=20)),
+        repeat=repeat)
+
+    def masked_store() -> OccurrenceStore:
+        store = OccurrenceStore()
+        mask_names(text, store, NAMES)
+        return store
+    results["apply_masking"] = measure(masked_store, repeat=repeat)
+
+    store = masked_store()
+    results["rebuild_masked_text"] = measure(
+        lambda: PieceTable.from_replacements(text, store.replacements()), repeat=repeat)
+
+    def undo(undo_store: OccurrenceStore):
+        undo_store.remove_name(undo_store.slots_by_id()[0])
+        undo_store.renumber()
+        PieceTable.from_replacements(text, undo_store.replacements())
+    results["undo_selected_change"] = measure(undo, setup=masked_store, repeat=repeat)
+
+    masked = PieceTable.from_replacements(text, store.replacements()).text()
+    chunks = [masked[i:i + 64] for i in range(0, len(masked), 64)]
+
+    def stream_restore():
+        stream = PlaceholderRestorer.from_store(store, text).stream()
+        for chunk in chunks:
+            stream.feed(chunk)
+        stream.flush()
+    results["stream_restore"] = measure(stream_restore, repeat=repeat)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float, min_delta: float):
+    """List of regressions: stages slower than baseline * (1 + threshold) and by more than min_delta seconds"""
+    regressions = []
+    for label, stages in results.items():
+        for stage, seconds in stages.items():
+            reference = baseline.get(label, {}).get(stage)
+            if reference is None:
+                continue
+            if seconds > reference * (1 + threshold) and seconds - reference > min_delta:
+                regressions.append(f"{label} {stage}: {seconds * 1000:.1f} ms vs baseline {reference * 1000:.1f} ms "
+                                   f"(+{(seconds / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k,1m,10m", help="Report sizes in characters")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage (the best is kept)")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the results")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.002, help="Ignore slowdowns below this (seconds)")
+    args = parser.parse_args()
+
+    results = {}
+    for size in [parse_size(label) for label in args.sizes.split(",") if label.strip()]:
+        label = size_label(size)
+        results[label] = bench_size(size, args.repeat)
+        print(f"{label}:")
+        for stage, seconds in results[label].items():
+            print(f"  {stage:<30}{seconds * 1000:10.2f} ms")
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "machine": platform.machine(), "results": results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold, args.min_delta)
+    if regressions:
+        print("Regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regression against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
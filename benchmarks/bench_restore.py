@@ -0,0 +1,107 @@
+"""
+Benchmark: placeholder restoration
+
+Compares the previous restore loop (one str.replace per masked occurrence)
+with the single-pass PlaceholderRestorer, on full texts and on a stream of
+small chunks.
+
+Run with: python benchmarks/bench_restore.py [--names 40] [--occurrences 300]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from masking import PlaceholderRestorer  # noqa: E402
+
+
+def legacy_restore(text, changes):
+    """Restore loop used before the single-pass restorer"""
+    restored_text = text
+    for change in reversed(changes):
+        restored_text = restored_text.replace(change['masked'], change['original'])
+    return restored_text
+
+
+def build_case(name_count: int, occurrences: int, seed: int = 1):
+    """Return (masked answer text, changes) with `occurrences` hits per name"""
+    rng = random.Random(seed)
+    filler = "Le patient a été examiné le matin, puis revu en consultation. ".split()
+    changes = []
+    words = []
+    position = 0
+    for name_id in range(1, name_count + 1):
+        original = f"Dupont{name_id}"
+        for _ in range(occurrences):
+            changes.append({
+                'original': original,
+                'masked': f"[NAME_{name_id}]",
+                'position': position,
+                'length': len(original),
+                'normalized_name': original.lower()
+            })
+            position += 1
+    placeholders = [c['masked'] for c in changes]
+    rng.shuffle(placeholders)
+    for placeholder in placeholders:
+        words.extend(rng.sample(filler, 4))
+        words.append(placeholder)
+    return " ".join(words), changes
+
+
+def time_call(func, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--names", type=int, default=40)
+    parser.add_argument("--occurrences", type=int, default=300)
+    parser.add_argument("--chunk-size", type=int, default=40)
+    args = parser.parse_args()
+
+    text, changes = build_case(args.names, args.occurrences)
+    restorer = PlaceholderRestorer.from_changes(changes)
+
+    # Same output when every name has a single spelling
+    assert legacy_restore(text, changes) == restorer.restore(text)
+
+    chunks = [text[i:i + args.chunk_size] for i in range(0, len(text), args.chunk_size)]
+
+    def legacy_stream():
+        # Previous streaming path: re-restore the whole accumulated text per chunk
+        accumulated = ""
+        for chunk in chunks[:200]:
+            accumulated += chunk
+            legacy_restore(accumulated, changes)
+
+    def restorer_stream():
+        stream = restorer.stream()
+        pieces = [stream.feed(chunk) for chunk in chunks[:200]]
+        pieces.append(stream.flush())
+        return "".join(pieces)
+
+    assert restorer_stream() == restorer.restore("".join(chunks[:200]))
+
+    print(f"text: {len(text):,} chars, {len(changes):,} occurrences of {args.names} names")
+    legacy_full = time_call(lambda: legacy_restore(text, changes))
+    single_full = time_call(lambda: restorer.restore(text))
+    print(f"full text   legacy loop: {legacy_full * 1000:9.2f} ms   single pass: {single_full * 1000:7.2f} ms"
+          f"   ({legacy_full / single_full:,.0f}x)")
+    legacy_chunks = time_call(legacy_stream, repeat=1)
+    single_chunks = time_call(restorer_stream)
+    print(f"200 chunks  legacy loop: {legacy_chunks * 1000:9.2f} ms   streaming:   {single_chunks * 1000:7.2f} ms"
+          f"   ({legacy_chunks / single_chunks:,.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Synthetic expertise reports for the benchmarks
+
+Builds deterministic French medical expertise reports of a requested size:
+the usual headings, accented vocabulary, multi-word and hyphenated names
+(with and without accents, in varying case) repeated densely, dates, phone
+numbers and e-mail addresses.
+
+Run with: python benchmarks/synthetic_reports.py --size 1000000 --docx report.docx
+"""
+
+import argparse
+import os
+import random
+import sys
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Names as they are typed in the masking field; the report spells them with varying case/accents
+NAMES = [
+    "Jean-Pierre Le Gall",
+    "Marie-Hélène Dupont de la Tour",
+    "Éloïse Bérénger",
+    "François Nguyen",
+    "Dr Gaëlle Lefèvre",
+    "Maître Anaïs Da Silva",
+    "Jérôme Château",
+    "Noémie Ça",
+]
+
+HEADINGS = [
+    "PRÉAMBULE", "COMMÉMORATIFS", "DOCUMENTS PRÉSENTÉS", "ANTÉCÉDENTS", "DOLÉANCES",
+    "EXAMEN CLINIQUE", "DISCUSSION", "CONCLUSION",
+]
+
+SENTENCES = [
+    "{name} a été examiné(e) le {date} au cabinet, en présence de {other}.",
+    "Il est rapporté une douleur cervicale irradiant vers l'épaule droite, majorée à l'effort.",
+    "Le scanner du {date} ne retrouve pas de lésion osseuse récente ; l'IRM est sans particularité.",
+    "{name} déclare ne pas avoir repris son activité professionnelle depuis l'accident.",
+    "Selon {other}, les séances de rééducation ont été interrompues à la mi-février.",
+    "Contact : {phone}, courriel {email}.",
+    "L'examen retrouve une raideur modérée, sans déficit neurologique ni amyotrophie.",
+    "La consolidation peut être fixée au {date}, avec un déficit fonctionnel permanent de 3 %.",
+    "{NAME} précise que les céphalées persistent « presque tous les jours ».",
+    "Les pièces médicales communiquées par {other} sont conformes au dossier.",
+]
+
+
+def spell(name: str, rng: random.Random) -> str:
+    """A spelling of the name as found in reports: upper case, lower case or without accents"""
+    choice = rng.random()
+    if choice < 0.15:
+        return name.upper()
+    if choice < 0.25:
+        return name.replace("é", "e").replace("è", "e").replace("ë", "e").replace("ï", "i").replace("ç", "c")
+    return name
+
+
+def report_paragraphs(size: int, seed: int = 1) -> List[str]:
+    """Paragraphs of a report of about `size` characters"""
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    heading = 0
+    while total < size:
+        paragraph = HEADINGS[heading % len(HEADINGS)]
+        heading += 1
+        sentences = []
+        for _ in range(rng.randint(3, 9)):
+            name = rng.choice(NAMES)
+            sentences.append(rng.choice(SENTENCES).format(
+                name=spell(name, rng), NAME=name.upper(), other=spell(rng.choice(NAMES), rng),
+                date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/20{rng.randint(10, 24)}",
+                phone=f"06 {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+                email=f"{name.split()[-1].lower()}@exemple.fr"))
+        for text in (paragraph, " ".join(sentences)):
+            paragraphs.append(text)
+            total += len(text) + 1
+    return paragraphs
+
+
+def report_text(size: int, seed: int = 1) -> str:
+    return "\n".join(report_paragraphs(size, seed))[:size]
+
+
+def write_docx(path: str, size: int, seed: int = 1):
+    import docx
+    doc = docx.Document()
+    for paragraph in report_paragraphs(size, seed):
+        doc.add_paragraph(paragraph)
+    doc.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic expertise report")
+    parser.add_argument("--size", type=int, default=100_000, help="Characters")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--docx", help="Write a .docx file (default: print the text)")
+    args = parser.parse_args()
+    if args.docx:
+        write_docx(args.docx, args.size, args.seed)
+    else:
+        print(report_text(args.size, args.seed))
+
+
+if __name__ == "__main__":
+    main()
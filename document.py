@@ -0,0 +1,235 @@
+"""
+Document Model
+
+Keeps the loaded text once and describes everything derived from it with
+offsets instead of full string copies: the extraction is an offset view into
+the loaded text, and the masked text is a piece table over the extraction
+in which each masked occurrence is a piece pointing at its placeholder.
+"""
+
+from typing import List, Iterable, Iterator, Optional, Tuple
+
+from masking import NormalizedText
+
+
+class PieceTable:
+    """A text made of pieces referring to read-only buffers.
+
+    Buffer 0 is the original text; inserted text is appended as new buffers.
+    Each piece is (buffer index, start, length). Materializing the text is
+    only needed when a real string is required (e.g. for the API prompt).
+    """
+
+    def __init__(self, original: str = ""):
+        self.buffers: List[str] = [original]
+        self.pieces: List[Tuple[int, int, int]] = [(0, 0, len(original))] if original else []
+        self.length = len(original)
+
+    @classmethod
+    def from_replacements(cls, source: str, replacements: Iterable[Tuple[int, int, str]]) -> "PieceTable":
+        """Build a table over `source` where each (start, length, text) range is replaced.
+
+        Replacements must be sorted by start and must not overlap.
+        """
+        table = cls(source)
+        table.pieces = []
+        table.length = 0
+        replacement_buffers = {}  # Reuse one buffer per distinct replacement text
+        cursor = 0
+        for start, length, text in replacements:
+            if start < cursor or start + length > len(source):
+                print(f"Warning: Skipping invalid replacement at {start} (length {length})")
+                continue
+            if start > cursor:
+                table.pieces.append((0, cursor, start - cursor))
+                table.length += start - cursor
+            buffer_index = replacement_buffers.get(text)
+            if buffer_index is None:
+                buffer_index = len(table.buffers)
+                table.buffers.append(text)
+                replacement_buffers[text] = buffer_index
+            if text:
+                table.pieces.append((buffer_index, 0, len(text)))
+                table.length += len(text)
+            cursor = start + length
+        if cursor < len(source):
+            table.pieces.append((0, cursor, len(source) - cursor))
+            table.length += len(source) - cursor
+        return table
+
+    def __len__(self) -> int:
+        return self.length
+
+    def iter_chunks(self) -> Iterator[str]:
+        """Yield the text piece by piece without building the whole string"""
+        for buffer_index, start, length in self.pieces:
+            yield self.buffers[buffer_index][start:start + length]
+
+    def iter_blocks(self, block_size: int = 65536) -> Iterator[str]:
+        """Yield the text in blocks of roughly `block_size` characters"""
+        block = []
+        block_length = 0
+        for chunk in self.iter_chunks():
+            block.append(chunk)
+            block_length += len(chunk)
+            if block_length >= block_size:
+                yield "".join(block)
+                block = []
+                block_length = 0
+        if block:
+            yield "".join(block)
+
+    def text(self) -> str:
+        """Materialize the full text"""
+        if len(self.pieces) == 1 and self.pieces[0][0] == 0 and self.pieces[0][2] == len(self.buffers[0]):
+            return self.buffers[0]  # Unchanged original: no copy
+        return "".join(self.iter_chunks())
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """Return (piece index, offset within piece) for a text position"""
+        offset = position
+        for index, (_, _, length) in enumerate(self.pieces):
+            if offset < length:
+                return index, offset
+            offset -= length
+        return len(self.pieces), 0
+
+    def _split(self, position: int) -> int:
+        """Split the piece at `position` and return the index of the piece starting there"""
+        index, offset = self._locate(position)
+        if offset == 0:
+            return index
+        buffer_index, start, length = self.pieces[index]
+        self.pieces[index:index + 1] = [(buffer_index, start, offset), (buffer_index, start + offset, length - offset)]
+        return index + 1
+
+    def insert(self, position: int, text: str):
+        """Insert text at a position"""
+        if not text:
+            return
+        if position < 0 or position > self.length:
+            raise IndexError(f"Insert position {position} out of range")
+        index = self._split(position)
+        self.buffers.append(text)
+        self.pieces.insert(index, (len(self.buffers) - 1, 0, len(text)))
+        self.length += len(text)
+
+    def delete(self, position: int, length: int):
+        """Delete `length` characters starting at a position"""
+        if length <= 0:
+            return
+        if position < 0 or position + length > self.length:
+            raise IndexError(f"Delete range {position}+{length} out of range")
+        first = self._split(position)
+        last = self._split(position + length)
+        del self.pieces[first:last]
+        self.length -= length
+
+    def map_original_positions(self, positions: Iterable[int]) -> List[Optional[int]]:
+        """Map sorted positions of the original text (buffer 0) to positions in this text.
+
+        Positions that fall in a deleted or replaced range map to None. The
+        pieces are walked once, so the cost is O(pieces + positions).
+        """
+        result = []
+        pieces = iter(self.pieces)
+        piece = next(pieces, None)
+        text_position = 0  # Position of `piece` in this text
+        for position in positions:
+            # Skip pieces that end before the position
+            while piece is not None and (piece[0] != 0 or piece[1] + piece[2] <= position):
+                text_position += piece[2]
+                piece = next(pieces, None)
+            if piece is None or position < piece[1]:
+                result.append(None)
+            else:
+                result.append(text_position + position - piece[1])
+        return result
+
+    def slice(self, start: int, end: int) -> str:
+        """Return the text between two positions (only the pieces in the range are copied)"""
+        result = []
+        position = 0
+        for buffer_index, piece_start, length in self.pieces:
+            piece_end = position + length
+            if piece_end > start and position < end:
+                result.append(self.buffers[buffer_index][piece_start + max(0, start - position):
+                                                         piece_start + min(length, end - position)])
+            if piece_end >= end:
+                break
+            position = piece_end
+        return "".join(result)
+
+
+class TextDocument:
+    """Loaded text plus the extraction, described as an offset view.
+
+    The extracted text is `source[view_start:view_end]` until the user edits
+    it; an edited extraction is stored as its own string. Whole-document
+    extractions share the loaded string, so no copy is made.
+    """
+
+    def __init__(self):
+        self.source = ""
+        self.view_start = 0
+        self.view_end = 0
+        self.edited_text: Optional[str] = None  # Set once the extraction is edited by hand
+        self._extracted_cache: Optional[str] = None
+        self._source_index: Optional[NormalizedText] = None
+
+    def load(self, text: str):
+        """Replace the loaded text; the extraction becomes the whole document"""
+        self.source = text
+        self._source_index = None
+        self.extract(0, len(text))
+
+    def source_index(self) -> NormalizedText:
+        """Normalized form of the loaded text, built once per document"""
+        if self._source_index is None or self._source_index.text is not self.source:
+            self._source_index = NormalizedText(self.source)
+        return self._source_index
+
+    def extract(self, start: int, end: int):
+        """Make the extraction an offset view into the loaded text"""
+        self.view_start = max(0, start)
+        self.view_end = min(len(self.source), end)
+        self.edited_text = None
+        self._extracted_cache = None
+
+    def extract_ranges(self, ranges: List[Tuple[int, int]], separator: str = "\n"):
+        """Extract several (start, end) ranges of the loaded text.
+        A single range stays an offset view; several ranges are joined into one text."""
+        if len(ranges) == 1:
+            self.extract(*ranges[0])
+            return
+        self.extract(ranges[0][0], ranges[-1][1])
+        self.edited_text = separator.join(self.source[start:end].strip("\n") for start, end in ranges)
+
+    def set_extracted(self, text: str):
+        """Replace the extraction with an edited text"""
+        if self.edited_text is None and text == self.extracted:
+            return
+        self.edited_text = text
+        self._extracted_cache = None
+
+    def clear_extraction(self):
+        self.view_start = self.view_end = 0
+        self.edited_text = ""
+        self._extracted_cache = None
+
+    @property
+    def extracted(self) -> str:
+        """The extracted text (materialized once, shared when it spans the whole document)"""
+        if self.edited_text is not None:
+            return self.edited_text
+        if self._extracted_cache is None:
+            if self.view_start == 0 and self.view_end == len(self.source):
+                self._extracted_cache = self.source
+            else:
+                self._extracted_cache = self.source[self.view_start:self.view_end]
+        return self._extracted_cache
+
+    def extracted_length(self) -> int:
+        if self.edited_text is not None:
+            return len(self.edited_text)
+        return self.view_end - self.view_start
@@ -0,0 +1,182 @@
+"""
+Approximate Search
+
+Finds a marker word or phrase in a text while tolerating a few typing or
+OCR errors (insertions, deletions, substitutions). Exact occurrences are
+found first with a plain search. Candidate regions are then found by the
+regex engine (with k errors, two of k + 2 pieces of the pattern appear
+unchanged, about as far apart as in the pattern), screened with character
+and bigram counts, and verified with Myers' bit-parallel edit distance
+algorithm. Only those regions are scanned character by character in
+Python, so a search in a large report takes milliseconds.
+"""
+
+import re
+from bisect import bisect_left
+from operator import add
+from typing import List, Dict, Tuple
+
+from masking import NormalizedText, normalize_text
+
+
+def _myers_ends(pattern: str, text: str, max_distance: int) -> List[Tuple[int, int]]:
+    """Return (end, distance) for every end position in text where the pattern
+    matches a substring with at most max_distance edits (Myers, 1999)"""
+    m = len(pattern)
+    full = (1 << m) - 1
+    last_bit = 1 << (m - 1)
+    peq: Dict[str, int] = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    pv, mv, score = full, 0, m
+    ends = []
+    for j, char in enumerate(text):
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last_bit:
+            score += 1
+        elif mh & last_bit:
+            score -= 1
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score <= max_distance:
+            ends.append((j + 1, score))
+    return ends
+
+
+def _best_start(pattern: str, text: str, end: int, max_distance: int) -> Tuple[int, int]:
+    """Find the start of the best match ending at `end`: (start, distance).
+
+    One edit distance table between the reversed pattern and the reversed text
+    before `end` gives the distance for every match length at once."""
+    lowest = max(0, end - len(pattern) - max_distance)
+    segment = text[lowest:end][::-1]
+    previous = list(range(len(segment) + 1))
+    for i, char_a in enumerate(reversed(pattern), 1):
+        current = [i]
+        for j, char_b in enumerate(segment, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    # previous[length]: distance to text[end - length:end]; the shortest match wins a tie
+    length = min(range(min(max(1, len(pattern) - max_distance), len(segment)), len(segment) + 1),
+                 key=lambda n: (previous[n], n))
+    return end - length, previous[length]
+
+
+def _pair_filters(pattern: str, max_distance: int) -> List[Tuple[int, re.Pattern]]:
+    """Regexes that find every region where the pattern may match with at most
+    max_distance edits, as (piece offset, regex) pairs.
+
+    The pattern is cut into max_distance + 2 pieces: each edit breaks at most
+    one piece, so two pieces appear unchanged, and the gap between them moves
+    by at most max_distance. Each regex is a piece followed by a lookahead for
+    any later one, so common short pieces ("en", "ti") alone do not produce
+    thousands of windows to verify."""
+    piece_count = max_distance + 2
+    piece_length = len(pattern) // piece_count
+    pieces = [(i * piece_length, pattern[i * piece_length:(i + 1) * piece_length if i < piece_count - 1 else None])
+              for i in range(piece_count)]
+    filters = []
+    for i, (offset, piece) in enumerate(pieces[:-1]):
+        # One regex per first piece keeps it a literal prefix, which the regex engine scans for quickly
+        gaps = []
+        for other_offset, other in pieces[i + 1:]:
+            gap = other_offset - offset - len(piece)
+            gaps.append(f".{{{max(0, gap - max_distance)},{gap + max_distance}}}{re.escape(other)}")
+        filters.append((offset, re.compile(f"{re.escape(piece)}(?={'|'.join(gaps)})", re.DOTALL)))
+    return filters
+
+
+def find_approximate(index: NormalizedText, word: str, max_distance: int = 2,
+                     limit: int = 5, min_position: int = 0) -> List[Dict]:
+    """Find the closest occurrences of a word or phrase, ignoring case and accents.
+
+    Returns up to `limit` candidates {'start', 'end', 'distance', 'text'} in
+    original text positions, ranked by distance and then by position. Only
+    candidates starting at or after `min_position` (original text) are
+    searched, so closer matches before it never push them out of the limit.
+    """
+    pattern = ' '.join(normalize_text(word).split())
+    if not pattern:
+        return []
+    # Each piece must stay long enough to be selective
+    max_distance = max(0, min(max_distance, len(pattern) // 3 - 1))
+    text = index.normalized
+    # First normalized position at or after min_position in the original text
+    if index.position_map is None:
+        normalized_min = min(min_position, len(text))
+    else:
+        normalized_min = bisect_left(index.position_map, min_position)
+
+    # Exact occurrences rank first: when there are enough of them, nothing else is needed
+    found = []  # (distance, normalized end)
+    position = text.find(pattern, normalized_min)
+    while position != -1 and len(found) < limit:
+        found.append((0, position + len(pattern)))
+        position = text.find(pattern, position + 1)
+
+    if len(found) < limit and max_distance > 0:
+        # All the exact occurrences are known; the filters find the regions that may hold the others
+        length = len(pattern) + 2 * max_distance
+        starts = sorted({max(normalized_min, match.start() - offset - max_distance)
+                         for offset, regex in _pair_filters(pattern, max_distance)
+                         for match in regex.finditer(text, max(0, normalized_min + offset - max_distance))})
+        # Windows of the same length around them, merged when they overlap
+        merged = []
+        for start in starts:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = start + length
+            else:
+                merged.append([start, start + length])
+
+        # Cheap checks before Myers: each edit loses at most one of the pattern's
+        # distinct characters and at most two of its distinct bigrams
+        characters = set(pattern)
+        bigrams = {pattern[i:i + 2] for i in range(len(pattern) - 1)}
+        # Verify each merged range once, in position order. Once `limit` candidates
+        # are found, later ones must be strictly closer to rank, so the allowed
+        # distance shrinks; the search stops before 0 since exact ones are known.
+        allowed = max_distance
+        for window_start, window_end in merged:
+            window = text[window_start:window_end]
+            if (len(characters.intersection(window)) < len(characters) - allowed
+                    or len(bigrams.intersection(map(add, window, window[1:]))) < len(bigrams) - 2 * allowed):
+                continue
+            ends = _myers_ends(pattern, window, allowed)
+            # Keep the best end of each run of consecutive matching ends
+            run = []
+            for end, distance in ends + [(None, None)]:
+                if run and (end is None or end != run[-1][0] + 1):
+                    best_end, best_distance = min(run, key=lambda item: (item[1], item[0]))
+                    if best_distance > 0:
+                        found.append((best_distance, window_start + best_end))
+                    run = []
+                if end is not None:
+                    run.append((end, distance))
+            if len(found) >= limit:
+                found.sort()
+                del found[limit:]
+                allowed = found[-1][0] - 1
+                if allowed < 1:
+                    break
+
+    # Starts are only looked up for the candidates that are returned
+    found.sort()
+    results = []
+    seen = set()
+    for distance, norm_end in found:
+        norm_start, distance = _best_start(pattern, text, norm_end, max_distance)
+        if norm_start in seen or norm_start < normalized_min:
+            continue
+        seen.add(norm_start)
+        start = index.to_original(norm_start)
+        end = index.to_original(norm_end - 1) + 1
+        results.append({'start': start, 'end': end, 'distance': distance, 'text': index.text[start:end]})
+    results.sort(key=lambda candidate: (candidate['distance'], candidate['start']))
+    return results[:limit]
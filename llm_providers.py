@@ -5,6 +5,7 @@ This module provides an abstract interface for LLM providers, allowing
 easy integration of multiple providers (Claude, OpenAI, etc.) and models.
 """
 
+import json
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional
 
@@ -51,15 +52,69 @@ class LLMProvider(ABC):
     def validate_model(self, model: str) -> bool:
         """Check if a model identifier is valid for this provider"""
         pass
+    
+    def build_continuation_messages(self, messages: List[Dict[str, str]], partial: str) -> List[Dict[str, str]]:
+        """
+        Build the messages for resuming an answer that was cut off mid-stream.
+        
+        Default: send the partial answer back as an assistant turn and ask the
+        model to continue exactly where it stopped.
+        """
+        return messages + [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": "Continue exactly where you stopped, without repeating anything already written."}
+        ]
+    
+    def submit_batch(self, requests: List[Dict], model: str, max_tokens: int = 64000) -> str:
+        """
+        Submit prepared prompts to the provider's asynchronous batch API.
+        
+        Args:
+            requests: List of dicts with 'custom_id' and 'messages' keys
+            model: Model identifier string
+            max_tokens: Maximum tokens per response
+            
+        Returns:
+            Provider batch identifier
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batches")
+    
+    def poll_batch(self, batch_id: str) -> Dict:
+        """
+        Return the status of a batch as a dict with keys:
+        'status' ('in_progress', 'ended' or 'failed'), 'total', 'succeeded', 'failed'
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batches")
+    
+    def fetch_batch_results(self, batch_id: str) -> Dict[str, Dict[str, str]]:
+        """
+        Fetch the results of an ended batch.
+        
+        Returns:
+            Dict mapping custom_id -> {'text': ...} or {'error': ...}
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support batches")
 
 
 class ClaudeProvider(LLMProvider):
     """Anthropic Claude API provider"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         if not ANTHROPIC_AVAILABLE:
             raise ImportError("anthropic library is not installed. Install it with: pip install anthropic")
-        self.client = Anthropic(api_key=api_key)
+        # base_url can point to a local stand-in server for offline testing
+        self.base_url = (base_url or "https://api.anthropic.com").rstrip("/")
+        self.client = Anthropic(api_key=api_key, base_url=self.base_url)
+        # httpx client for the Message Batches endpoints (httpx is installed with anthropic)
+        import httpx
+        self.http_client = httpx.Client(
+            base_url=self.base_url,
+            headers={
+                "x-api-key": api_key,
+                "anthropic-version": "2023-06-01"
+            },
+            timeout=120.0
+        )
         # Note: Model identifiers may need to be updated based on actual API availability
         # Check Anthropic API documentation for current model names
         self.available_models = [
@@ -108,6 +163,77 @@ class ClaudeProvider(LLMProvider):
                 return response.content[0].text
             return ""
     
+    def build_continuation_messages(self, messages: List[Dict[str, str]], partial: str) -> List[Dict[str, str]]:
+        """Resume with the partial answer as an assistant prefix (Claude continues it directly)"""
+        # The API rejects a final assistant turn ending with whitespace
+        return messages + [{"role": "assistant", "content": partial.rstrip()}]
+    
+    def submit_batch(self, requests: List[Dict], model: str, max_tokens: int = 64000) -> str:
+        """Submit a batch through the Anthropic Message Batches API"""
+        if not self.validate_model(model):
+            raise ValueError(f"Invalid Claude model: {model}")
+        
+        batch_requests = []
+        for request in requests:
+            batch_requests.append({
+                "custom_id": request["custom_id"],
+                "params": {
+                    "model": model,
+                    "max_tokens": max_tokens,
+                    "messages": [{"role": m["role"], "content": m["content"]} for m in request["messages"]]
+                }
+            })
+        
+        response = self.http_client.post("/v1/messages/batches", json={"requests": batch_requests})
+        response.raise_for_status()
+        return response.json()["id"]
+    
+    def poll_batch(self, batch_id: str) -> Dict:
+        """Return the status of a Message Batch"""
+        response = self.http_client.get(f"/v1/messages/batches/{batch_id}")
+        response.raise_for_status()
+        data = response.json()
+        
+        counts = data.get("request_counts", {})
+        succeeded = counts.get("succeeded", 0)
+        failed = counts.get("errored", 0) + counts.get("canceled", 0) + counts.get("expired", 0)
+        total = succeeded + failed + counts.get("processing", 0)
+        
+        status = "ended" if data.get("processing_status") == "ended" else "in_progress"
+        return {
+            "status": status,
+            "total": total,
+            "succeeded": succeeded,
+            "failed": failed,
+            "results_url": data.get("results_url")
+        }
+    
+    def fetch_batch_results(self, batch_id: str) -> Dict[str, Dict[str, str]]:
+        """Download and parse the JSONL results of an ended Message Batch"""
+        info = self.poll_batch(batch_id)
+        if info["status"] != "ended":
+            raise ValueError(f"Batch {batch_id} has not ended yet")
+        
+        results_url = info.get("results_url") or f"/v1/messages/batches/{batch_id}/results"
+        response = self.http_client.get(results_url)
+        response.raise_for_status()
+        
+        results = {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            custom_id = entry.get("custom_id")
+            result = entry.get("result", {})
+            if result.get("type") == "succeeded":
+                content = result.get("message", {}).get("content", [])
+                text = "".join(block.get("text", "") for block in content if block.get("type") == "text")
+                results[custom_id] = {"text": text}
+            else:
+                error = result.get("error") or result.get("type", "unknown error")
+                results[custom_id] = {"error": str(error)}
+        return results
+    
     def get_available_models(self) -> List[str]:
         """Return list of available Claude models"""
         return self.available_models.copy()
@@ -120,17 +246,19 @@ class ClaudeProvider(LLMProvider):
 class OpenAIProvider(LLMProvider):
     """OpenAI API provider"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
         if not OPENAI_AVAILABLE:
             raise ImportError("openai library is not installed. Install it with: pip install openai")
-        self.client = openai.OpenAI(api_key=api_key)
+        # base_url can point to a local stand-in server for offline testing
+        self.base_url = (base_url or "https://api.openai.com").rstrip("/")
+        self.client = openai.OpenAI(api_key=api_key, base_url=f"{self.base_url}/v1")
         self.api_key = api_key
-        # Create httpx client for custom endpoints like /v1/responses
+        # Create httpx client for custom endpoints like /v1/responses and the Batch API
+        # (Content-Type is set per request: JSON bodies, or multipart for file uploads)
         self.http_client = httpx.Client(
-            base_url="https://api.openai.com",
+            base_url=self.base_url,
             headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
+                "Authorization": f"Bearer {api_key}"
             },
             timeout=60.0
         )
@@ -386,6 +514,123 @@ class OpenAIProvider(LLMProvider):
                     return response.choices[0].message.content
                 return ""
     
+    def submit_batch(self, requests: List[Dict], model: str, max_tokens: int = 64000) -> str:
+        """Submit a batch through the OpenAI Batch API (JSONL upload + batch creation)"""
+        if not self.validate_model(model):
+            raise ValueError(f"Invalid OpenAI model: {model}")
+        
+        uses_responses = model in self.responses_endpoint_models
+        endpoint = "/v1/responses" if uses_responses else "/v1/chat/completions"
+        
+        lines = []
+        for request in requests:
+            if uses_responses:
+                body = {
+                    "model": model,
+                    "input": [{"role": m["role"], "content": m["content"]} for m in request["messages"]],
+                    "max_output_tokens": max_tokens
+                }
+            else:
+                body = {
+                    "model": model,
+                    "messages": request["messages"],
+                    "max_completion_tokens": max_tokens
+                }
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": endpoint,
+                "body": body
+            }, ensure_ascii=False))
+        
+        # Upload the requests as a JSONL file
+        upload = self.http_client.post(
+            "/v1/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")}
+        )
+        upload.raise_for_status()
+        input_file_id = upload.json()["id"]
+        
+        response = self.http_client.post(
+            "/v1/batches",
+            json={
+                "input_file_id": input_file_id,
+                "endpoint": endpoint,
+                "completion_window": "24h"
+            }
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+    
+    def poll_batch(self, batch_id: str) -> Dict:
+        """Return the status of an OpenAI batch"""
+        response = self.http_client.get(f"/v1/batches/{batch_id}")
+        response.raise_for_status()
+        data = response.json()
+        
+        counts = data.get("request_counts") or {}
+        batch_status = data.get("status")
+        if batch_status in ("completed", "expired", "cancelled"):
+            status = "ended"
+        elif batch_status == "failed":
+            status = "failed"
+        else:
+            status = "in_progress"
+        return {
+            "status": status,
+            "total": counts.get("total", 0),
+            "succeeded": counts.get("completed", 0),
+            "failed": counts.get("failed", 0),
+            "output_file_id": data.get("output_file_id"),
+            "error_file_id": data.get("error_file_id")
+        }
+    
+    def fetch_batch_results(self, batch_id: str) -> Dict[str, Dict[str, str]]:
+        """Download and parse the output and error files of an ended batch"""
+        info = self.poll_batch(batch_id)
+        if info["status"] != "ended":
+            raise ValueError(f"Batch {batch_id} has not ended (status: {info['status']})")
+        
+        results = {}
+        for file_id in (info.get("output_file_id"), info.get("error_file_id")):
+            if not file_id:
+                continue
+            response = self.http_client.get(f"/v1/files/{file_id}/content")
+            response.raise_for_status()
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                custom_id = entry.get("custom_id")
+                error = entry.get("error")
+                response_data = entry.get("response") or {}
+                body = response_data.get("body") or {}
+                # A request that failed in the batch has a null top-level error:
+                # the error is in its response (non-200 status and body.error)
+                if not error and (response_data.get("status_code", 200) != 200 or body.get("error")):
+                    error = body.get("error") or f"HTTP {response_data.get('status_code')}"
+                if error or not body:
+                    results[custom_id] = {"error": str(error or "empty response")}
+                    continue
+                if "choices" in body:
+                    choices = body.get("choices") or [{}]
+                    text = (choices[0].get("message") or {}).get("content") or ""
+                else:
+                    text = self._collect_output_text(body)
+                results[custom_id] = {"text": text}
+        return results
+    
+    def _collect_output_text(self, response_data: Dict) -> str:
+        """Collect output_text blocks from a /v1/responses response body"""
+        text_parts = []
+        for item in response_data.get("output") or []:
+            if isinstance(item, dict) and item.get("type") == "message":
+                for content_block in item.get("content") or []:
+                    if isinstance(content_block, dict) and content_block.get("text"):
+                        text_parts.append(str(content_block["text"]).strip())
+        return "\n".join(text_parts).strip()
+    
     def get_available_models(self) -> List[str]:
         """Return list of available OpenAI models"""
         return self.available_models.copy()
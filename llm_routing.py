@@ -0,0 +1,519 @@
+"""
+LLM Routing Policies
+
+This module sits on top of LLMModelRegistry and decides which model actually
+serves a request. It provides hedged requests (launch a backup model when the
+primary is slow to produce a first token), automatic failover when a provider
+errors, a circuit breaker that skips providers with recent failures, and an
+automatic model selector that uses latency telemetry to meet a target time.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
+
+from llm_providers import LLMModelRegistry
+
+
+class RequestCancelled(Exception):
+    """Raised inside a stream callback to abort a request that lost the race"""
+    pass
+
+
+class CircuitBreaker:
+    """Tracks recent failures per provider and temporarily skips failing ones.
+
+    A provider's circuit opens after `failure_threshold` consecutive failures
+    and stays open for `reset_timeout` seconds. After that a single trial
+    request is allowed through (half-open): success closes the circuit again,
+    failure reopens it for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures: Dict[str, int] = {}  # Maps provider name -> consecutive failures
+        self.opened_at: Dict[str, float] = {}  # Maps provider name -> time the circuit opened
+        self.trial_started: Dict[str, float] = {}  # Maps provider name -> start of its half-open trial
+        self.lock = threading.Lock()
+
+    def _is_open(self, provider_name: str, now: float) -> bool:
+        opened_at = self.opened_at.get(provider_name)
+        if opened_at is None:
+            return False
+        if now - opened_at < self.reset_timeout:
+            return True
+        # Half-open: open while the trial request is in flight (a trial that never
+        # reported back, e.g. a lost thread, is given up after reset_timeout)
+        trial_started = self.trial_started.get(provider_name)
+        return trial_started is not None and now - trial_started < self.reset_timeout
+
+    def is_open(self, provider_name: str) -> bool:
+        """Return True if requests to this provider should be skipped (no state change)"""
+        with self.lock:
+            return self._is_open(provider_name, time.monotonic())
+
+    def allow_request(self, provider_name: str) -> bool:
+        """Return True if a request may be sent now; in the half-open state this admits
+        the single trial request, and later callers are refused until it reports back"""
+        with self.lock:
+            now = time.monotonic()
+            if self._is_open(provider_name, now):
+                return False
+            if provider_name in self.opened_at:
+                self.trial_started[provider_name] = now
+            return True
+
+    def record_success(self, provider_name: str):
+        """Reset the failure count after a successful request"""
+        with self.lock:
+            self.failures.pop(provider_name, None)
+            self.opened_at.pop(provider_name, None)
+            self.trial_started.pop(provider_name, None)
+
+    def record_failure(self, provider_name: str):
+        """Count a failure and open the circuit once the threshold is reached (a failed
+        trial reopens it at once)"""
+        with self.lock:
+            count = self.failures.get(provider_name, 0) + 1
+            self.failures[provider_name] = count
+            if count >= self.failure_threshold or provider_name in self.trial_started:
+                self.opened_at[provider_name] = time.monotonic()
+                self.trial_started.pop(provider_name, None)
+
+    def record_cancelled(self, provider_name: str):
+        """A request was cancelled before it could tell: let another trial through"""
+        with self.lock:
+            self.trial_started.pop(provider_name, None)
+
+
+class LatencyTelemetry:
+    """Per-model latency statistics, smoothed and persisted to a JSON file.
+
+    For each model it keeps an exponentially weighted moving average of the
+    time to first token (seconds) and of the output rate (characters/second).
+    For each instruction label it keeps the same average of the answer length
+    as a fraction of the prompt, so the selector learns which instructions
+    produce long answers.
+    """
+
+    def __init__(self, file_path: Optional[str] = "latency_telemetry.json", smoothing: float = 0.3):
+        self.file_path = file_path
+        self.smoothing = smoothing
+        self.stats: Dict[str, Dict[str, float]] = {}  # Maps model -> {'ttft', 'chars_per_second', 'samples'}
+        self.label_stats: Dict[str, Dict[str, float]] = {}  # Maps instruction label -> {'output_ratio', 'samples'}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load telemetry from disk (missing or corrupt files start empty)"""
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and isinstance(data.get('models'), dict):
+                self.stats = data['models']
+                self.label_stats = data.get('labels') or {}
+            elif isinstance(data, dict):
+                self.stats = data  # Older files only hold the models
+        except Exception as e:
+            print(f"Warning: Could not load latency telemetry: {e}")
+
+    def save(self):
+        """Write telemetry atomically so a crash never leaves a truncated file"""
+        if not self.file_path:
+            return
+        try:
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'models': self.stats, 'labels': self.label_stats}, f, indent=1)
+            os.replace(tmp_path, self.file_path)
+        except Exception as e:
+            print(f"Warning: Could not save latency telemetry: {e}")
+
+    def record(self, model: str, time_to_first_token: float, output_chars: int, total_seconds: float):
+        """Fold one completed request into the model's averages"""
+        streaming_seconds = max(total_seconds - time_to_first_token, 0.001)
+        chars_per_second = output_chars / streaming_seconds if output_chars else None
+        with self.lock:
+            entry = self.stats.get(model)
+            if entry is None:
+                entry = {'ttft': time_to_first_token, 'chars_per_second': chars_per_second or 0.0, 'samples': 0}
+            else:
+                a = self.smoothing
+                entry['ttft'] = (1 - a) * entry['ttft'] + a * time_to_first_token
+                if chars_per_second:
+                    if entry.get('chars_per_second'):
+                        entry['chars_per_second'] = (1 - a) * entry['chars_per_second'] + a * chars_per_second
+                    else:
+                        entry['chars_per_second'] = chars_per_second
+            entry['samples'] = entry.get('samples', 0) + 1
+            self.stats[model] = entry
+        self.save()
+
+    def get(self, model: str) -> Optional[Dict[str, float]]:
+        """Return the averages for a model, or None if it was never measured"""
+        with self.lock:
+            entry = self.stats.get(model)
+            return dict(entry) if entry else None
+
+    def record_output_ratio(self, label: str, prompt_chars: int, output_chars: int):
+        """Fold the length of one complete answer to an initial request into the label's average"""
+        if not label or prompt_chars <= 0:
+            return
+        ratio = output_chars / prompt_chars
+        with self.lock:
+            entry = self.label_stats.get(label)
+            if entry is None:
+                entry = {'output_ratio': ratio, 'samples': 0}
+            else:
+                entry['output_ratio'] = (1 - self.smoothing) * entry['output_ratio'] + self.smoothing * ratio
+            entry['samples'] = entry.get('samples', 0) + 1
+            self.label_stats[label] = entry
+        self.save()
+
+    def get_output_ratio(self, label: Optional[str]) -> Optional[float]:
+        """Return the average answer/prompt length ratio of a label, or None if it was never measured"""
+        with self.lock:
+            entry = self.label_stats.get(label)
+            return entry['output_ratio'] if entry else None
+
+
+# Capability tier per model: 3 = best quality, 1 = fastest / cheapest.
+# Models not listed get a tier from their name (see model_tier()).
+MODEL_TIERS = {
+    "claude-opus-4-5-20251101": 3,
+    "claude-sonnet-4-5-20250929": 2,
+    "claude-haiku-4-5-20251001": 1,
+    "gpt-5.2-pro": 3,
+    "gpt-5.2": 2,
+    "gpt-5-nano": 1,
+}
+
+# Latency priors per tier, used until telemetry exists for a model
+TIER_PRIORS = {
+    3: {'ttft': 8.0, 'chars_per_second': 120.0},
+    2: {'ttft': 3.0, 'chars_per_second': 250.0},
+    1: {'ttft': 1.0, 'chars_per_second': 400.0},
+}
+
+
+def model_tier(model: str) -> int:
+    """Return the capability tier of a model"""
+    if model in MODEL_TIERS:
+        return MODEL_TIERS[model]
+    lowered = model.lower()
+    if "opus" in lowered or lowered.endswith("-pro"):
+        return 3
+    if "haiku" in lowered or "nano" in lowered or "mini" in lowered:
+        return 1
+    return 2
+
+
+class AutoModelSelector:
+    """Chooses a model for a request so that it finishes within a target time.
+
+    The selector estimates the answer length from the prompt size and the
+    instruction label (the ratio observed for that label in telemetry, unless
+    configured), predicts each model's total time from telemetry (or
+    tier priors), and picks the best-quality model that meets the target.
+    Short follow-up questions are capped to a fast tier; initial report
+    requests never go below the `initial_min_tier`.
+    """
+
+    def __init__(self, registry: LLMModelRegistry, telemetry: LatencyTelemetry,
+                 target_seconds: float = 90.0, breaker: Optional[CircuitBreaker] = None):
+        self.registry = registry
+        self.telemetry = telemetry
+        self.target_seconds = target_seconds
+        self.breaker = breaker
+        # Expected answer length as a fraction of the prompt, per instruction label. Configured
+        # ratios win; otherwise the ratio observed in telemetry, then the default
+        self.label_output_ratio: Dict[str, float] = {}
+        self.default_output_ratio = 0.4
+        # Optional desired tier per instruction label (overrides the defaults below)
+        self.label_tiers: Dict[str, int] = {}
+        self.initial_min_tier = 2
+        self.short_followup_chars = 500  # Follow-ups shorter than this use tier 1
+        self.followup_output_chars = 2500  # Expected answer length for follow-ups
+        self.max_output_chars = 64000 * 4  # Roughly max_tokens expressed in characters
+
+    def estimate_output_chars(self, prompt_chars: int, is_first: bool, instruction_label: Optional[str]) -> int:
+        """Estimate how many characters the answer will contain"""
+        if not is_first:
+            return self.followup_output_chars
+        ratio = self.label_output_ratio.get(instruction_label)
+        if ratio is None and self.telemetry:
+            ratio = self.telemetry.get_output_ratio(instruction_label)
+        if ratio is None:
+            ratio = self.default_output_ratio
+        return int(min(prompt_chars * ratio, self.max_output_chars))
+
+    def predict_seconds(self, model: str, output_chars: int) -> float:
+        """Predict the total time for a model to produce `output_chars` characters"""
+        stats = self.telemetry.get(model) if self.telemetry else None
+        prior = TIER_PRIORS.get(model_tier(model), TIER_PRIORS[2])
+        ttft = stats['ttft'] if stats else prior['ttft']
+        chars_per_second = (stats.get('chars_per_second') if stats else None) or prior['chars_per_second']
+        return ttft + output_chars / chars_per_second
+
+    def choose(self, prompt_chars: int, last_message_chars: int, is_first: bool,
+               instruction_label: Optional[str] = None) -> Tuple[Optional[str], str]:
+        """Return (model, reason) for a request"""
+        models = self.registry.get_all_models()
+        if self.breaker:
+            healthy = [m for m in models
+                       if not self.breaker.is_open(self.registry.model_to_provider.get(m, ""))]
+            models = healthy or models
+        if not models:
+            return None, "no model available"
+
+        # Desired quality tier and floor for this kind of request
+        if is_first:
+            desired_tier = self.label_tiers.get(instruction_label, 3)
+            floor_tier = min(self.initial_min_tier, desired_tier)
+        elif last_message_chars <= self.short_followup_chars:
+            desired_tier, floor_tier = 1, 1
+        else:
+            desired_tier, floor_tier = 2, 1
+
+        output_chars = self.estimate_output_chars(prompt_chars, is_first, instruction_label)
+        predictions = {m: self.predict_seconds(m, output_chars) for m in models}
+
+        eligible = [m for m in models if floor_tier <= model_tier(m) <= desired_tier] or models
+        within_target = [m for m in eligible if predictions[m] <= self.target_seconds]
+
+        if within_target:
+            # Best quality that meets the target, fastest among equals
+            chosen = max(within_target, key=lambda m: (model_tier(m), -predictions[m]))
+            reason = (f"~{predictions[chosen]:.0f}s predicted for ~{output_chars // 4:,} tokens "
+                      f"(target {self.target_seconds:.0f}s)")
+        else:
+            chosen = min(eligible, key=lambda m: predictions[m])
+            reason = (f"fastest available, ~{predictions[chosen]:.0f}s predicted "
+                      f"(target {self.target_seconds:.0f}s not reachable)")
+
+        if not is_first and desired_tier == 1:
+            reason = "short follow-up, " + reason
+        return chosen, reason
+
+
+class _Attempt:
+    """One in-flight request to a single model"""
+
+    def __init__(self, attempt_id: int, model: str, provider_name: str):
+        self.attempt_id = attempt_id
+        self.model = model
+        self.provider_name = provider_name
+        self.cancelled = threading.Event()
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.finished = False
+
+
+class HedgedRouter:
+    """Routes a request to a primary model with hedging and failover.
+
+    If the primary model produces no first token within `first_token_deadline`
+    seconds, a backup request is launched on another provider. Whichever
+    request streams first wins; the other is cancelled. If a request fails
+    before any text was shown, the router fails over to the backup.
+
+    Provider calls run in worker threads, but `stream_callback` is always
+    invoked on the calling thread so UI code can use it safely.
+    """
+
+    def __init__(self, registry: LLMModelRegistry, first_token_deadline: float = 10.0,
+                 backup_models: Optional[List[str]] = None, breaker: Optional[CircuitBreaker] = None,
+                 poll_interval: float = 0.05, telemetry: Optional[LatencyTelemetry] = None):
+        self.registry = registry
+        self.telemetry = telemetry  # Receives first-token and throughput measurements
+        self.first_token_deadline = first_token_deadline
+        self.backup_models = backup_models or []  # Preferred backups, in order
+        self.breaker = breaker or CircuitBreaker()
+        self.poll_interval = poll_interval
+        self.last_model = None  # Model that served (or was streaming) the most recent request
+
+    def _provider_name(self, model: str) -> Optional[str]:
+        return self.registry.model_to_provider.get(model)
+
+    def pick_backup(self, model: str) -> Optional[str]:
+        """Choose a backup model on a different, healthy provider (to be launched)"""
+        primary_provider = self._provider_name(model)
+        candidates = list(self.backup_models) + self.registry.get_all_models()
+        for candidate in candidates:
+            provider_name = self._provider_name(candidate)
+            if not provider_name or candidate == model:
+                continue
+            if provider_name == primary_provider:
+                continue
+            # Claims the half-open trial of the provider: the candidate is launched
+            if not self.breaker.allow_request(provider_name):
+                continue
+            return candidate
+        return None
+
+    def _start_attempt(self, attempt: _Attempt, events: "queue.Queue", messages: List[Dict[str, str]],
+                       max_tokens: int, stream: bool):
+        """Run one provider call in a worker thread, reporting through the event queue"""
+        provider = self.registry.get_provider_for_model(attempt.model)
+
+        def worker_callback(text_chunk):
+            if attempt.cancelled.is_set():
+                raise RequestCancelled()
+            events.put(("chunk", attempt, text_chunk))
+
+        def run():
+            try:
+                result = provider.send_message(
+                    messages=messages,
+                    model=attempt.model,
+                    max_tokens=max_tokens,
+                    stream=stream,
+                    stream_callback=worker_callback
+                )
+            except RequestCancelled:
+                self.breaker.record_cancelled(attempt.provider_name)
+                events.put(("cancelled", attempt, None))
+                return
+            except Exception as e:
+                # The breaker hears from every attempt, including those nobody waits for anymore
+                if attempt.cancelled.is_set():
+                    self.breaker.record_cancelled(attempt.provider_name)
+                else:
+                    self.breaker.record_failure(attempt.provider_name)
+                events.put(("error", attempt, e))
+                return
+            self.breaker.record_success(attempt.provider_name)
+            events.put(("done", attempt, result))
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+    def send_message(self, messages: List[Dict[str, str]], model: str, max_tokens: int = 64000,
+                     stream: bool = False, stream_callback=None, wait_callback=None,
+                     allow_backup: bool = True) -> str:
+        """Send a message with hedging and failover.
+
+        Same contract as LLMProvider.send_message. `wait_callback` is called on
+        every poll tick while waiting (e.g. to keep a UI responsive). The model
+        that produced the answer is stored in `self.last_model`. With
+        allow_backup=False only `model` is called (no hedge, no failover), for
+        messages built in the format of its provider.
+        """
+        primary_provider = self._provider_name(model)
+        if not primary_provider:
+            raise ValueError(f"No provider found for model: {model}")
+
+        self.last_model = None
+        events = queue.Queue()
+        attempts = []
+
+        def launch(target_model: str) -> _Attempt:
+            attempt = _Attempt(len(attempts), target_model, self._provider_name(target_model))
+            attempts.append(attempt)
+            self._start_attempt(attempt, events, messages, max_tokens, stream)
+            return attempt
+
+        # Skip the primary entirely if its provider's circuit is open
+        if allow_backup and not self.breaker.allow_request(primary_provider):
+            backup = self.pick_backup(model)
+            if backup:
+                primary = launch(backup)
+            else:
+                primary = launch(model)
+        else:
+            primary = launch(model)
+
+        backup_launched = False
+        winner = None
+        last_error = None
+        chunks = []
+
+        try:
+            while True:
+                # Launch the hedge once the primary misses its first-token deadline
+                if allow_backup and winner is None and not backup_launched:
+                    if time.monotonic() - primary.started_at >= self.first_token_deadline:
+                        backup_launched = True
+                        backup = self.pick_backup(primary.model)
+                        if backup:
+                            launch(backup)
+
+                try:
+                    kind, attempt, payload = events.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    if wait_callback:
+                        wait_callback()
+                    continue
+
+                if kind == "chunk":
+                    if winner is None:
+                        winner = attempt
+                        attempt.first_token_at = time.monotonic()
+                        self.last_model = attempt.model
+                        # Cancel every other attempt
+                        for other in attempts:
+                            if other is not attempt:
+                                other.cancelled.set()
+                    if attempt is winner:
+                        chunks.append(payload)
+                        if stream_callback:
+                            stream_callback(payload)
+                    continue
+
+                attempt.finished = True
+
+                if kind == "done":
+                    if winner is None:
+                        # Non-streaming response: the first complete answer wins
+                        winner = attempt
+                        attempt.first_token_at = time.monotonic()
+                        for other in attempts:
+                            if other is not attempt:
+                                other.cancelled.set()
+                        if stream_callback and payload:
+                            stream_callback(payload)
+                    if attempt is winner:
+                        self.last_model = attempt.model
+                        result = payload if payload is not None else "".join(chunks)
+                        # A call that did not stream has no first-token time: its completion
+                        # time would read as an absurd output rate, so it is not recorded
+                        if self.telemetry and chunks:
+                            now = time.monotonic()
+                            self.telemetry.record(
+                                attempt.model,
+                                time_to_first_token=attempt.first_token_at - attempt.started_at,
+                                output_chars=len(result or ""),
+                                total_seconds=now - attempt.started_at
+                            )
+                        return result
+                    continue
+
+                if kind == "cancelled":
+                    continue
+
+                # kind == "error"
+                if attempt is winner:
+                    # Text was already shown to the caller; cannot switch models mid-answer
+                    raise payload
+                last_error = payload
+
+                if winner is None and all(a.finished for a in attempts):
+                    # Fail over immediately if the backup has not been tried yet
+                    if allow_backup and not backup_launched:
+                        backup_launched = True
+                        backup = self.pick_backup(attempt.model)
+                        if backup:
+                            launch(backup)
+                            continue
+                    raise last_error
+        finally:
+            # Every way out (answer, error, or the caller's stream callback raising, e.g. a
+            # client that disconnected) stops the calls still streaming in worker threads
+            for attempt in attempts:
+                attempt.cancelled.set()
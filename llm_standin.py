@@ -0,0 +1,411 @@
+"""
+Local LLM Stand-in Server
+
+A small offline HTTP server that imitates the parts of the Anthropic and
+OpenAI APIs used by llm_providers.py: messages / chat completions (plain and
+streamed), the /v1/responses endpoint, Anthropic Message Batches and the
+OpenAI Files + Batch API. Replies echo the last user message, so masking
+placeholders travel through the round trip exactly like with a real model.
+
+Point the providers at it with base_url, e.g. in private.txt:
+claude_base_url=http://127.0.0.1:8765
+openai_base_url=http://127.0.0.1:8765
+
+Run standalone with: python llm_standin.py --port 8765
+"""
+
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Tuple
+
+
+class StandinState:
+    """Shared state of the stand-in: uploaded files, batches and timing knobs"""
+
+    def __init__(self, first_token_delay: float = 0.0, chunk_delay: float = 0.0,
+                 chunk_size: int = 24, batch_delay: float = 0.0):
+        self.first_token_delay = first_token_delay  # Seconds before the first streamed chunk
+        self.chunk_delay = chunk_delay  # Seconds between streamed chunks
+        self.chunk_size = chunk_size  # Characters per streamed chunk
+        self.batch_delay = batch_delay  # Seconds before a submitted batch ends
+        self.files: Dict[str, str] = {}  # Maps file id -> content
+        self.batches: Dict[str, Dict] = {}  # Maps batch id -> batch record
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock:
+            return f"{prefix}_{next(self.counter):06d}"
+
+
+def make_reply(model: str, messages: List[Dict]) -> str:
+    """Build the deterministic reply for a conversation: echo the last user message"""
+    last_user = ""
+    for message in messages:
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+            last_user = content or ""
+    # An assistant prefix at the end of the conversation is continued, not repeated
+    if messages and messages[-1].get("role") == "assistant":
+        return " (continued)"
+    return f"Stand-in reply from {model}:\n{last_user}"
+
+
+def split_chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Request handler; `self.server.state` holds the StandinState"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
+
+    # ---- helpers -------------------------------------------------------
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self) -> Dict:
+        body = self._read_body()
+        return json.loads(body.decode("utf-8")) if body else {}
+
+    def _send_json(self, data, status: int = 200):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_text(self, text: str, content_type: str = "application/jsonl"):
+        payload = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _sse(self, data, event: Optional[str] = None):
+        lines = ""
+        if event:
+            lines += f"event: {event}\n"
+        lines += f"data: {data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)}\n\n"
+        self.wfile.write(lines.encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream_chunks(self, text: str):
+        """Yield reply chunks with the configured delays"""
+        state = self.server.state
+        if state.first_token_delay:
+            time.sleep(state.first_token_delay)
+        for index, chunk in enumerate(split_chunks(text, state.chunk_size)):
+            if index and state.chunk_delay:
+                time.sleep(state.chunk_delay)
+            yield chunk
+
+    # ---- routing -------------------------------------------------------
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/v1/messages":
+            return self._anthropic_messages()
+        if path == "/v1/messages/batches":
+            return self._anthropic_create_batch()
+        if path == "/v1/chat/completions":
+            return self._openai_chat()
+        if path == "/v1/responses":
+            return self._openai_responses()
+        if path == "/v1/files":
+            return self._openai_upload_file()
+        if path == "/v1/batches":
+            return self._openai_create_batch()
+        self._send_json({"error": {"message": f"Unknown endpoint {path}"}}, status=404)
+
+    def do_GET(self):
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        # /v1/messages/batches/{id}[/results]
+        if parts[:3] == ["v1", "messages", "batches"] and len(parts) >= 4:
+            if len(parts) == 5 and parts[4] == "results":
+                return self._anthropic_batch_results(parts[3])
+            return self._anthropic_get_batch(parts[3])
+        # /v1/batches/{id}
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+            return self._openai_get_batch(parts[2])
+        # /v1/files/{id}/content
+        if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content":
+            content = self.server.state.files.get(parts[2])
+            if content is None:
+                return self._send_json({"error": {"message": "file not found"}}, status=404)
+            return self._send_text(content)
+        self._send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, status=404)
+
+    # ---- Anthropic -----------------------------------------------------
+
+    def _anthropic_message(self, model: str, text: str) -> Dict:
+        return {
+            "id": self.server.state.new_id("msg"),
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 0, "output_tokens": len(text) // 4}
+        }
+
+    def _anthropic_messages(self):
+        request = self._read_json()
+        model = request.get("model", "")
+        text = make_reply(model, request.get("messages", []))
+        if not request.get("stream"):
+            return self._send_json(self._anthropic_message(model, text))
+
+        self._start_sse()
+        start = self._anthropic_message(model, "")
+        start["content"] = []
+        self._sse({"type": "message_start", "message": start}, event="message_start")
+        self._sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                  event="content_block_start")
+        for chunk in self._stream_chunks(text):
+            self._sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}},
+                      event="content_block_delta")
+        self._sse({"type": "content_block_stop", "index": 0}, event="content_block_stop")
+        self._sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                   "usage": {"output_tokens": len(text) // 4}}, event="message_delta")
+        self._sse({"type": "message_stop"}, event="message_stop")
+
+    def _anthropic_batch_record(self, batch: Dict) -> Dict:
+        ended = time.monotonic() - batch["created"] >= self.server.state.batch_delay
+        count = len(batch["requests"])
+        host = self.headers.get("Host", "127.0.0.1")
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0, "canceled": 0, "expired": 0
+            },
+            "results_url": f"http://{host}/v1/messages/batches/{batch['id']}/results" if ended else None
+        }
+
+    def _anthropic_create_batch(self):
+        request = self._read_json()
+        batch = {
+            "id": self.server.state.new_id("msgbatch"),
+            "created": time.monotonic(),
+            "requests": request.get("requests", [])
+        }
+        self.server.state.batches[batch["id"]] = batch
+        self._send_json(self._anthropic_batch_record(batch))
+
+    def _anthropic_get_batch(self, batch_id: str):
+        batch = self.server.state.batches.get(batch_id)
+        if not batch:
+            return self._send_json({"error": {"message": "batch not found"}}, status=404)
+        self._send_json(self._anthropic_batch_record(batch))
+
+    def _anthropic_batch_results(self, batch_id: str):
+        batch = self.server.state.batches.get(batch_id)
+        if not batch:
+            return self._send_json({"error": {"message": "batch not found"}}, status=404)
+        lines = []
+        for item in batch["requests"]:
+            params = item.get("params", {})
+            text = make_reply(params.get("model", ""), params.get("messages", []))
+            lines.append(json.dumps({
+                "custom_id": item.get("custom_id"),
+                "result": {"type": "succeeded", "message": self._anthropic_message(params.get("model", ""), text)}
+            }, ensure_ascii=False))
+        self._send_text("\n".join(lines))
+
+    # ---- OpenAI --------------------------------------------------------
+
+    def _openai_completion(self, model: str, text: str) -> Dict:
+        return {
+            "id": self.server.state.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text) // 4, "total_tokens": len(text) // 4}
+        }
+
+    def _openai_chat(self):
+        request = self._read_json()
+        model = request.get("model", "")
+        text = make_reply(model, request.get("messages", []))
+        if not request.get("stream"):
+            return self._send_json(self._openai_completion(model, text))
+
+        self._start_sse()
+        completion_id = self.server.state.new_id("chatcmpl")
+        for chunk in self._stream_chunks(text):
+            self._sse({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]
+            })
+        self._sse({
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        self._sse("[DONE]")
+
+    def _openai_response_body(self, model: str, input_value) -> Dict:
+        if isinstance(input_value, str):
+            messages = [{"role": "user", "content": input_value}]
+        else:
+            messages = input_value or []
+        text = make_reply(model, messages)
+        return {
+            "id": self.server.state.new_id("resp"),
+            "object": "response",
+            "model": model,
+            "output": [{"type": "message", "role": "assistant",
+                        "content": [{"type": "output_text", "text": text}]}]
+        }
+
+    def _openai_responses(self):
+        request = self._read_json()
+        self._send_json(self._openai_response_body(request.get("model", ""), request.get("input")))
+
+    def _parse_multipart(self) -> Tuple[Dict[str, str], Dict[str, bytes]]:
+        """Split a multipart/form-data body into (fields, files)"""
+        body = self._read_body()
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8")
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(header + body)
+        fields, files = {}, {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                files[name] = payload
+            else:
+                fields[name] = payload.decode("utf-8")
+        return fields, files
+
+    def _openai_upload_file(self):
+        fields, files = self._parse_multipart()
+        content = files.get("file", b"").decode("utf-8")
+        file_id = self.server.state.new_id("file")
+        self.server.state.files[file_id] = content
+        self._send_json({"id": file_id, "object": "file", "purpose": fields.get("purpose"), "bytes": len(content)})
+
+    def _openai_batch_record(self, batch: Dict) -> Dict:
+        state = self.server.state
+        ended = time.monotonic() - batch["created"] >= state.batch_delay
+        if ended and not batch.get("output_file_id"):
+            # Produce the output file the first time the batch is seen as completed
+            lines = []
+            for line in state.files.get(batch["input_file_id"], "").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                body = item.get("body", {})
+                model = body.get("model", "")
+                if batch["endpoint"] == "/v1/responses":
+                    response_body = self._openai_response_body(model, body.get("input"))
+                else:
+                    response_body = self._openai_completion(model, make_reply(model, body.get("messages", [])))
+                lines.append(json.dumps({
+                    "id": state.new_id("batch_req"),
+                    "custom_id": item.get("custom_id"),
+                    "response": {"status_code": 200, "body": response_body},
+                    "error": None
+                }, ensure_ascii=False))
+            output_file_id = state.new_id("file")
+            state.files[output_file_id] = "\n".join(lines)
+            batch["output_file_id"] = output_file_id
+            batch["total"] = len(lines)
+        return {
+            "id": batch["id"],
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "status": "completed" if ended else "in_progress",
+            "input_file_id": batch["input_file_id"],
+            "output_file_id": batch.get("output_file_id"),
+            "error_file_id": None,
+            "request_counts": {
+                "total": batch.get("total", 0),
+                "completed": batch.get("total", 0) if ended else 0,
+                "failed": 0
+            }
+        }
+
+    def _openai_create_batch(self):
+        request = self._read_json()
+        batch = {
+            "id": self.server.state.new_id("batch"),
+            "created": time.monotonic(),
+            "input_file_id": request.get("input_file_id"),
+            "endpoint": request.get("endpoint", "/v1/chat/completions")
+        }
+        self.server.state.batches[batch["id"]] = batch
+        self._send_json(self._openai_batch_record(batch))
+
+    def _openai_get_batch(self, batch_id: str):
+        batch = self.server.state.batches.get(batch_id)
+        if not batch:
+            return self._send_json({"error": {"message": "batch not found"}}, status=404)
+        self._send_json(self._openai_batch_record(batch))
+
+
+def start_standin_server(host: str = "127.0.0.1", port: int = 0, **state_options) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stand-in in a background thread. Returns (server, base_url).
+
+    Use port=0 to pick a free port. Call server.shutdown() when done.
+    """
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(**state_options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Anthropic and OpenAI APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--batch-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(
+        first_token_delay=args.first_token_delay,
+        chunk_delay=args.chunk_delay,
+        batch_delay=args.batch_delay
+    )
+    print(f"LLM stand-in listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
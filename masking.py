@@ -0,0 +1,724 @@
+"""
+Masking Utilities
+
+Helpers for the name masking pipeline that do not depend on the GUI:
+accent- and case-insensitive name search (sharded over a process pool for
+very large texts), a compact columnar store for masked occurrences,
+remapping of stored spans through an edit of the text, and restoration of
+placeholders such as [NAME_3] back to the original names in one pass, on
+full texts as well as on streamed chunks.
+"""
+
+import difflib
+import heapq
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from array import array
+from itertools import compress
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from bisect import bisect_left
+from collections import Counter
+from typing import List, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+# Matches a complete placeholder such as [NAME_12]
+PLACEHOLDER_PATTERN = re.compile(r'\[[A-Z]+_\d+\]')
+# Matches a placeholder cut off at the end of a chunk, e.g. "[NAM" or "[NAME_1"
+PARTIAL_PLACEHOLDER_PATTERN = re.compile(r'\[(?:[A-Z]+(?:_\d*)?)?$')
+
+
+def normalize_char(char: str) -> str:
+    """Normalize one character: remove accents and convert to lowercase"""
+    nfd = unicodedata.normalize('NFD', char)
+    return ''.join(c for c in nfd if unicodedata.category(c) != 'Mn').lower()
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text to remove accents and convert to lowercase for comparison"""
+    # Remove accents
+    nfd = unicodedata.normalize('NFD', text)
+    text_no_accents = ''.join(c for c in nfd if unicodedata.category(c) != 'Mn')
+    return text_no_accents.lower()
+
+
+class NormalizedText:
+    """A text together with its normalized form and the position mapping between them.
+
+    Characters are normalized one at a time (one lookup per distinct
+    character), so every normalized position maps back to exactly one
+    original position. When every character normalizes to exactly one
+    character, which is the usual case for French text, the text is
+    normalized with a single str.translate call and the mapping is the
+    identity and is not stored.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.position_map: Optional[array] = None  # Maps normalized index -> original index
+        table = {ord(char): normalize_char(char) for char in set(text)}
+        if all(len(normalized) == 1 for normalized in table.values()):
+            self.normalized = text.translate(table)
+            return
+
+        normalized_chars = [table[ord(char)] for char in text]
+        self.normalized = ''.join(normalized_chars)
+        position_map = array('q')
+        for orig_pos, normalized in enumerate(normalized_chars):
+            for _ in range(len(normalized)):
+                position_map.append(orig_pos)
+        self.position_map = position_map
+
+    def __len__(self) -> int:
+        return len(self.normalized)
+
+    def to_original(self, normalized_pos: int) -> int:
+        """Map a position in the normalized text back to the original text"""
+        if self.position_map is None:
+            return normalized_pos
+        return self.position_map[normalized_pos]
+
+
+def name_pattern(name: str) -> str:
+    """Regex (over normalized text) matching a single- or multi-word name"""
+    normalized_name = normalize_text(name)
+    if ' ' in name:
+        # For multi-word names, match the entire phrase with word boundaries at start and end
+        # Replace escaped spaces with \s+ to handle variable whitespace
+        return r'\b' + re.escape(normalized_name).replace(r'\ ', r'\s+') + r'\b'
+    # For single-word names, use word boundaries
+    return r'\b' + re.escape(normalized_name) + r'\b'
+
+
+def _is_name_char(char: str) -> bool:
+    return char.isalnum() or char in "'-"
+
+
+def _original_span(index: NormalizedText, norm_start: int, norm_end: int,
+                   normalized_words: List[str]) -> Tuple[int, int]:
+    """Map a match in the normalized text to the span of the whole name in the original text"""
+    text = index.text
+    orig_start = index.to_original(norm_start)
+    orig_end = index.to_original(norm_end - 1) + 1
+
+    if len(normalized_words) > 1:
+        # Find the exact end of the phrase in the original text by matching word by word
+        i = orig_start
+        phrase_end = orig_start
+        word_count = 0
+        # Skip leading whitespace
+        while i < len(text) and text[i].isspace():
+            i += 1
+        for normalized_word in normalized_words:
+            if i >= len(text):
+                break
+            word_start = i
+            while i < len(text) and _is_name_char(text[i]):
+                i += 1
+            if normalize_text(text[word_start:i]) == normalized_word:
+                word_count += 1
+                phrase_end = i
+                # Skip whitespace between words
+                while i < len(text) and text[i].isspace():
+                    i += 1
+            else:
+                break
+        # If we matched all words, use the phrase end (otherwise keep the mapped end)
+        if word_count == len(normalized_words):
+            orig_end = phrase_end
+    else:
+        # For single-word names, find the end of the word
+        word_end = orig_start
+        while word_end < len(text) and _is_name_char(text[word_end]):
+            word_end += 1
+        orig_end = word_end
+    return orig_start, orig_end
+
+
+def find_name_occurrences(index: NormalizedText, name: str) -> List[Tuple[int, int, str]]:
+    """Find all occurrences of a name ignoring case and accents.
+    Returns list of (start_pos, end_pos, original_text) tuples.
+    Handles both single-word and multi-word names (e.g., "John" or "John Smith")."""
+    text = index.text
+    normalized_words = [normalize_text(word) for word in name.split()]
+    results = []
+
+    for match in re.finditer(name_pattern(name), index.normalized):
+        if match.end() == 0:
+            continue
+        orig_start, orig_end = _original_span(index, match.start(), match.end(), normalized_words)
+        if orig_start < len(text) and orig_end <= len(text):
+            results.append((orig_start, orig_end, text[orig_start:orig_end]))
+
+    return results
+
+
+def _can_overlap(first: str, second: str) -> bool:
+    """Whether a match of the key `second` can start inside a match of the key `first`
+    (or at its start) in a text, the pattern of both being bounded by \\b"""
+    for i in range(len(first)):
+        if i and _is_word_char(first[i - 1]) == _is_word_char(second[0]):
+            continue  # No word boundary there
+        rest = first[i:]
+        if len(second) > len(rest):
+            if second.startswith(rest):
+                return True
+        elif rest.startswith(second) and rest != second:
+            if _is_word_char(second[-1]) != _is_word_char(rest[len(second)]):
+                return True
+        elif i and rest == second:
+            return True
+    return False
+
+
+class NameMatcher:
+    """One compiled pattern matching any of a fixed list of names.
+
+    Returns, for each name, the same occurrences as find_name_occurrences,
+    so callers resolve overlaps in list order exactly as mask_names does
+    (earlier names win). Names that can never overlap another one are found
+    in a single scan of the normalized text; the few that can (e.g. "Dupont"
+    and "Jean Dupont") would hide each other in that scan and are searched
+    one by one.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        self.keys: Dict[str, int] = {}  # Whitespace-collapsed normalized name -> index in names
+        for i, name in enumerate(self.names):
+            key = ' '.join(normalize_text(name).split())
+            if key:
+                self.keys.setdefault(key, i)
+        overlapping = {key for key in self.keys for other in self.keys
+                       if key != other and (_can_overlap(key, other) or _can_overlap(other, key))}
+        self.separate_names = [self.names[i] for key, i in self.keys.items() if key in overlapping]
+        alternatives = sorted((key for key in self.keys if key not in overlapping), key=len, reverse=True)
+        self.pattern = None
+        if alternatives:
+            self.pattern = re.compile(r'\b(?:' + '|'.join(
+                re.escape(key).replace(r'\ ', r'\s+') for key in alternatives) + r')\b')
+
+    def find(self, text: str) -> Dict[str, List[Tuple[int, int, str]]]:
+        """Return the occurrences of every name, as find_names does"""
+        results: Dict[str, List[Tuple[int, int, str]]] = {name: [] for name in self.names}
+        if self.pattern is None and not self.separate_names:
+            return results
+        index = NormalizedText(text)
+        if self.pattern is not None:
+            for match in self.pattern.finditer(index.normalized):
+                if match.end() == 0:
+                    continue
+                key = ' '.join(match.group().split())
+                name = self.names[self.keys[key]]
+                orig_start, orig_end = _original_span(index, match.start(), match.end(), key.split())
+                if orig_start < len(text) and orig_end <= len(text):
+                    results[name].append((orig_start, orig_end, text[orig_start:orig_end]))
+        for name in self.separate_names:
+            results[name] = find_name_occurrences(index, name)
+        return results
+
+
+def find_word_position(text: str, word: str) -> Optional[int]:
+    """Find the first occurrence of a word ignoring case and accents"""
+    index = NormalizedText(text)
+    match = re.search(r'\b' + re.escape(normalize_text(word)) + r'\b', index.normalized)
+    if match and match.start() < len(index):
+        return index.to_original(match.start())
+    return None
+
+
+# ---- PII scanner ---------------------------------------------------------
+
+_MONTHS = r'janvier|f[ée]vrier|mars|avril|mai|juin|juillet|ao[uû]t|septembre|octobre|novembre|d[ée]cembre'
+_DATE = rf'\d{{1,2}}[/.-]\d{{1,2}}[/.-]\d{{2,4}}|\d{{1,2}}(?:er)?\s+(?i:{_MONTHS})\s+\d{{4}}'
+_STREET_TYPES = (r'rue|avenue|av\.|boulevard|bd|place|chemin|impasse|all[ée]e|route|quai|cours|square'
+                 r'|r[ée]sidence|lotissement|lieu-dit')
+
+# Category -> pattern. Each pattern holds exactly one group named after its
+# category, which is the span to mask (surrounding context is not masked).
+# Order matters: earlier categories win when two could match at one position.
+PII_PATTERNS = {
+    "EMAIL": r'(?P<EMAIL>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)',
+    # French social security number: sex, year, month, department, commune, order, optional key
+    "NIR": r'(?<![\d])(?P<NIR>[12] ?\d{2} ?(?:0[1-9]|1[0-2]|[2-9]\d) ?(?:\d{2}|2[ABab]) ?\d{3} ?\d{3}(?: ?\d{2})?)(?!\d)',
+    "PHONE": r'(?<![\d+])(?P<PHONE>(?:\+33 ?(?:\(0\) ?)?|0033 ?|0)[1-9](?:[ .-]?\d{2}){4})(?!\d)',
+    # Date of birth: a date introduced by "né(e) le" or "date de naissance"
+    "DOB": rf'(?i:\bn[ée]e?\s+le|\bdate\s+de\s+naissance\s*:?)\s+(?P<DOB>{_DATE})',
+    # Street address, optionally followed by postcode and city
+    "ADDRESS": (rf'(?P<ADDRESS>\b\d{{1,4}}(?: ?(?:bis|ter))?,? +(?i:{_STREET_TYPES})\s[^\n,;]{{2,60}}?'
+                r"(?:,? +\d{5} +[A-ZÀ-Þ][\w'-]*(?:[ -][A-ZÀ-Þ][\w'-]*)*|(?=[,;\n]|\.\s|$)))"),
+}
+
+PII_CATEGORIES = list(PII_PATTERNS)  # All categories, in matching priority order
+
+
+@lru_cache(maxsize=32)
+def compile_pii_pattern(categories: Tuple[str, ...]) -> "re.Pattern":
+    """Combine the patterns of the given categories into one compiled alternation"""
+    ordered = [category for category in PII_CATEGORIES if category in categories]
+    return re.compile("|".join(f"(?:{PII_PATTERNS[category]})" for category in ordered))
+
+
+def pii_key(category: str, value: str) -> str:
+    """Canonical key of a PII value, so different spellings share one placeholder"""
+    if category in ("PHONE", "NIR"):
+        canonical = re.sub(r'[^0-9A-Za-z+]', '', value).upper()
+        if category == "PHONE":
+            canonical = re.sub(r'^(?:\+33(?:0)?|0033)', '0', canonical.replace('(0)', ''))
+    else:
+        canonical = ' '.join(normalize_text(value).split())
+    return f"{category.lower()}:{canonical}"
+
+
+def scan_pii(text: str, categories: Iterable[str] = PII_CATEGORIES) -> List[Tuple[int, int, str, str]]:
+    """Find PII in one pass over the text.
+    Returns (start, end, category, key) tuples in text order."""
+    categories = tuple(category for category in PII_CATEGORIES if category in set(categories))
+    if not categories:
+        return []
+    results = []
+    for match in compile_pii_pattern(categories).finditer(text):
+        category = match.lastgroup
+        start, end = match.span(category)
+        results.append((start, end, category, pii_key(category, text[start:end])))
+    return results
+
+
+# ---- sharded search for very large texts --------------------------------
+
+_masking_pool: Optional[ProcessPoolExecutor] = None
+_masking_pool_workers = 0
+
+
+def get_masking_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared process pool used for sharded masking (created on first use)"""
+    global _masking_pool, _masking_pool_workers
+    if _masking_pool is None or _masking_pool_workers != workers:
+        if _masking_pool is not None:
+            _masking_pool.shutdown(wait=False)
+        _masking_pool = ProcessPoolExecutor(max_workers=workers)
+        _masking_pool_workers = workers
+    return _masking_pool
+
+
+def discard_masking_pool():
+    """Drop the shared pool (e.g. after a worker died); the next search creates a new one"""
+    global _masking_pool, _masking_pool_workers
+    if _masking_pool is not None:
+        _masking_pool.shutdown(wait=False, cancel_futures=True)
+    _masking_pool = None
+    _masking_pool_workers = 0
+
+
+def shard_boundaries(text: str, shard_count: int, overlap: int) -> List[Tuple[int, int, int]]:
+    """Split text at paragraph boundaries into (core_start, core_end, read_end) shards.
+
+    Each shard owns the matches starting in [core_start, core_end) and reads
+    `overlap` characters further (up to the next whitespace) so that a
+    multi-word name crossing the boundary is still found whole.
+    """
+    length = len(text)
+    target = max(1, length // max(1, shard_count))
+    starts = [0]
+    while True:
+        cut = text.find("\n", starts[-1] + target)
+        if cut == -1 or cut + 1 >= length:
+            break
+        starts.append(cut + 1)
+    shards = []
+    for index, core_start in enumerate(starts):
+        core_end = starts[index + 1] if index + 1 < len(starts) else length
+        read_end = min(length, core_end + overlap)
+        while read_end < length and not text[read_end].isspace():
+            read_end += 1
+        shards.append((core_start, core_end, read_end))
+    return shards
+
+
+def _find_names_in_shard(shard_text: str, offset: int, core_length: int,
+                         names: Sequence[str]) -> Dict[str, List[Tuple[int, int, str]]]:
+    """Worker: search all names in one shard and return matches in document positions"""
+    index = NormalizedText(shard_text)
+    results = {}
+    for name in names:
+        results[name] = [(start + offset, end + offset, original)
+                         for start, end, original in find_name_occurrences(index, name)
+                         if start < core_length]
+    return results
+
+
+def find_names(text: str, names: Sequence[str], workers: int = 1,
+               parallel_threshold: int = 2_000_000) -> Dict[str, List[Tuple[int, int, str]]]:
+    """Find the occurrences of several names, normalizing the text only once.
+
+    Texts larger than `parallel_threshold` characters are split at paragraph
+    boundaries and searched in a process pool of `workers` processes. The
+    merged result is identical to a sequential search: for each name, the
+    occurrences in text order.
+    """
+    if not names:
+        return {}
+    if workers <= 1 or len(text) < parallel_threshold:
+        index = NormalizedText(text)
+        return {name: find_name_occurrences(index, name) for name in names}
+
+    # Overlap long enough for the longest name even with extra whitespace
+    overlap = 2 * max(len(name) for name in names) + 16
+    shards = shard_boundaries(text, workers * 2, overlap)
+    merged: Dict[str, List[Tuple[int, int, str]]] = {name: [] for name in names}
+    try:
+        pool = get_masking_pool(workers)
+        futures = [pool.submit(_find_names_in_shard, text[core_start:read_end], core_start,
+                               core_end - core_start, list(names))
+                   for core_start, core_end, read_end in shards]
+        for future in futures:  # Shards are in text order, so the merge stays sorted
+            for name, occurrences in future.result().items():
+                merged[name].extend(occurrences)
+    except BrokenProcessPool as e:
+        # A worker process died (e.g. killed when memory ran out): the pool is
+        # unusable, so it is replaced on the next search and this one runs here
+        print(f"Warning: Masking worker pool failed ({e}); searching in a single process")
+        discard_masking_pool()
+        index = NormalizedText(text)
+        return {name: find_name_occurrences(index, name) for name in names}
+    return merged
+
+
+def default_masking_workers() -> int:
+    """Number of worker processes for sharded masking"""
+    return max(1, os.cpu_count() or 1)
+
+
+# Above this size, the changed middle of an edit is diffed line by line first
+CHAR_DIFF_LIMIT = 20000
+
+
+def _char_opcodes(old: str, new: str, old_offset: int, new_offset: int) -> List[Tuple[str, int, int, int, int]]:
+    """Character-level opcodes for two small strings, shifted by the given offsets"""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [(tag, i1 + old_offset, i2 + old_offset, j1 + new_offset, j2 + new_offset)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()]
+
+
+def text_diff_opcodes(old: str, new: str) -> List[Tuple[str, int, int, int, int]]:
+    """Return difflib-style opcodes (tag, i1, i2, j1, j2) turning `old` into `new`.
+
+    The common prefix and suffix are stripped first, so the cost depends on
+    the size of the edited region rather than the size of the document.
+    Large edited regions are diffed by lines, then by characters inside
+    small replaced blocks.
+    """
+    if old == new:
+        return [("equal", 0, len(old), 0, len(new))] if old else []
+
+    # Common prefix and suffix
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+        suffix += 1
+
+    old_mid = old[prefix:len(old) - suffix]
+    new_mid = new[prefix:len(new) - suffix]
+
+    opcodes = []
+    if prefix:
+        opcodes.append(("equal", 0, prefix, 0, prefix))
+
+    if len(old_mid) <= CHAR_DIFF_LIMIT and len(new_mid) <= CHAR_DIFF_LIMIT:
+        opcodes.extend(_char_opcodes(old_mid, new_mid, prefix, prefix))
+    else:
+        # Line-level diff, refined to characters inside small replaced blocks
+        old_lines = old_mid.splitlines(keepends=True)
+        new_lines = new_mid.splitlines(keepends=True)
+        old_starts = [prefix]
+        for line in old_lines:
+            old_starts.append(old_starts[-1] + len(line))
+        new_starts = [prefix]
+        for line in new_lines:
+            new_starts.append(new_starts[-1] + len(line))
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            a1, a2, b1, b2 = old_starts[i1], old_starts[i2], new_starts[j1], new_starts[j2]
+            if tag == "replace" and a2 - a1 <= CHAR_DIFF_LIMIT and b2 - b1 <= CHAR_DIFF_LIMIT:
+                opcodes.extend(_char_opcodes(old[a1:a2], new[b1:b2], a1, b1))
+            else:
+                opcodes.append((tag, a1, a2, b1, b2))
+
+    if suffix:
+        opcodes.append(("equal", len(old) - suffix, len(old), len(new) - suffix, len(new)))
+    return [op for op in opcodes if op[1] != op[2] or op[3] != op[4]]
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class OccurrenceStore:
+    """Columnar store of masked occurrences.
+
+    Occurrences are kept sorted by start position in three parallel integer
+    arrays (start, length, name slot) instead of one dict per occurrence.
+    The name table holds one row per masked name or PII value:
+    {'normalized_name', 'original_name', 'category', 'id', 'masked'}.
+    IDs are numbered per category ([NAME_1], [PHONE_1], ...).
+    The original spelling of an occurrence is not stored; it is read back
+    from the text the spans refer to.
+    """
+
+    def __init__(self):
+        self.starts = array('q')
+        self.lengths = array('q')
+        self.slots = array('l')  # Index into self.names for each occurrence
+        self.names: List[Optional[Dict]] = []  # Name table; removed names leave None
+        self.name_index: Dict[str, int] = {}  # Maps normalized name -> slot
+        self.reserved_ids = Counter()  # Category -> highest ID used elsewhere (e.g. by a profile)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def clear(self):
+        """Remove all names and occurrences"""
+        self.__init__()
+
+    # ---- names ---------------------------------------------------------
+
+    def add_name(self, normalized_name: str, original_name: str, category: str = "NAME",
+                 name_id: Optional[int] = None) -> int:
+        """Add a name (or PII value) to the table and return its slot.
+        Without an explicit ID it gets the next free ID of its category."""
+        if name_id is None:
+            name_id = self.next_id(category)
+        slot = len(self.names)
+        self.names.append({
+            'normalized_name': normalized_name,
+            'original_name': original_name,  # Keep original for display
+            'category': category,
+            'id': name_id,
+            'masked': f"[{category}_{name_id}]"
+        })
+        self.name_index[normalized_name] = slot
+        return slot
+
+    def next_id(self, category: str) -> int:
+        """Next free ID of a category (above the IDs in use and the reserved ones)"""
+        return max([self.names[slot]['id'] for slot in self.name_index.values()
+                    if self.names[slot]['category'] == category] + [self.reserved_ids[category]]) + 1
+
+    def set_id(self, slot: int, name_id: int):
+        """Give a masked name another ID (the caller keeps IDs unique within the category)"""
+        info = self.names[slot]
+        info['id'] = name_id
+        info['masked'] = f"[{info['category']}_{name_id}]"
+
+    def get_slot(self, normalized_name: str) -> Optional[int]:
+        """Return the slot of a masked name, or None"""
+        return self.name_index.get(normalized_name)
+
+    def slots_by_id(self) -> List[int]:
+        """Return the slots of all masked names, ordered by category (names first) and ID"""
+        def sort_key(slot):
+            info = self.names[slot]
+            return info['category'] != "NAME", info['category'], info['id']
+        return sorted(self.name_index.values(), key=sort_key)
+
+    def counts(self) -> Counter:
+        """Group by name: number of occurrences per slot"""
+        return Counter(self.slots)
+
+    def remove_name(self, slot: int):
+        """Remove a name and all of its occurrences"""
+        self.remove_names([slot])
+
+    def remove_names(self, slots: Iterable[int]):
+        """Remove several names and all of their occurrences in one pass over the columns
+        (removing them one by one would rebuild the columns once per name)"""
+        removed = set(slots)
+        keep = [slot not in removed for slot in self.slots]
+        self.starts = array('q', compress(self.starts, keep))
+        self.lengths = array('q', compress(self.lengths, keep))
+        self.slots = array('l', compress(self.slots, keep))
+        for slot in removed:
+            info = self.names[slot]
+            self.names[slot] = None
+            del self.name_index[info['normalized_name']]
+
+    def renumber(self):
+        """Reassign IDs so they are sequential again within each category (after a removal)"""
+        next_ids = Counter()
+        for slot in self.slots_by_id():
+            info = self.names[slot]
+            next_ids[info['category']] += 1
+            self.set_id(slot, next_ids[info['category']])
+
+    # ---- occurrences ---------------------------------------------------
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Check whether [start, end) overlaps any stored occurrence"""
+        index = bisect_left(self.starts, start)
+        if index < len(self.starts) and self.starts[index] < end:
+            return True
+        if index > 0 and self.starts[index - 1] + self.lengths[index - 1] > start:
+            return True
+        return False
+
+    def add_occurrences(self, slot: int, spans: Iterable[Tuple[int, int]]):
+        """Insert (start, end) spans for a name, keeping the columns sorted"""
+        new_rows = [(start, end - start, slot) for start, end in sorted(spans)]
+        if not new_rows:
+            return
+        if not self.starts or new_rows[0][0] >= self.starts[-1]:
+            # Common case: appending after the last stored occurrence
+            for start, length, row_slot in new_rows:
+                self.starts.append(start)
+                self.lengths.append(length)
+                self.slots.append(row_slot)
+            return
+        # Single merge pass over the existing columns and the new rows
+        merged = list(heapq.merge(zip(self.starts, self.lengths, self.slots), new_rows))
+        self.starts = array('q', (row[0] for row in merged))
+        self.lengths = array('q', (row[1] for row in merged))
+        self.slots = array('l', (row[2] for row in merged))
+
+    def __iter__(self) -> Iterator[Tuple[int, int, int]]:
+        """Iterate (start, length, slot) in text order"""
+        return zip(self.starts, self.lengths, self.slots)
+
+    def remap(self, opcodes: List[Tuple[str, int, int, int, int]], new_text: str) -> List[Tuple[int, int]]:
+        """Move every stored span through an edit described by diff opcodes.
+
+        Spans that lie entirely in unchanged text are shifted to their new
+        position; spans touched by the edit are dropped. Shifted spans next
+        to an edit are re-validated (the edit may have glued a letter to the
+        name). Returns the edited regions as (start, end) in `new_text`, so
+        the caller can rescan only those regions.
+        """
+        edited_regions = [(j1, j2) for tag, i1, i2, j1, j2 in opcodes if tag != "equal"]
+        equal_blocks = [(i1, i2, j1) for tag, i1, i2, j1, j2 in opcodes if tag == "equal"]
+
+        starts, lengths, slots = array('q'), array('q'), array('l')
+        block_index = 0
+        for start, length, slot in self:
+            end = start + length
+            while block_index < len(equal_blocks) and equal_blocks[block_index][1] <= start:
+                block_index += 1
+            if block_index == len(equal_blocks):
+                break
+            i1, i2, j1 = equal_blocks[block_index]
+            if start < i1 or end > i2:
+                continue  # Span touched by the edit: rescanned by the caller
+            new_start = start - i1 + j1
+            new_end = new_start + length
+            # Re-validate word boundaries where the span touches an edited region
+            if start == i1 and new_start > 0 and _is_word_char(new_text[new_start - 1]):
+                continue
+            if end == i2 and new_end < len(new_text) and _is_word_char(new_text[new_end]):
+                continue
+            starts.append(new_start)
+            lengths.append(length)
+            slots.append(slot)
+
+        self.starts, self.lengths, self.slots = starts, lengths, slots
+        return edited_regions
+
+    def masked_label(self, slot: int) -> str:
+        return self.names[slot]['masked']
+
+    def replacements(self) -> Iterator[Tuple[int, int, str]]:
+        """Iterate (start, length, placeholder) in text order"""
+        names = self.names
+        for start, length, slot in self:
+            yield start, length, names[slot]['masked']
+
+
+class PlaceholderRestorer:
+    """Restores placeholders to display names with a single compiled matcher.
+
+    `table` maps each placeholder (its ID, e.g. "[NAME_3]") to one canonical
+    display spelling. Restoration is one linear pass over the text regardless
+    of how many names or occurrences were masked. Unknown placeholders are
+    left untouched.
+    """
+
+    def __init__(self, table: Dict[str, str]):
+        self.table = dict(table)
+
+    @classmethod
+    def from_changes(cls, changes: Iterable[Dict]) -> "PlaceholderRestorer":
+        """Build the table from occurrence changes ('masked' and 'original' keys).
+
+        The canonical spelling of a name is its most frequent spelling in the
+        text; ties go to the spelling that appears first.
+        """
+        spellings: Dict[str, Counter] = {}
+        first_seen: Dict[str, Dict[str, int]] = {}
+        for change in sorted(changes, key=lambda c: c['position']):
+            masked = change['masked']
+            original = change['original']
+            spellings.setdefault(masked, Counter())[original] += 1
+            first_seen.setdefault(masked, {}).setdefault(original, change['position'])
+
+        table = {}
+        for masked, counts in spellings.items():
+            table[masked] = max(counts, key=lambda spelling: (counts[spelling], -first_seen[masked][spelling]))
+        return cls(table)
+
+    @classmethod
+    def from_store(cls, store: OccurrenceStore, text: str) -> "PlaceholderRestorer":
+        """Build the table from an occurrence store and the text its spans refer to"""
+        spellings: Dict[int, Counter] = {}
+        for start, length, slot in store:
+            # Counter keeps first-insertion order, so ties go to the first spelling
+            spellings.setdefault(slot, Counter())[text[start:start + length]] += 1
+        table = {}
+        for slot, counts in spellings.items():
+            table[store.masked_label(slot)] = counts.most_common(1)[0][0]
+        return cls(table)
+
+    def _replace(self, match) -> str:
+        placeholder = match.group(0)
+        return self.table.get(placeholder, placeholder)
+
+    def restore(self, text: str) -> str:
+        """Restore all placeholders in a complete text"""
+        if not self.table or not text:
+            return text
+        return PLACEHOLDER_PATTERN.sub(self._replace, text)
+
+    def stream(self) -> "StreamingRestorer":
+        """Return a restorer for text that arrives in chunks"""
+        return StreamingRestorer(self)
+
+
+class StreamingRestorer:
+    """Restores placeholders in streamed chunks.
+
+    A placeholder can be split across two chunks ("[NAM" + "E_1]"), so any
+    trailing text that could still become a placeholder is held back until
+    the next chunk (or flush()) completes it.
+    """
+
+    def __init__(self, restorer: PlaceholderRestorer):
+        self.restorer = restorer
+        self.pending = ""
+
+    def feed(self, text_chunk: str) -> str:
+        """Consume a chunk and return the restored text that is now final"""
+        text = self.pending + text_chunk
+        match = PARTIAL_PLACEHOLDER_PATTERN.search(text)
+        if match:
+            self.pending = text[match.start():]
+            text = text[:match.start()]
+        else:
+            self.pending = ""
+        return self.restorer.restore(text)
+
+    def flush(self) -> str:
+        """Return whatever is still held back at the end of the stream"""
+        text = self.restorer.restore(self.pending)
+        self.pending = ""
+        return text
+
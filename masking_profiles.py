@@ -0,0 +1,175 @@
+"""
+Masking Profiles
+
+A profile holds what is masked for one case: the names, the masked PII
+values and the PII categories to scan, each with the ID it was given. Every
+document of the case is masked with the same placeholders, so prompts and
+outputs that combine several documents line up ([NAME_3] is the same person
+everywhere).
+
+Profiles are stored locally in a JSON file. They contain real names and
+identifiers and must never be sent anywhere.
+"""
+
+import json
+import os
+import time
+from typing import List, Dict, Optional
+
+from masking import NameMatcher, OccurrenceStore, scan_pii
+
+
+class ProfileStore:
+    """Loads, saves and applies masking profiles, caching one compiled matcher per profile"""
+
+    def __init__(self, file_path: str = "masking_profiles.json"):
+        self.file_path = file_path
+        self.profiles: Dict[str, Dict] = {}
+        self.matchers: Dict[str, NameMatcher] = {}  # Profile name -> matcher for its current name list
+
+    def load(self):
+        """Load profiles from the JSON file"""
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.profiles = json.load(f).get("profiles", {})
+        except Exception as e:
+            print(f"Warning: Could not load masking profiles: {e}")
+            self.profiles = {}
+        self.matchers = {}
+
+    def save(self):
+        """Write all profiles atomically"""
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"profiles": self.profiles}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.file_path)
+
+    def profile_names(self) -> List[str]:
+        return sorted(self.profiles)
+
+    def get_matcher(self, profile_name: str) -> NameMatcher:
+        """Compiled matcher for the profile's names (rebuilt only when the name list changed)"""
+        names = [entry["name"] for entry in self.profiles[profile_name]["names"]]
+        matcher = self.matchers.get(profile_name)
+        if matcher is None or matcher.names != names:
+            matcher = NameMatcher(names)
+            self.matchers[profile_name] = matcher
+        return matcher
+
+    def update_from_store(self, profile_name: str, store: OccurrenceStore,
+                          pii_categories: Optional[List[str]] = None):
+        """Add the names and PII values masked in a document to a profile (created if needed).
+        Entries already in the profile keep their ID; a new entry keeps the document's ID unless
+        the profile already gives it to someone else, in which case it gets the next free one.
+        The store is then renumbered to the profile's IDs, so its placeholders match the profile
+        (the caller rebuilds the masked text)."""
+        profile = self.profiles.setdefault(profile_name, {"names": [], "pii_values": [], "pii_categories": []})
+        known = {entry["normalized"] for entry in profile["names"]}
+        known.update(entry["key"] for entry in profile["pii_values"])
+        used_ids = {}  # Category -> IDs the profile gives
+        for entry in profile["names"]:
+            used_ids.setdefault("NAME", set()).add(entry["id"])
+        for entry in profile["pii_values"]:
+            used_ids.setdefault(entry["category"], set()).add(entry["id"])
+        store_ids = {}  # Category -> IDs in the document, avoided for renumbered entries
+        for slot in store.slots_by_id():
+            store_ids.setdefault(store.names[slot]['category'], set()).add(store.names[slot]['id'])
+        for slot in store.slots_by_id():
+            info = store.names[slot]
+            if info['normalized_name'] in known:
+                continue
+            # The document may not have been masked with this profile: its IDs can clash
+            ids = used_ids.setdefault(info['category'], set())
+            name_id = info['id'] if info['id'] not in ids else max(ids | store_ids[info['category']]) + 1
+            ids.add(name_id)
+            if info['category'] == "NAME":
+                profile["names"].append({"name": info['original_name'], "normalized": info['normalized_name'],
+                                         "id": name_id})
+            else:
+                profile["pii_values"].append({"key": info['normalized_name'], "original": info['original_name'],
+                                              "category": info['category'], "id": name_id})
+        if pii_categories is not None:
+            profile["pii_categories"] = list(pii_categories)
+        profile["updated"] = time.time()
+        self.reserve_ids(profile_name, store)
+        self.save()
+
+    def reserve_ids(self, profile_name: str, store: OccurrenceStore):
+        """Reserve the profile's IDs in a store, so names added by hand never reuse them.
+        Names already masked in the store take their profile ID, and any other name holding
+        an ID the profile gives to someone else is renumbered above the profile's IDs."""
+        profile = self.profiles[profile_name]
+        profile_ids = {("NAME", entry["normalized"]): entry["id"] for entry in profile["names"]}
+        profile_ids.update(((entry["category"], entry["key"]), entry["id"]) for entry in profile["pii_values"])
+        for (category, _), name_id in profile_ids.items():
+            store.reserved_ids[category] = max(store.reserved_ids[category], name_id)
+
+        # Two people must never share a placeholder (the LLM would merge them and
+        # unmasking would write one name for the other)
+        taken = {(category, name_id) for (category, _), name_id in profile_ids.items()}
+        clashing = []
+        for slot in store.slots_by_id():
+            info = store.names[slot]
+            profile_id = profile_ids.get((info['category'], info['normalized_name']))
+            if profile_id is not None:
+                store.set_id(slot, profile_id)
+            elif (info['category'], info['id']) in taken:
+                clashing.append(slot)
+        for slot in clashing:
+            store.set_id(slot, store.next_id(store.names[slot]['category']))
+
+    def lookup_id(self, profile_name: str, key: str) -> Optional[int]:
+        """ID of a normalized name or PII key in a profile, or None"""
+        profile = self.profiles.get(profile_name)
+        if not profile:
+            return None
+        for entry in profile["names"]:
+            if entry["normalized"] == key:
+                return entry["id"]
+        for entry in profile["pii_values"]:
+            if entry["key"] == key:
+                return entry["id"]
+        return None
+
+    def apply(self, profile_name: str, text: str, store: OccurrenceStore) -> int:
+        """Mask a text with a profile: one scan for the PII categories, one for all names.
+        PII comes first so a name inside a value (dupont@x.fr) does not cut the value.
+        Returns the number of new occurrences."""
+        profile = self.profiles[profile_name]
+        self.reserve_ids(profile_name, store)
+        pii_ids = {entry["key"]: entry for entry in profile["pii_values"]}
+
+        new_occurrence_count = 0
+        spans_by_slot = {}
+        for start_pos, end_pos, category, key in scan_pii(text, profile.get("pii_categories", [])):
+            if store.overlaps(start_pos, end_pos):
+                continue
+            slot = store.get_slot(key)
+            if slot is None:
+                entry = pii_ids.get(key)
+                slot = store.add_name(key, text[start_pos:end_pos], category, entry["id"] if entry else None)
+            spans_by_slot.setdefault(slot, []).append((start_pos, end_pos))
+        for slot, spans in spans_by_slot.items():
+            store.add_occurrences(slot, spans)
+            new_occurrence_count += len(spans)
+
+        found = self.get_matcher(profile_name).find(text)
+        # Names in profile order: earlier names keep priority, as in apply_masking
+        for entry in profile["names"]:
+            spans = [(start_pos, end_pos) for start_pos, end_pos, _ in found.get(entry["name"], [])
+                     if not store.overlaps(start_pos, end_pos)]
+            if not spans:
+                continue
+            slot = store.get_slot(entry["normalized"])
+            if slot is None:
+                slot = store.add_name(entry["normalized"], entry["name"], "NAME", entry["id"])
+            store.add_occurrences(slot, spans)
+            new_occurrence_count += len(spans)
+        return new_occurrence_count
+
+    def delete(self, profile_name: str):
+        self.profiles.pop(profile_name, None)
+        self.matchers.pop(profile_name, None)
+        self.save()
@@ -0,0 +1,164 @@
+"""
+Memory Diagnostics
+
+Explains where the memory goes with large reports. At each pipeline step
+(document loaded, text extracted, names masked, prompt built, answer
+received...) a tracemalloc snapshot is taken and the memory held by each of
+the app's structures is measured: the loaded text, the extraction, the
+masked pieces, the prompt, the conversation, the normalized indexes with
+their position maps, and the masked occurrences.
+
+Structures are measured in a fixed order with a shared set of visited
+objects, so a string shared by two structures (e.g. a whole-document
+extraction and the loaded text) is counted once, in the first one. Text
+held by Tk widgets lives in Tcl's memory, which tracemalloc does not see:
+it is reported separately, in characters, next to the resident size of the
+process where the platform exposes it.
+
+Snapshots cost time and memory: this is a diagnostics mode, off by default.
+"""
+
+import os
+import sys
+import tracemalloc
+import types
+from array import array
+from collections import deque
+from typing import List, Dict, Optional, Set
+
+# Objects that are never attributed to a structure (code, not data)
+SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+LEAF_TYPES = (str, bytes, bytearray, array, int, float, complex, bool)
+
+
+def format_bytes(size: Optional[float]) -> str:
+    if size is None:
+        return "-"
+    if abs(size) >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def deep_sizeof(obj, seen: Set[int]) -> int:
+    """Bytes held by obj and everything it references, skipping objects already in `seen`"""
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if item is None or id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, LEAF_TYPES):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        else:
+            if hasattr(item, '__dict__'):
+                stack.append(item.__dict__)
+            for slot in getattr(type(item), '__slots__', ()):
+                stack.append(getattr(item, slot, None))
+    return size
+
+
+def process_rss() -> Optional[int]:
+    """Resident size of the process in bytes (None where /proc is not available, e.g. Windows)"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class MemoryProfiler:
+    """Footprint of the pipeline structures at each step, from tracemalloc snapshots"""
+
+    def __init__(self, frames: int = 1, top_allocations: int = 5):
+        self.frames = frames  # Stack frames kept per allocation (more is slower)
+        self.top_allocations = top_allocations  # Allocation sites listed per step
+        self.rows: List[Dict] = []
+        self.previous = None  # Snapshot of the previous step (allocation sites are diffed)
+        self.filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def checkpoint(self, step: str, structures: Dict[str, object],
+                   widget_chars: Optional[Dict[str, int]] = None) -> Dict:
+        """Record the footprint after `step`. `structures` maps a name to the objects it owns,
+        measured in order (shared objects count for the first); widget_chars are reported as is."""
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.filters)
+        top = []
+        if self.previous is not None:
+            for stat in snapshot.compare_to(self.previous, 'lineno')[:self.top_allocations]:
+                frame = stat.traceback[0]
+                top.append({"site": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                            "size_diff": stat.size_diff, "size": stat.size})
+        self.previous = snapshot
+        tracemalloc.reset_peak()  # The next step reports its own peak
+
+        seen: Set[int] = set()
+        sizes = {name: deep_sizeof(obj, seen) for name, obj in structures.items()}
+        row = {"step": step, "traced": current, "peak": peak,
+               "delta": current - self.rows[-1]["traced"] if self.rows else 0,
+               "structures": sizes, "widget_chars": dict(widget_chars or {}), "rss": process_rss(),
+               "top_allocations": top}
+        self.rows.append(row)
+        return row
+
+    def peak(self) -> int:
+        """Highest traced memory over all steps so far"""
+        return max((row["peak"] for row in self.rows), default=0)
+
+    def format_step(self, row: Dict) -> str:
+        """One line per step, for the console"""
+        parts = [f"{name} {format_bytes(size)}" for name, size in row["structures"].items() if size]
+        widgets = sum(row["widget_chars"].values())
+        if widgets:
+            parts.append(f"widgets {widgets:,} chars")
+        return (f"[memory] {row['step']}: traced {format_bytes(row['traced'])} "
+                f"(peak {format_bytes(row['peak'])}, {'+' if row['delta'] >= 0 else ''}{format_bytes(row['delta'])}), "
+                f"RSS {format_bytes(row['rss'])} | " + ", ".join(parts))
+
+    def format_report(self) -> str:
+        """Table of every step and structure, then the allocation sites that grew the most per step"""
+        if not self.rows:
+            return "No memory checkpoint recorded."
+        names = []
+        for row in self.rows:
+            names.extend(name for name in row["structures"] if name not in names)
+        widget_names = []
+        for row in self.rows:
+            widget_names.extend(name for name in row["widget_chars"] if name not in widget_names)
+
+        step_width = max(len(row["step"]) for row in self.rows) + 2
+        header = f"{'step':<{step_width}}{'traced':>11}{'peak':>11}{'RSS':>11}" + "".join(f"{name:>16}" for name in names)
+        if widget_names:
+            header += f"{'widget chars':>16}"
+        lines = ["Memory footprint by step (traced = Python allocations seen by tracemalloc)", header]
+        for row in self.rows:
+            line = (f"{row['step']:<{step_width}}{format_bytes(row['traced']):>11}{format_bytes(row['peak']):>11}"
+                    f"{format_bytes(row['rss']):>11}"
+                    + "".join(f"{format_bytes(row['structures'].get(name, 0)):>16}" for name in names))
+            if widget_names:
+                line += f"{sum(row['widget_chars'].values()):>16,}"
+            lines.append(line)
+        lines.append(f"Highest peak: {format_bytes(self.peak())}")
+
+        for row in self.rows:
+            if row["top_allocations"]:
+                lines.append(f"Allocation sites that grew the most during '{row['step']}':")
+                for entry in row["top_allocations"]:
+                    lines.append(f"  {entry['site']:<40}{format_bytes(entry['size_diff']):>12} "
+                                 f"(now {format_bytes(entry['size'])})")
+        return "\n".join(lines)
@@ -0,0 +1,249 @@
+"""
+Name Candidate Detection
+
+Suggests names to mask by scanning the extracted text once for:
+- capitalized tokens following an honorific ("M.", "Mme", "Dr", "Pr", ...)
+- capitalized tokens found in a gazetteer of French first names and surnames,
+  and unknown capitalized tokens directly next to such a name
+
+The gazetteer is a byte-level trie serialized to a binary file and opened
+with mmap, so loading it costs a file open regardless of its size. Build it
+from a seed list (see gazetteer_seed.txt) with:
+python name_candidates.py build gazetteer_seed.txt gazetteer.bin
+"""
+
+import argparse
+import mmap
+import os
+import re
+import struct
+from collections import Counter
+from typing import List, Dict, Iterable, Optional, Tuple
+
+from masking import normalize_text
+
+GAZETTEER_MAGIC = b"GZT1"
+FIRST_NAME = 1  # Gazetteer flag bits
+SURNAME = 2
+
+# Honorifics that introduce a person's name
+HONORIFIC_PATTERN = (r'\b(?:M\.|MM\.|Mmes?\b\.?|Mlles?\b\.?|Drs?\b\.?|Pr\b\.?|Me\b\.?'
+                     r'|Madame\b|Monsieur\b|Mademoiselle\b|Docteur\b|Professeur\b|Ma[iî]tre\b)')
+# A capitalized word, possibly hyphenated (Jean-Pierre, DUPONT-MARTIN)
+NAME_TOKEN_PATTERN = r"(?<![\w'-])[A-ZÀ-ÖØ-Þ][a-zA-Zà-öø-ÿÀ-ÖØ-Þ]*(?:-[A-ZÀ-ÖØ-Þa-zà-öø-ÿ][a-zA-Zà-öø-ÿÀ-ÖØ-Þ]*)*(?![\w'])"
+CANDIDATE_PATTERN = re.compile(f"(?P<honorific>{HONORIFIC_PATTERN})|(?P<token>{NAME_TOKEN_PATTERN})")
+# Only plain spaces may separate the tokens of one name
+CHAIN_GAP_PATTERN = re.compile(r'[ \t ]{1,3}')
+
+# Capitalized words that are never suggested on their own
+STOP_WORDS = {
+    "le", "la", "les", "un", "une", "des", "du", "de", "il", "elle", "ils", "elles", "on", "nous",
+    "vous", "je", "ce", "cette", "ces", "son", "sa", "ses", "leur", "en", "au", "aux", "et", "ou",
+    "mais", "donc", "car", "si", "dans", "par", "pour", "sur", "avec", "sans", "apres", "avant",
+    "selon", "lors", "depuis", "monsieur", "madame", "mademoiselle", "docteur", "professeur",
+    "maitre", "mme", "mlle", "dr", "pr", "me", "cher", "chere", "objet", "date", "page",
+}
+
+
+class Gazetteer:
+    """Read-only byte-level trie of normalized names, read straight from a memory map.
+
+    File layout: magic, uint32 root offset, then nodes. A node is
+    [flags: uint8][child count: uint16][child bytes][child offsets: uint32 each],
+    with child bytes sorted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != GAZETTEER_MAGIC:
+            self.close()
+            raise ValueError(f"Not a gazetteer file: {path}")
+        self.root = struct.unpack_from('<I', self.data, 4)[0]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def lookup(self, word: str) -> int:
+        """Return the flags of a normalized word (0 if it is not in the gazetteer)"""
+        data = self.data
+        position = self.root
+        for byte in word.encode('utf-8'):
+            count = data[position + 1] | (data[position + 2] << 8)
+            keys_start = position + 3
+            found = data.find(bytes((byte,)), keys_start, keys_start + count)
+            if found < 0:
+                return 0
+            position = struct.unpack_from('<I', data, keys_start + count + 4 * (found - keys_start))[0]
+        return data[position]
+
+
+def build_gazetteer(entries: Iterable[Tuple[str, int]], path: str) -> int:
+    """Write a gazetteer file from (name, flags) entries. Returns the number of names."""
+    root = {}
+    names = 0
+    for name, flags in entries:
+        node = root
+        for byte in normalize_text(name).encode('utf-8'):
+            node = node.setdefault(byte, {})
+        if not node.get(-1):
+            names += 1
+        node[-1] = node.get(-1, 0) | flags  # Key -1 holds the flags of a complete word
+
+    output = bytearray(GAZETTEER_MAGIC + b"\0\0\0\0")
+
+    def write_node(node: Dict) -> int:
+        # Children are written first so their offsets are known
+        keys = sorted(key for key in node if key >= 0)
+        offsets = [write_node(node[key]) for key in keys]
+        offset = len(output)
+        output.extend(struct.pack('<BH', node.get(-1, 0), len(keys)))
+        output.extend(bytes(keys))
+        for child_offset in offsets:
+            output.extend(struct.pack('<I', child_offset))
+        return offset
+
+    struct.pack_into('<I', output, 4, write_node(root))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(output)
+    os.replace(tmp_path, path)
+    return names
+
+
+def read_seed_list(path: str) -> List[Tuple[str, int]]:
+    """Read a seed list: one name per line, in [first_names] and [surnames] sections"""
+    entries = []
+    flags = FIRST_NAME
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line == "[first_names]":
+                flags = FIRST_NAME
+            elif line == "[surnames]":
+                flags = SURNAME
+            else:
+                entries.append((line, flags))
+    return entries
+
+
+def load_gazetteer(path: str, seed_path: Optional[str] = None) -> Optional[Gazetteer]:
+    """Open the gazetteer, (re)building it first from the seed list if that is newer"""
+    try:
+        if seed_path and os.path.exists(seed_path):
+            if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(seed_path):
+                build_gazetteer(read_seed_list(seed_path), path)
+        if not os.path.exists(path):
+            return None
+        return Gazetteer(path)
+    except Exception as e:
+        print(f"Warning: Could not load gazetteer {path}: {e}")
+        return None
+
+
+def find_name_candidates(text: str, gazetteer: Optional[Gazetteer] = None,
+                         exclude: Iterable[str] = ()) -> List[Dict]:
+    """Scan text once and return name candidates, most frequent first.
+
+    Each candidate is {'name', 'count', 'reason'} where reason is "honorific"
+    or "gazetteer". Names whose normalized form is in `exclude` are skipped.
+    """
+    excluded = {normalize_text(name) for name in exclude}
+    lookup_cache: Dict[str, int] = {}
+
+    def gazetteer_flags(normalized: str) -> int:
+        if gazetteer is None:
+            return 0
+        flags = lookup_cache.get(normalized)
+        if flags is None:
+            flags = gazetteer.lookup(normalized)
+            lookup_cache[normalized] = flags
+        return flags
+
+    counts = Counter()  # Normalized token -> occurrences as a capitalized token
+    spellings: Dict[str, Counter] = {}
+    reasons: Dict[str, str] = {}
+
+    def close_chain(chain: List[str], after_honorific: bool):
+        # A chain is a run of capitalized tokens separated by spaces (e.g. "Jean DUPONT")
+        normalized_chain = [normalize_text(token) for token in chain]
+        chain_has_name = after_honorific or any(gazetteer_flags(token) for token in normalized_chain
+                                                 if token not in STOP_WORDS)
+        for token, normalized in zip(chain, normalized_chain):
+            counts[normalized] += 1
+            spellings.setdefault(normalized, Counter())[token] += 1
+            if not chain_has_name or normalized in STOP_WORDS or len(normalized) < 2:
+                continue
+            if after_honorific:
+                reasons[normalized] = "honorific"
+            else:
+                reasons.setdefault(normalized, "gazetteer")
+
+    chain: List[str] = []
+    chain_after_honorific = False
+    pending_honorific = False
+    last_end = -1
+    for match in CANDIDATE_PATTERN.finditer(text):
+        adjacent = last_end >= 0 and CHAIN_GAP_PATTERN.fullmatch(text, last_end, match.start()) is not None
+        if match.group('honorific'):
+            if chain:
+                close_chain(chain, chain_after_honorific)
+                chain = []
+            pending_honorific = True
+        else:
+            if chain and not adjacent:
+                close_chain(chain, chain_after_honorific)
+                chain = []
+            if not chain:
+                chain_after_honorific = pending_honorific and adjacent
+            pending_honorific = False
+            chain.append(match.group('token'))
+            if len(chain) > 4:  # Longer runs are headings or titles, not names
+                chain_after_honorific = False
+        last_end = match.end()
+    if chain:
+        close_chain(chain, chain_after_honorific)
+
+    candidates = []
+    for normalized, reason in reasons.items():
+        if normalized in excluded:
+            continue
+        candidates.append({
+            'name': spellings[normalized].most_common(1)[0][0],
+            'count': counts[normalized],
+            'reason': reason
+        })
+    # Honorific evidence first, then frequency
+    candidates.sort(key=lambda c: (c['reason'] != "honorific", -c['count'], c['name']))
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the name gazetteer")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build a gazetteer file from a seed list")
+    build_parser.add_argument("seed")
+    build_parser.add_argument("output")
+    lookup_parser = subparsers.add_parser("lookup", help="Look up names in a gazetteer file")
+    lookup_parser.add_argument("gazetteer")
+    lookup_parser.add_argument("names", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_gazetteer(read_seed_list(args.seed), args.output)
+        print(f"Wrote {count} names to {args.output} ({os.path.getsize(args.output)} bytes)")
+    else:
+        gazetteer = Gazetteer(args.gazetteer)
+        for name in args.names:
+            flags = gazetteer.lookup(normalize_text(name))
+            kinds = [kind for bit, kind in ((FIRST_NAME, "first name"), (SURNAME, "surname")) if flags & bit]
+            print(f"{name}: {', '.join(kinds) or 'not found'}")
+        gazetteer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Performance Trace
+
+Lightweight timing of the hot paths of the app (document load, normalization,
+masking stages, widget inserts, streaming) so that "it froze" comes with data.
+Spans are kept in a bounded ring buffer; recording can be switched on and off
+at any time and costs a single attribute check while it is off.
+
+Stalls of the Tk event loop are detected from the gaps between periodic
+`root.after` ticks: a tick that arrives much later than scheduled means the
+loop was blocked, and the spans that overlap the gap show what blocked it.
+
+The buffer is exported in the Chrome trace event format (JSON), which opens
+in chrome://tracing or https://ui.perfetto.dev and can be attached to tickets.
+Span arguments carry sizes and counts only, never document text.
+"""
+
+import json
+import os
+import platform
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Optional
+
+STALL = "stall"  # Category of the event loop stalls
+
+
+class PerfRecorder:
+    """Bounded buffer of timed spans: {'name', 'cat', 'start', 'duration', 'args'} in seconds"""
+
+    def __init__(self, capacity: int = 5000, enabled: bool = False):
+        self.enabled = enabled
+        self.events = deque(maxlen=capacity)  # Oldest events are dropped first
+        self.origin = time.perf_counter()  # Event times are relative to this
+        self.lock = threading.Lock()
+        self.last_tick = None  # perf_counter() of the last event loop tick
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+        self.last_tick = None  # The loop was not watched meanwhile: no stall to report
+
+    def span(self, name: str, cat: str = "app", **args):
+        """Context manager timing its block; `with ... as args` gives the span's arguments,
+        to which the block can add results (a no-op while recording is off)"""
+        if not self.enabled:
+            return nullcontext({})
+        return self._span(name, cat, args)
+
+    @contextmanager
+    def _span(self, name: str, cat: str, args: Dict):
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, cat, start, time.perf_counter() - start, args)
+
+    def add(self, name: str, cat: str, start: float, duration: float, args: Optional[Dict] = None):
+        """Record a span measured by the caller (start is a perf_counter() value)"""
+        if not self.enabled:
+            return
+        event = {"name": name, "cat": cat, "start": start - self.origin, "duration": duration, "args": args or {}}
+        with self.lock:
+            self.events.append(event)
+
+    def tick(self, interval: float, threshold: float) -> Optional[float]:
+        """Called on every event loop tick scheduled `interval` seconds apart.
+        Records and returns the stall (seconds) when the tick is late by more than `threshold`."""
+        now = time.perf_counter()
+        last, self.last_tick = self.last_tick, now
+        if last is None:
+            return None
+        late = now - last - interval
+        if late <= threshold:
+            return None
+        self.add("event loop stall", STALL, last + interval, late)
+        return late
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+
+    def snapshot(self) -> List[Dict]:
+        with self.lock:
+            return list(self.events)
+
+    def summary(self) -> List[Dict]:
+        """Per span name: count, last, mean and max duration (seconds), slowest mean first"""
+        stats = {}
+        for event in self.snapshot():
+            if event["cat"] == STALL:
+                continue
+            entry = stats.setdefault(event["name"], {"name": event["name"], "cat": event["cat"],
+                                                     "count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += event["duration"]
+            entry["max"] = max(entry["max"], event["duration"])
+            entry["last"] = event["duration"]
+        for entry in stats.values():
+            entry["mean"] = entry.pop("total") / entry["count"]
+        return sorted(stats.values(), key=lambda entry: entry["mean"], reverse=True)
+
+    def stalls(self) -> List[Dict]:
+        """Recorded stalls, most recent first, each with the longest span that overlapped it ('culprit')"""
+        events = self.snapshot()
+        spans = [event for event in events if event["cat"] != STALL]
+        stalls = []
+        for stall in reversed([event for event in events if event["cat"] == STALL]):
+            stall_end = stall["start"] + stall["duration"]
+            overlapping = [span for span in spans
+                           if span["start"] < stall_end and span["start"] + span["duration"] > stall["start"]]
+            culprit = max(overlapping, key=lambda span: span["duration"], default=None)
+            stalls.append({"start": stall["start"], "duration": stall["duration"],
+                           "culprit": culprit["name"] if culprit else None})
+        return stalls
+
+    def export(self, path: str, metadata: Optional[Dict] = None):
+        """Write the buffer as a Chrome trace (times in microseconds), atomically"""
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "Tk main thread"}}]
+        for event in self.snapshot():
+            trace_events.append({"name": event["name"], "cat": event["cat"], "ph": "X", "pid": 1, "tid": 1,
+                                 "ts": round(event["start"] * 1e6), "dur": round(event["duration"] * 1e6),
+                                 "args": event["args"]})
+        info = {"exported": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                "platform": platform.platform()}
+        info.update(metadata or {})
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms", "metadata": info}, f,
+                      ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
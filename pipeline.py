@@ -0,0 +1,177 @@
+"""
+Headless Pipeline
+
+The processing steps of the GUI without Tk: reading a .docx, extracting
+the text between two markers, masking names, PII values and profile
+entries, building the prompt and restoring placeholders. Used by the HTTP
+service (service.py) and by the other non-interactive entry points.
+
+Stage functions take and return plain picklable values, so they can run
+in a process pool.
+"""
+
+import io
+import os
+from typing import List, Dict, Optional, Tuple, Callable, Union
+
+import docx
+
+from document import PieceTable
+from masking import (PlaceholderRestorer, OccurrenceStore, NormalizedText, normalize_text,
+                     find_word_position, find_names, scan_pii)
+from masking_profiles import ProfileStore
+from fuzzy_search import find_approximate
+from llm_providers import LLMModelRegistry, ClaudeProvider, OpenAIProvider
+
+DEFAULT_INSTRUCTION = ("Fais un récit chronologique de ce rapport d'expertise medicale. Utilise le discour rapporté. "
+                       "Garde une connotation technique. Fais un récit continu.")
+
+
+def read_docx_text(source: Union[str, bytes]) -> str:
+    """Text of a Word document (a path or the file contents), one line per paragraph"""
+    doc = docx.Document(io.BytesIO(source) if isinstance(source, bytes) else source)
+    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+
+
+def find_extraction_range(text: str, start_word: str, end_word: str,
+                          max_distance: int = 2) -> Tuple[int, int, bool]:
+    """(start, end, approximate) of the text from the start marker up to (excluding) the end marker.
+
+    Markers are matched ignoring case and accents; a marker that is not found
+    exactly is replaced by its closest spelling (approximate is then True).
+    Raises ValueError if a marker cannot be found at all.
+    """
+    approximate = False
+    start_pos = find_word_position(text, start_word)
+    if start_pos is None:
+        candidates = find_approximate_marker(text, start_word, max_distance, 0)
+        if not candidates:
+            raise ValueError(f"Start word '{start_word}' not found in document.")
+        start_pos = candidates[0]['start']
+        approximate = True
+
+    end_relative = find_word_position(text[start_pos:], end_word)
+    if end_relative is None:
+        candidates = find_approximate_marker(text, end_word, max_distance, start_pos + 1)
+        if not candidates:
+            raise ValueError(f"End word '{end_word}' not found after start word.")
+        return start_pos, candidates[0]['start'], True
+    return start_pos, start_pos + end_relative, approximate
+
+
+def find_approximate_marker(text: str, word: str, max_distance: int, min_position: int) -> List[Dict]:
+    """Closest spellings of a marker at or after min_position, best first"""
+    return find_approximate(NormalizedText(text), word, max_distance, limit=20, min_position=min_position)
+
+
+def mask_names(text: str, store: OccurrenceStore, names: List[str],
+               id_for: Optional[Callable[[str], Optional[int]]] = None,
+               workers: int = 1, parallel_threshold: int = 2_000_000) -> int:
+    """Mask names in input order (earlier names win overlaps). Names already in the
+    store are skipped; id_for(key) can give the ID of a name (e.g. from a profile).
+    Returns the number of new occurrences."""
+    names_to_search = []
+    seen_names = set()
+    for name in names:
+        normalized_name = normalize_text(name)
+        if not normalized_name or normalized_name in seen_names or store.get_slot(normalized_name) is not None:
+            continue
+        seen_names.add(normalized_name)
+        names_to_search.append(name)
+
+    found = find_names(text, names_to_search, workers=workers, parallel_threshold=parallel_threshold)
+    new_occurrence_count = 0
+    for name in names_to_search:
+        normalized_name = normalize_text(name)
+        new_spans = [(start_pos, end_pos) for start_pos, end_pos, _ in found[name]
+                     if not store.overlaps(start_pos, end_pos)]
+        if not new_spans:
+            continue
+        slot = store.add_name(normalized_name, name, "NAME", id_for(normalized_name) if id_for else None)
+        store.add_occurrences(slot, new_spans)
+        new_occurrence_count += len(new_spans)
+    return new_occurrence_count
+
+
+def mask_pii(text: str, store: OccurrenceStore, categories: List[str],
+             id_for: Optional[Callable[[str], Optional[int]]] = None) -> int:
+    """Mask the PII values of the given categories found in one scan.
+    Returns the number of new occurrences."""
+    spans_by_slot = {}
+    for start_pos, end_pos, category, key in scan_pii(text, categories):
+        # Occurrences that overlap already-masked text are skipped
+        if store.overlaps(start_pos, end_pos):
+            continue
+        slot = store.get_slot(key)
+        if slot is None:
+            slot = store.add_name(key, text[start_pos:end_pos], category, id_for(key) if id_for else None)
+        spans_by_slot.setdefault(slot, []).append((start_pos, end_pos))
+    for slot, spans in spans_by_slot.items():
+        store.add_occurrences(slot, spans)
+    return sum(len(spans) for spans in spans_by_slot.values())
+
+
+def mask_document(text: str, names: List[str] = (), pii_categories: List[str] = (),
+                  profile: Optional[Dict] = None, store: Optional[OccurrenceStore] = None) -> OccurrenceStore:
+    """Mask a text: PII, then the profile (as stored in masking_profiles.json), then names.
+    PII comes first so a name inside a value (dupont@x.fr) does not cut the value.
+    Runs in a worker process: everything it needs is passed in."""
+    store = store if store is not None else OccurrenceStore()
+    profiles = ProfileStore()
+    if profile is not None:
+        profiles.profiles = {"profile": profile}
+        profiles.reserve_ids("profile", store)
+
+    def id_for(key: str) -> Optional[int]:
+        # Names and values already in the profile keep their ID
+        return profiles.lookup_id("profile", key)
+
+    mask_pii(text, store, list(pii_categories), id_for)
+    if profile is not None:
+        profiles.apply("profile", text, store)
+    mask_names(text, store, list(names), id_for)
+    return store
+
+
+def masked_text(text: str, store: OccurrenceStore) -> str:
+    return PieceTable.from_replacements(text, store.replacements()).text()
+
+
+def build_prompt(instructions: str, masked: str) -> str:
+    return f"{instructions or DEFAULT_INSTRUCTION}\n\nText:\n{masked}"
+
+
+def unmask(text: str, store: OccurrenceStore, extracted_text: str) -> str:
+    return PlaceholderRestorer.from_store(store, extracted_text).restore(text)
+
+
+def read_private_settings(private_file: str = "private.txt") -> Dict[str, str]:
+    """key=value settings of private.txt (API keys and optional base URLs)"""
+    settings = {}
+    if not os.path.exists(private_file):
+        return settings
+    with open(private_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key_name, value = line.split('=', 1)
+                settings[key_name.strip()] = value.strip()
+    return settings
+
+
+def build_registry(settings: Dict[str, str]) -> LLMModelRegistry:
+    """Model registry with a provider for each API key in the settings"""
+    registry = LLMModelRegistry()
+    try:
+        if settings.get("claude_api_key"):
+            registry.register_provider("claude", ClaudeProvider(settings["claude_api_key"],
+                                                                base_url=settings.get("claude_base_url")))
+    except Exception as e:
+        print(f"Warning: Could not initialize Claude provider: {e}")
+    try:
+        if settings.get("openai_api_key"):
+            registry.register_provider("openai", OpenAIProvider(settings["openai_api_key"],
+                                                                base_url=settings.get("openai_base_url")))
+    except Exception as e:
+        print(f"Warning: Could not initialize OpenAI provider: {e}")
+    return registry
@@ -0,0 +1,271 @@
+"""
+Hybrid Pipeline Scheduler
+
+Processes many reports with two execution models side by side: the CPU
+stages (parse the .docx, extract between the markers, mask) run in a
+process pool, and the LLM stage runs as asyncio tasks, so waiting on
+provider streams never holds a core and CPU work never blocks a request.
+The stages are connected by bounded queues: when the LLM stage falls
+behind, the CPU stages stop taking new documents instead of piling up
+masked texts in memory.
+
+Each stage reports its utilization, so the pools can be sized: a stage
+that is often starved waits on the stage before it, a stage that is often
+blocked waits on the stage after it.
+
+Run with: python app.py --process REPORT.docx ... [--cpu-workers 4] [--llm-concurrency 4]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable
+
+from llm_routing import HedgedRouter, CircuitBreaker, LatencyTelemetry
+from masking_profiles import ProfileStore
+from template_store import TemplateStore, INSTRUCTION
+from pipeline import (read_docx_text, find_extraction_range, mask_document, masked_text, build_prompt,
+                      unmask, read_private_settings, build_registry)
+
+
+# ---- CPU stages (run in worker processes; a job is a plain dict) -------------
+
+def parse_stage(job: Dict) -> Dict:
+    job["text"] = read_docx_text(job["path"])
+    return job
+
+
+def extract_stage(job: Dict) -> Dict:
+    if job.get("start_word") and job.get("end_word"):
+        start, end, _ = find_extraction_range(job["text"], job["start_word"], job["end_word"])
+        job["extracted"] = job["text"][start:end]
+    else:
+        job["extracted"] = job["text"]
+    del job["text"]  # Not needed anymore: keep the jobs sent between processes small
+    return job
+
+
+def mask_stage(job: Dict) -> Dict:
+    store = mask_document(job["extracted"], job.get("names", []), job.get("pii_categories", []), job.get("profile"))
+    job["occurrences"] = store
+    job["prompt"] = build_prompt(job.get("instructions", ""), masked_text(job["extracted"], store))
+    job.pop("profile", None)
+    return job
+
+
+CPU_STAGES = [("parse", parse_stage), ("extract", extract_stage), ("mask", mask_stage)]
+
+
+def timed_stage(function: Callable[[Dict], Dict], job: Dict):
+    """Run a stage in the worker and measure it there (time spent waiting for a free worker is excluded)"""
+    started = time.perf_counter()
+    try:
+        return function(job), time.perf_counter() - started, None
+    except Exception as e:
+        return job, time.perf_counter() - started, str(e)
+
+
+class StageStats:
+    """Time accounting of one stage"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers  # Tasks running this stage
+        self.items = 0
+        self.busy = 0.0  # Seconds spent doing the work (summed over tasks)
+        self.starved = 0.0  # Seconds tasks waited for input
+        self.blocked = 0.0  # Seconds tasks waited for room in the next queue
+
+
+class HybridScheduler:
+    """Runs jobs through the CPU stages (process pool) and the LLM stage (asyncio)"""
+
+    def __init__(self, router: HedgedRouter, model: str, cpu_workers: Optional[int] = None,
+                 llm_concurrency: int = 4, queue_size: int = 8):
+        self.router = router
+        self.model = model
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1  # Worker processes shared by the CPU stages
+        self.llm_concurrency = llm_concurrency  # Provider calls in flight
+        self.queue_size = queue_size  # Jobs waiting between two stages (backpressure)
+        self.stats: List[StageStats] = []
+        self.wall = 0.0
+
+    async def _put(self, stats: StageStats, queue: asyncio.Queue, job):
+        waited = time.perf_counter()
+        await queue.put(job)
+        stats.blocked += time.perf_counter() - waited
+
+    async def _cpu_task(self, stats: StageStats, function, pool, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            waited = time.perf_counter()
+            job = await inbox.get()
+            stats.starved += time.perf_counter() - waited
+            if job is None:
+                return
+            if "error" not in job:
+                job, seconds, error = await loop.run_in_executor(pool, timed_stage, function, job)
+                stats.busy += seconds
+                stats.items += 1
+                if error:
+                    job["error"] = f"{stats.name}: {error}"
+            await self._put(stats, outbox, job)
+
+    async def _llm_task(self, stats: StageStats, threads, inbox: asyncio.Queue, results: List[Dict]):
+        loop = asyncio.get_running_loop()
+        while True:
+            waited = time.perf_counter()
+            job = await inbox.get()
+            stats.starved += time.perf_counter() - waited
+            if job is None:
+                return
+            if "error" not in job:
+                started = time.perf_counter()
+                # The provider SDKs are synchronous: the call waits in a thread, the loop stays free
+                try:
+                    response_text = await loop.run_in_executor(threads, lambda: self.router.send_message(
+                        messages=[{"role": "user", "content": job["prompt"]}], model=self.model, max_tokens=64000))
+                    job["result"] = unmask(response_text, job["occurrences"], job["extracted"])
+                except Exception as e:
+                    job["error"] = f"llm: {e}"
+                stats.busy += time.perf_counter() - started
+                stats.items += 1
+            results.append(job)
+
+    async def _run(self, jobs: List[Dict]) -> List[Dict]:
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(CPU_STAGES) + 1)]
+        self.stats = [StageStats(name, self.cpu_workers) for name, _ in CPU_STAGES]
+        self.stats.append(StageStats("llm", self.llm_concurrency))
+        results: List[Dict] = []
+        feeder = StageStats("input", 1)
+
+        async def stage(index: int, tasks: List):
+            await asyncio.gather(*tasks)
+            # Tell every task of the next stage that the input is finished
+            if index + 1 < len(queues):
+                for _ in range(self.stats[index + 1].workers):
+                    await queues[index + 1].put(None)
+
+        async def feed():
+            for job in jobs:
+                await self._put(feeder, queues[0], job)
+            for _ in range(self.stats[0].workers):
+                await queues[0].put(None)
+
+        with ProcessPoolExecutor(max_workers=self.cpu_workers) as pool, \
+                ThreadPoolExecutor(max_workers=self.llm_concurrency) as threads:
+            started = time.perf_counter()
+            runners = [feed()]
+            for index, (name, function) in enumerate(CPU_STAGES):
+                tasks = [self._cpu_task(self.stats[index], function, pool, queues[index], queues[index + 1])
+                         for _ in range(self.stats[index].workers)]
+                runners.append(stage(index, tasks))
+            llm_index = len(CPU_STAGES)
+            runners.append(stage(llm_index, [self._llm_task(self.stats[llm_index], threads, queues[llm_index], results)
+                                             for _ in range(self.llm_concurrency)]))
+            await asyncio.gather(*runners)
+            self.wall = time.perf_counter() - started
+        return results
+
+    def run(self, jobs: List[Dict]) -> List[Dict]:
+        """Process the jobs; returns them with 'result' or 'error' set (in completion order)"""
+        return asyncio.run(self._run(jobs))
+
+    def utilization(self) -> List[Dict]:
+        """Per stage: items, busy seconds and the share of the stage's capacity spent working,
+        waiting for input (starved) and waiting for the next stage (blocked)"""
+        report = []
+        for stats in self.stats:
+            capacity = max(self.wall * stats.workers, 1e-9)
+            report.append({"stage": stats.name, "workers": stats.workers, "items": stats.items,
+                           "busy_seconds": round(stats.busy, 3),
+                           "utilization": round(stats.busy / capacity, 3),
+                           "starved": round(stats.starved / capacity, 3),
+                           "blocked": round(stats.blocked / capacity, 3)})
+        # CPU stages share one pool: its overall use tells whether to add processes
+        cpu_busy = sum(stats.busy for stats in self.stats[:len(CPU_STAGES)])
+        report.append({"stage": "cpu pool", "workers": self.cpu_workers,
+                       "items": sum(stats.items for stats in self.stats[:len(CPU_STAGES)]),
+                       "busy_seconds": round(cpu_busy, 3),
+                       "utilization": round(cpu_busy / max(self.wall * self.cpu_workers, 1e-9), 3),
+                       "starved": None, "blocked": None})
+        return report
+
+    def format_utilization(self) -> str:
+        lines = [f"Wall time: {self.wall:.2f} s",
+                 f"{'stage':<10}{'workers':>8}{'items':>7}{'busy s':>9}{'util':>7}{'starved':>9}{'blocked':>9}"]
+        for row in self.utilization():
+            starved = f"{row['starved']:.0%}" if row['starved'] is not None else "-"
+            blocked = f"{row['blocked']:.0%}" if row['blocked'] is not None else "-"
+            lines.append(f"{row['stage']:<10}{row['workers']:>8}{row['items']:>7}{row['busy_seconds']:>9.2f}"
+                         f"{row['utilization']:>7.0%}{starved:>9}{blocked:>9}")
+        return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Process reports with CPU stages in a process pool "
+                                                 "and LLM calls in asyncio")
+    parser.add_argument("files", nargs="+", help=".docx reports")
+    parser.add_argument("--start", default="", help="Start marker (default: whole document)")
+    parser.add_argument("--end", default="", help="End marker")
+    parser.add_argument("--names", default="", help="Names to mask, comma-separated")
+    parser.add_argument("--pii", default="", help="PII categories to mask, comma-separated")
+    parser.add_argument("--profile", default=None, help="Masking profile of the case")
+    parser.add_argument("--instruction-label", default="basic")
+    parser.add_argument("--model", default=None, help="Model (default: first available)")
+    parser.add_argument("--cpu-workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=8, help="Jobs buffered between two stages")
+    parser.add_argument("--private", default="private.txt", help="API keys file")
+    parser.add_argument("--standin", action="store_true", help="Use the offline LLM stand-in")
+    args = parser.parse_args(argv)
+
+    settings = read_private_settings(args.private)
+    if args.standin:
+        from llm_standin import start_standin_server
+        _, standin_url = start_standin_server()
+        settings = {"claude_api_key": "standin", "claude_base_url": standin_url,
+                    "openai_api_key": "standin", "openai_base_url": standin_url}
+    registry = build_registry(settings)
+    model = args.model or next(iter(registry.get_all_models()), None)
+    if not model:
+        print(f"Error: No LLM provider configured in '{args.private}'.")
+        return
+
+    profile = None
+    if args.profile:
+        profile_store = ProfileStore("masking_profiles.json")
+        profile_store.load()
+        profile = profile_store.profiles.get(args.profile)
+        if profile is None:
+            print(f"Error: Unknown masking profile '{args.profile}'.")
+            return
+    template_store = TemplateStore("templates.db")
+    instructions = template_store.get(INSTRUCTION, args.instruction_label) or ""
+    template_store.close()
+
+    # Documents are masked in parallel: the profile gives its known IDs, but new
+    # names and values are not written back to it (they could get the same ID)
+    jobs = [{"path": path, "start_word": args.start, "end_word": args.end,
+             "names": [name.strip() for name in args.names.split(",") if name.strip()],
+             "pii_categories": [c.strip().upper() for c in args.pii.split(",") if c.strip()],
+             "profile": profile, "instructions": instructions} for path in args.files]
+    router = HedgedRouter(registry, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=120.0),
+                          telemetry=LatencyTelemetry("latency_telemetry.json"))
+    scheduler = HybridScheduler(router, model, cpu_workers=args.cpu_workers,
+                                llm_concurrency=args.llm_concurrency, queue_size=args.queue_size)
+    for job in scheduler.run(jobs):
+        if "error" in job:
+            print(f"Failed: {job['path']}: {job['error']}")
+            continue
+        output = os.path.splitext(job["path"])[0] + ".result.txt"
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(job["result"])
+        print(f"Done: {output}")
+    print(scheduler.format_utilization())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Section Segmentation
+
+Locates the standard headings of an expertise report in one pass over the
+normalized text (accents and case ignored) and returns an ordered section
+map, so any combination of sections can be extracted.
+
+Headings are configured in headings.txt, one section per line in the same
+format as instructions.txt:
+"Label" :: "variant 1 | variant 2"
+"""
+
+import os
+import re
+from collections import OrderedDict
+from typing import List, Dict, Tuple
+
+from masking import NormalizedText, normalize_text
+
+DEFAULT_HEADINGS = [
+    ("Préambule", ["preambule", "mission", "rappel de la mission"]),
+    ("Commémoratifs", ["commemoratifs", "commemoratif", "rappel des faits", "faits"]),
+    ("Documents présentés", ["documents presentes", "pieces communiquees", "documents medicaux", "pieces medicales"]),
+    ("Antécédents", ["antecedents", "etat anterieur"]),
+    ("Mode de vie", ["mode de vie", "situation personnelle", "situation professionnelle"]),
+    ("Doléances", ["doleances", "plaintes"]),
+    ("Examen clinique", ["examen clinique", "examen", "examen physique"]),
+    ("Examens complémentaires", ["examens complementaires", "imagerie"]),
+    ("Discussion", ["discussion", "analyse medico-legale"]),
+    ("Conclusion", ["conclusion", "conclusions"]),
+    ("Évaluation des préjudices", ["evaluation des prejudices", "prejudices", "evaluation"]),
+    ("Réponses aux dires", ["reponses aux dires", "dires"]),
+]
+
+FIRST_SECTION_LABEL = "(Début du document)"  # Text before the first heading
+
+
+def load_headings(file_path: str = "headings.txt") -> List[Tuple[str, List[str]]]:
+    """Load the heading dictionary (written with the defaults if the file does not exist)"""
+    headings = []
+    try:
+        if not os.path.exists(file_path):
+            save_headings(DEFAULT_HEADINGS, file_path)
+            return list(DEFAULT_HEADINGS)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                # Parse format: "label" :: "variant | variant"
+                if ' :: ' not in line:
+                    continue
+                label, variants = line.split(' :: ', 1)
+                variants = [v.strip() for v in variants.strip().strip('"').split('|') if v.strip()]
+                if variants:
+                    headings.append((label.strip().strip('"'), variants))
+    except Exception as e:
+        print(f"Warning: Could not load headings: {e}")
+    return headings or list(DEFAULT_HEADINGS)
+
+
+def save_headings(headings: List[Tuple[str, List[str]]], file_path: str = "headings.txt"):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for label, variants in headings:
+            f.write(f'"{label}" :: "{" | ".join(variants)}"\n')
+
+
+class SectionSegmenter:
+    """Finds all headings with one compiled pattern and caches the section map per text"""
+
+    def __init__(self, headings: List[Tuple[str, List[str]]], cache_size: int = 8):
+        self.labels = [label for label, _ in headings]
+        alternatives = []
+        for index, (_, variants) in enumerate(headings):
+            # Longest variant first so "examen clinique" wins over "examen"
+            escaped = sorted((re.escape(normalize_text(v)).replace(r'\ ', r'\s+') for v in variants),
+                             key=len, reverse=True)
+            alternatives.append(f"(?P<h{index}>{'|'.join(escaped)})")
+        # A heading starts a line, optionally after a numbering ("1.", "II -", "a)") or a bullet,
+        # and is followed by the end of the line or a colon/dash
+        self.pattern = re.compile(
+            r'^[ \t]*(?:(?:[ivx]+|\d+(?:\.\d+)*|[a-z])[ \t]*[.)/-][ \t]*|[-•*][ \t]*)?'
+            r'(?:' + '|'.join(alternatives) + r')'
+            r'[ \t]*(?::|-|–|$)',
+            re.MULTILINE)
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, List[Dict]]" = OrderedDict()  # Text -> section map
+
+    def segment(self, text: str, index: NormalizedText = None) -> List[Dict]:
+        """Return the ordered section map of a text.
+
+        Each section is {'label', 'heading', 'start', 'end'}: `heading` is the
+        heading as written, and [start, end) covers the heading and its body.
+        An already built NormalizedText of the text can be passed as `index`.
+        """
+        sections = self.cache.get(text)
+        if sections is not None:
+            self.cache.move_to_end(text)
+            return sections
+
+        if index is None or index.text is not text:
+            index = NormalizedText(text)
+        headings = []
+        for match in self.pattern.finditer(index.normalized):
+            group = match.lastgroup
+            start = index.to_original(match.start())
+            heading_end = index.to_original(match.end(group) - 1) + 1
+            headings.append((start, self.labels[int(group[1:])], text[index.to_original(match.start(group)):heading_end]))
+
+        sections = []
+        if not headings or headings[0][0] > 0 and text[:headings[0][0]].strip():
+            sections.append({'label': FIRST_SECTION_LABEL, 'heading': "", 'start': 0,
+                             'end': headings[0][0] if headings else len(text)})
+        for i, (start, label, heading) in enumerate(headings):
+            end = headings[i + 1][0] if i + 1 < len(headings) else len(text)
+            sections.append({'label': label, 'heading': heading, 'start': start, 'end': end})
+
+        self.cache[text] = sections
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return sections
+
+
+def selected_ranges(sections: List[Dict], selected: List[int]) -> List[Tuple[int, int]]:
+    """(start, end) ranges of the selected sections, with adjacent sections merged"""
+    ranges = []
+    for i in sorted(selected):
+        start, end = sections[i]['start'], sections[i]['end']
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
@@ -0,0 +1,479 @@
+"""
+HTTP Service Mode
+
+Runs the pipeline for several users from one machine: upload a document,
+extract, mask, generate (streamed back as server-sent events) and unmask
+over a local JSON API. Parsing, extraction and masking run in a process
+pool; LLM calls go through one shared HedgedRouter (provider clients,
+circuit breaker and latency telemetry are shared by every user) and are
+limited by a semaphore, so the providers' rate limits are respected
+whatever the number of users.
+
+Start with: python app.py --serve [--port 8780] [--workers 4] [--llm-concurrency 4]
+Add --standin to answer with the offline stand-in (llm_standin.py) instead of the real APIs.
+
+Endpoints (JSON bodies and responses):
+  POST   /documents                 .docx bytes, or {"text": ...}       -> {"id", "length"}
+  GET    /documents/<id>                                                -> document status
+  DELETE /documents/<id>
+  POST   /documents/<id>/extract    {"start_word", "end_word"} (none: whole text)
+  POST   /documents/<id>/mask       {"names": [...], "pii": [...], "profile": "case"}
+  POST   /documents/<id>/generate   {"instructions" or "instruction_label", "model", "message", "unmask"}
+                                    -> text/event-stream: "chunk" events, then "done" or "error"
+                                    ("message" continues the conversation: 409 if there is none)
+  POST   /documents/<id>/unmask     {"text"}                            -> {"text"}
+  GET    /health
+
+The service keeps real document texts in memory: bind it to localhost or a
+trusted network only.
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Callable
+
+from llm_routing import HedgedRouter, CircuitBreaker, LatencyTelemetry
+from masking import OccurrenceStore, PlaceholderRestorer, PII_CATEGORIES
+from masking_profiles import ProfileStore
+from template_store import TemplateStore, INSTRUCTION
+from pipeline import (read_docx_text, find_extraction_range, mask_document, masked_text, build_prompt,
+                      unmask, read_private_settings, build_registry)
+
+
+class ServiceError(Exception):
+    """An error reported to the client with an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection while a response was being written"""
+    pass
+
+
+class ServiceDocument:
+    """One uploaded document and its extraction, masking and conversation"""
+
+    def __init__(self, doc_id: str, text: str):
+        self.id = doc_id
+        self.text = text
+        self.start = 0
+        self.end = len(text)
+        self.occurrences = OccurrenceStore()
+        self.masked = text  # Masked extraction (nothing masked yet)
+        self.conversation: List[Dict[str, str]] = []  # Replaced, never changed in place
+        self.generating = False  # An answer is streaming (the lock is not held meanwhile)
+        self.lock = threading.Lock()  # One operation at a time per document
+        self.updated = time.time()
+
+    @property
+    def extracted(self) -> str:
+        if self.start == 0 and self.end == len(self.text):
+            return self.text
+        return self.text[self.start:self.end]
+
+    def status(self) -> Dict:
+        return {"id": self.id, "length": len(self.text), "start": self.start, "end": self.end,
+                "masked_names": len(self.occurrences.name_index), "masked_occurrences": len(self.occurrences),
+                "messages": len(self.conversation)}
+
+
+class PipelineService:
+    """The documents of all users, the worker pool and the shared LLM router"""
+
+    def __init__(self, registry, workers: Optional[int] = None, llm_concurrency: int = 4,
+                 llm_wait_timeout: float = 300.0, max_documents: int = 200,
+                 profiles_file: str = "masking_profiles.json", templates_file: str = "templates.db",
+                 first_token_deadline: float = 10.0, backup_models: Optional[List[str]] = None):
+        self.registry = registry
+        self.router = HedgedRouter(
+            registry,
+            first_token_deadline=first_token_deadline,
+            backup_models=backup_models or [],
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=120.0),
+            telemetry=LatencyTelemetry("latency_telemetry.json")
+        )
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)  # Parsing, extraction and masking
+        self.llm_concurrency = llm_concurrency
+        self.llm_slots = threading.BoundedSemaphore(llm_concurrency)  # Provider calls in flight
+        self.llm_wait_timeout = llm_wait_timeout  # Seconds a request may wait for a free slot
+        self.llm_active = 0
+        self.max_documents = max_documents  # Least recently used documents are dropped beyond this
+        self.documents: "OrderedDict[str, ServiceDocument]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.profile_store = ProfileStore(profiles_file)
+        self.profile_store.load()
+        self.profile_lock = threading.Lock()  # Profiles hand out IDs: mask with one profile at a time
+        self.templates_file = templates_file
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---- documents ---------------------------------------------------------
+
+    def get(self, doc_id: str) -> ServiceDocument:
+        with self.lock:
+            document = self.documents.get(doc_id)
+            if document is None:
+                raise ServiceError(404, f"Unknown document: {doc_id}")
+            self.documents.move_to_end(doc_id)
+            return document
+
+    def upload(self, data: Optional[bytes] = None, text: Optional[str] = None) -> Dict:
+        """Register a document from .docx bytes (parsed in the pool) or from plain text"""
+        if text is None:
+            try:
+                text = self.pool.submit(read_docx_text, data).result()
+            except Exception as e:
+                raise ServiceError(400, f"Failed to load document: {e}")
+        document = ServiceDocument(uuid.uuid4().hex[:12], text)
+        with self.lock:
+            self.documents[document.id] = document
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+        return document.status()
+
+    def delete(self, doc_id: str):
+        with self.lock:
+            if self.documents.pop(doc_id, None) is None:
+                raise ServiceError(404, f"Unknown document: {doc_id}")
+
+    def extract(self, doc_id: str, start_word: str = "", end_word: str = "") -> Dict:
+        """Extract between two markers (the whole text without markers); resets the masking"""
+        document = self.get(doc_id)
+        with document.lock:
+            approximate = False
+            if start_word and end_word:
+                try:
+                    start, end, approximate = self.pool.submit(find_extraction_range, document.text,
+                                                               start_word, end_word).result()
+                except ValueError as e:
+                    raise ServiceError(422, str(e))
+            elif start_word or end_word:
+                raise ServiceError(400, "Give both start_word and end_word, or neither.")
+            else:
+                start, end = 0, len(document.text)
+            document.start, document.end = start, end
+            document.occurrences = OccurrenceStore()
+            document.masked = document.extracted
+            document.conversation = []
+            document.updated = time.time()
+            status = document.status()
+        status["approximate"] = approximate
+        return status
+
+    def mask(self, doc_id: str, names: List[str], pii_categories: List[str], profile: Optional[str] = None) -> Dict:
+        """Mask names and PII values (and the entries of a profile) in the extraction"""
+        unknown = [category for category in pii_categories if category not in PII_CATEGORIES]
+        if unknown:
+            raise ServiceError(400, f"Unknown PII categories: {', '.join(unknown)}")
+        document = self.get(doc_id)
+        with document.lock:
+            extracted = document.extracted
+            if profile:
+                with self.profile_lock:
+                    if profile not in self.profile_store.profiles:
+                        raise ServiceError(404, f"Unknown profile: {profile}")
+                    store = self.pool.submit(mask_document, extracted, names, pii_categories,
+                                             self.profile_store.profiles[profile], document.occurrences).result()
+                    # New names and values keep their IDs for the next documents of the case
+                    self.profile_store.update_from_store(profile, store)
+            else:
+                store = self.pool.submit(mask_document, extracted, names, pii_categories, None,
+                                         document.occurrences).result()
+            document.occurrences = store
+            document.masked = masked_text(extracted, store)
+            document.updated = time.time()
+            status = document.status()
+        status["masked_text"] = document.masked
+        return status
+
+    def unmask(self, doc_id: str, text: str) -> str:
+        document = self.get(doc_id)
+        return unmask(text, document.occurrences, document.extracted)
+
+    # ---- generation --------------------------------------------------------
+
+    def instruction_text(self, label: str) -> str:
+        # SQLite connections are per thread: open the template store for this request
+        store = TemplateStore(self.templates_file)
+        try:
+            text = store.get(INSTRUCTION, label)
+        finally:
+            store.close()
+        if text is None:
+            raise ServiceError(404, f"Unknown instruction label: {label}")
+        return text
+
+    def generate(self, doc_id: str, emit: Callable[[str, Dict], None], instructions: str = "",
+                 model: Optional[str] = None, message: str = "", restore: bool = False) -> str:
+        """Send the masked document (or a follow-up message) to the LLM, calling emit(event, data)
+        for each streamed chunk. With restore=True the chunks are unmasked before they are sent.
+        The document is only locked to read the prompt and to store the answer, so its status
+        and unmasking stay available while the answer streams."""
+        document = self.get(doc_id)
+        model = model or next(iter(self.registry.get_all_models()), None)
+        if not model or not self.registry.get_provider_for_model(model):
+            raise ServiceError(400, f"No provider for model: {model}")
+        with document.lock:
+            if message and not document.conversation:
+                raise ServiceError(409, "The document has no conversation yet: generate without a message first.")
+            if document.generating:
+                raise ServiceError(409, "An answer is already being generated for this document.")
+            document.generating = True
+            conversation = document.conversation
+            if message:
+                messages = conversation + [{"role": "user", "content": message}]
+            else:
+                messages = [{"role": "user", "content": build_prompt(instructions, document.masked)}]
+            stream_restorer = None
+            if restore:
+                stream_restorer = PlaceholderRestorer.from_store(document.occurrences, document.extracted).stream()
+        try:
+            if not self.llm_slots.acquire(timeout=self.llm_wait_timeout):
+                raise ServiceError(503, "All LLM slots are busy, try again later.")
+            try:
+                with self.lock:
+                    self.llm_active += 1
+
+                def stream_callback(text_chunk):
+                    if text_chunk:
+                        emit("chunk", {"text": stream_restorer.feed(text_chunk) if stream_restorer else text_chunk})
+
+                response_text = self.router.send_message(messages=messages, model=model, max_tokens=64000,
+                                                         stream=True, stream_callback=stream_callback)
+                if stream_restorer:
+                    tail = stream_restorer.flush()
+                    if tail:
+                        emit("chunk", {"text": tail})
+            finally:
+                with self.lock:
+                    self.llm_active -= 1
+                self.llm_slots.release()
+            with document.lock:
+                # A new extraction resets the conversation: the answer belongs to the old one
+                if document.conversation is not conversation:
+                    raise ServiceError(409, "The document was extracted again during the answer; "
+                                            "the answer was not added to its conversation.")
+                document.conversation = messages + [{"role": "assistant", "content": response_text}]
+                document.updated = time.time()
+            return response_text
+        finally:
+            with document.lock:
+                document.generating = False
+
+    def health(self) -> Dict:
+        with self.lock:
+            return {"documents": len(self.documents), "models": self.registry.get_all_models(),
+                    "llm_concurrency": self.llm_concurrency, "llm_active": self.llm_active,
+                    "workers": self.workers}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Request handler; `self.server.service` holds the PipelineService"""
+
+    protocol_version = "HTTP/1.1"
+    route = re.compile(r"^/documents/([0-9a-f]+)(?:/(extract|mask|generate|unmask))?$")
+
+    def log_message(self, format, *args):
+        pass  # Requests are not logged: URLs carry no data, bodies must never be logged
+
+    # ---- helpers -------------------------------------------------------
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self) -> Dict:
+        body = self._read_body()
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            raise ServiceError(400, "Invalid JSON body.")
+        if not isinstance(data, dict):
+            raise ServiceError(400, "The JSON body must be an object.")
+        return data
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _sse(self, event: str, data: Dict):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _dispatch(self, handler: Callable[[], None]):
+        try:
+            handler()
+        except (ClientDisconnected, ConnectionError):
+            # Nobody is left to answer: drop the connection quietly
+            self.close_connection = True
+        except ServiceError as e:
+            self._send_json({"error": str(e)}, e.status)
+        except Exception as e:
+            self._send_json({"error": f"Internal error: {e}"}, 500)
+
+    # ---- routes ----------------------------------------------------------
+
+    def do_GET(self):
+        def handle():
+            service = self.server.service
+            if self.path == "/health":
+                self._send_json(service.health())
+                return
+            match = self.route.match(self.path)
+            if not match or match.group(2):
+                raise ServiceError(404, "Not found.")
+            self._send_json(service.get(match.group(1)).status())
+        self._dispatch(handle)
+
+    def do_DELETE(self):
+        def handle():
+            match = self.route.match(self.path)
+            if not match or match.group(2):
+                raise ServiceError(404, "Not found.")
+            self.server.service.delete(match.group(1))
+            self._send_json({"deleted": match.group(1)})
+        self._dispatch(handle)
+
+    def do_POST(self):
+        def handle():
+            service = self.server.service
+            if self.path == "/documents":
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    text = self._read_json().get("text")
+                    if not isinstance(text, str):
+                        raise ServiceError(400, "Expected {\"text\": ...} or the .docx file as the body.")
+                    self._send_json(service.upload(text=text), 201)
+                else:
+                    self._send_json(service.upload(data=self._read_body()), 201)
+                return
+            match = self.route.match(self.path)
+            if not match or not match.group(2):
+                raise ServiceError(404, "Not found.")
+            doc_id, action = match.groups()
+            data = self._read_json()
+            if action == "extract":
+                self._send_json(service.extract(doc_id, data.get("start_word", "").strip(),
+                                                data.get("end_word", "").strip()))
+            elif action == "mask":
+                names = data.get("names", [])
+                if isinstance(names, str):
+                    names = names.split(",")
+                names = [name.strip() for name in names if name.strip()]
+                pii_categories = data.get("pii", [])
+                if pii_categories is True:
+                    pii_categories = list(PII_CATEGORIES)
+                self._send_json(service.mask(doc_id, names, pii_categories, data.get("profile")))
+            elif action == "unmask":
+                self._send_json({"text": service.unmask(doc_id, data.get("text", ""))})
+            else:
+                self._generate(doc_id, data)
+        self._dispatch(handle)
+
+    def _generate(self, doc_id: str, data: Dict):
+        service = self.server.service
+        instructions = data.get("instructions", "")
+        if not instructions and data.get("instruction_label"):
+            instructions = service.instruction_text(data["instruction_label"])
+        service.get(doc_id)  # 404 before the stream starts
+        started = False
+
+        def emit(event: str, payload: Dict):
+            nonlocal started
+            try:
+                if not started:
+                    started = True
+                    self._start_sse()
+                self._sse(event, payload)
+            except ConnectionError:
+                # Aborts the request; the router cancels the provider call
+                raise ClientDisconnected()
+
+        try:
+            text = service.generate(doc_id, emit, instructions=instructions, model=data.get("model"),
+                                    message=data.get("message", ""), restore=bool(data.get("unmask")))
+        except ClientDisconnected:
+            raise
+        except Exception as e:
+            if started:
+                # Headers are sent: report the error in the stream
+                emit("error", {"error": str(e)})
+                return
+            if isinstance(e, ServiceError):
+                raise
+            raise ServiceError(502, f"LLM request failed: {e}")
+        if data.get("unmask"):
+            text = service.unmask(doc_id, text)
+        emit("done", {"text": text})
+
+
+def start_service(service: PipelineService, host: str = "127.0.0.1", port: int = 0):
+    """Start the service in a background thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve the document pipeline over a local HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="LLM requests in flight at once")
+    parser.add_argument("--private", default="private.txt", help="API keys file")
+    parser.add_argument("--standin", action="store_true", help="Use the offline LLM stand-in")
+    args = parser.parse_args(argv)
+
+    settings = read_private_settings(args.private)
+    if args.standin:
+        from llm_standin import start_standin_server
+        _, standin_url = start_standin_server()
+        settings = {"claude_api_key": "standin", "claude_base_url": standin_url,
+                    "openai_api_key": "standin", "openai_base_url": standin_url}
+    registry = build_registry(settings)
+    if not registry.get_all_models():
+        print(f"Warning: No LLM provider configured in '{args.private}'; generation is disabled.")
+
+    service = PipelineService(registry, workers=args.workers, llm_concurrency=args.llm_concurrency)
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"Pipeline service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Session Journal
+
+Keeps the working session (loaded document, extraction, masking and
+conversation) in a local SQLite database so it survives a crash or a
+restart. Every change is appended as a small delta; large texts are stored
+once in a blob table instead of being repeated in each delta. After a number
+of deltas the journal is compacted into a single snapshot, so restoring
+reads one snapshot and a short tail of deltas whatever the size of the
+session. The database file is only created with the first delta, so a
+document that is never loaded leaves nothing to restore.
+
+Only what is on the user's own disk is stored: the original document text
+is needed to restore the extraction, so the database must stay local.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from masking import OccurrenceStore
+
+
+def empty_session_state() -> Dict:
+    return {
+        "source_path": None,
+        "view_start": 0,
+        "view_end": 0,
+        "edited": False,  # True when the extraction is the 'edited' blob instead of a view
+        "masking": {},  # Normalized name -> {'original', 'category', 'id', 'spans': [[start, end], ...]}
+        "conversation": [],  # Conversation history (masked)
+        "names_input": "",
+        "updated": None,
+    }
+
+
+def apply_delta(state: Dict, op: str, data: Dict):
+    """Apply one journal delta to a session state (used both live and on replay)"""
+    if op == "document":
+        state.update(empty_session_state())
+        state["source_path"] = data.get("source_path")
+        state["view_end"] = data.get("length", 0)
+    elif op == "extraction":
+        state["view_start"] = data["view_start"]
+        state["view_end"] = data["view_end"]
+        state["edited"] = data["edited"]
+    elif op == "masking":
+        masking = state["masking"]
+        for key in data.get("remove", []):
+            masking.pop(key, None)
+        for key, entry in data.get("set", {}).items():
+            masking[key] = entry
+    elif op == "chat":
+        state["conversation"].append(data)
+    elif op == "chat_reset":
+        state["conversation"] = []
+    elif op == "names_input":
+        state["names_input"] = data["text"]
+    state["updated"] = time.time()
+
+
+def masking_entries(store: OccurrenceStore) -> Dict[str, Dict]:
+    """Describe an occurrence store as {normalized name: entry} (see empty_session_state)"""
+    entries = {}
+    for slot in store.slots_by_id():
+        info = store.names[slot]
+        entries[info['normalized_name']] = {
+            "original": info['original_name'],
+            "category": info['category'],
+            "id": info['id'],
+            "spans": []
+        }
+    for start, length, slot in store:
+        entries[store.names[slot]['normalized_name']]["spans"].append([start, start + length])
+    return entries
+
+
+def restore_occurrences(store: OccurrenceStore, masking: Dict[str, Dict]):
+    """Rebuild an occurrence store from the masking part of a session state"""
+    store.clear()
+    ordered = sorted(masking.items(), key=lambda item: (item[1]["category"] != "NAME", item[1]["category"], item[1]["id"]))
+    for key, entry in ordered:
+        slot = store.add_name(key, entry["original"], entry["category"], entry["id"])
+        store.add_occurrences(slot, [tuple(span) for span in entry["spans"]])
+
+
+class SessionJournal:
+    """Append-only journal of session deltas with periodic compaction into a snapshot"""
+
+    def __init__(self, db_path: str = "session.db", compact_every: int = 200):
+        self.db_path = db_path
+        self.compact_every = compact_every  # Deltas appended before the journal is compacted
+        self.conn: Optional[sqlite3.Connection] = None  # Opened with the file, or on the first delta
+        self.state = empty_session_state()
+        self.pending = 0  # Deltas in the journal since the last snapshot
+        if os.path.exists(db_path):
+            self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database, creating it if needed"""
+        if self.conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS snapshot (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                         "state TEXT NOT NULL, last_seq INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "op TEXT NOT NULL, data TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs (name TEXT PRIMARY KEY, text TEXT NOT NULL)")
+            self.conn = conn
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def delete(self):
+        """Close the journal and remove its files (its document was closed or holds nothing)"""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        self.state = empty_session_state()
+        self.pending = 0
+
+    # ---- restore -----------------------------------------------------------
+
+    def load(self) -> Dict:
+        """Read the snapshot, replay the deltas after it and return the session state"""
+        state = empty_session_state()
+        if self.conn is None:
+            self.state = state
+            return state
+        last_seq = 0
+        row = self.conn.execute("SELECT state, last_seq FROM snapshot WHERE id = 1").fetchone()
+        if row:
+            state.update(json.loads(row[0]))
+            last_seq = row[1]
+        self.pending = 0
+        for op, data in self.conn.execute("SELECT op, data FROM journal WHERE seq > ? ORDER BY seq", (last_seq,)):
+            apply_delta(state, op, json.loads(data))
+            self.pending += 1
+        self.state = state
+        return state
+
+    def get_blob(self, name: str) -> Optional[str]:
+        if self.conn is None:
+            return None
+        row = self.conn.execute("SELECT text FROM blobs WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # ---- recording ---------------------------------------------------------
+
+    def record(self, op: str, data: Dict, blobs: Optional[Dict[str, Optional[str]]] = None):
+        """Append a delta (and replace the given blobs; None deletes one) in one transaction"""
+        apply_delta(self.state, op, data)
+        conn = self.connect()
+        with conn:
+            conn.execute("BEGIN")
+            for name, text in (blobs or {}).items():
+                if text is None:
+                    conn.execute("DELETE FROM blobs WHERE name = ?", (name,))
+                else:
+                    conn.execute("INSERT OR REPLACE INTO blobs (name, text) VALUES (?, ?)", (name, text))
+            conn.execute("INSERT INTO journal (op, data) VALUES (?, ?)",
+                         (op, json.dumps(data, ensure_ascii=False)))
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Replace the snapshot with the current state and drop the journaled deltas"""
+        if self.conn is None:
+            return  # Nothing was journaled
+        with self.conn:
+            self.conn.execute("BEGIN")
+            last_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM journal").fetchone()[0]
+            self.conn.execute("INSERT OR REPLACE INTO snapshot (id, state, last_seq) VALUES (1, ?, ?)",
+                              (json.dumps(self.state, ensure_ascii=False), last_seq))
+            self.conn.execute("DELETE FROM journal WHERE seq <= ?", (last_seq,))
+        self.pending = 0
+
+    def record_document(self, source_path: Optional[str], source: str):
+        """A new document starts a new session"""
+        self.record("document", {"source_path": source_path, "length": len(source)},
+                    blobs={"source": source, "edited": None})
+        self.compact()
+
+    def record_extraction(self, view_start: int, view_end: int, edited_text: Optional[str]):
+        self.record("extraction", {"view_start": view_start, "view_end": view_end, "edited": edited_text is not None},
+                    blobs={"edited": edited_text})
+
+    def record_masking(self, store: OccurrenceStore):
+        """Journal only the names whose entry changed since the last recorded state"""
+        current = masking_entries(store)
+        previous = self.state["masking"]
+        changed = {key: entry for key, entry in current.items() if previous.get(key) != entry}
+        removed = [key for key in previous if key not in current]
+        if changed or removed:
+            self.record("masking", {"set": changed, "remove": removed})
+
+    def record_chat(self, message: Dict[str, str]):
+        self.record("chat", {"role": message["role"], "content": message["content"]})
+
+    def record_chat_reset(self):
+        if self.state["conversation"]:
+            self.record("chat_reset", {})
+
+    def record_names_input(self, text: str):
+        if text != self.state["names_input"]:
+            self.record("names_input", {"text": text})
+
@@ -0,0 +1,101 @@
+"""
+Stream Checkpoints
+
+Persists streamed LLM output to disk as it arrives so a generation that drops
+mid-stream can be resumed instead of restarted. The request (masked messages
+and model) is written once to a small JSON header; streamed text is appended
+to a companion text file, so each chunk costs one append, not a rewrite.
+
+Only masked text is ever written: placeholders are restored for display only.
+"""
+
+import json
+import os
+import time
+from typing import List, Dict, Optional
+
+
+def join_continuation(partial: str, continuation: str) -> str:
+    """Join a resumed stream to the text received before the failure.
+
+    Providers that continue from an assistant prefix need the prefix without
+    trailing whitespace, so the continuation may or may not start with the
+    whitespace that was dropped. Keep exactly one side's whitespace.
+    """
+    if continuation[:1].isspace():
+        return partial.rstrip() + continuation
+    return partial + continuation
+
+
+class StreamCheckpoint:
+    """Append-only checkpoint of one streamed response"""
+
+    def __init__(self, base_path: str = "stream_checkpoint", sync_interval: float = 1.0):
+        self.header_path = base_path + ".json"
+        self.partial_path = base_path + ".partial.txt"
+        self.sync_interval = sync_interval  # Seconds between fsync calls while streaming
+        self.partial_file = None
+        self.last_sync = 0.0
+
+    def start(self, model: str, messages: List[Dict[str, str]], partial: str = ""):
+        """Begin checkpointing a request (optionally continuing existing partial text)"""
+        self.close()
+        header = {"model": model, "messages": messages, "started": time.time()}
+        tmp_path = self.header_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(tmp_path, self.header_path)
+
+        self.partial_file = open(self.partial_path, 'w', encoding='utf-8', newline='')
+        if partial:
+            self.partial_file.write(partial)
+        self.partial_file.flush()
+        self.last_sync = time.monotonic()
+
+    def append(self, text_chunk: str):
+        """Append a streamed chunk; fsync at most once per sync interval"""
+        if not self.partial_file or not text_chunk:
+            return
+        self.partial_file.write(text_chunk)
+        self.partial_file.flush()
+        now = time.monotonic()
+        if now - self.last_sync >= self.sync_interval:
+            os.fsync(self.partial_file.fileno())
+            self.last_sync = now
+
+    def close(self):
+        """Close the partial file but keep the checkpoint on disk"""
+        if self.partial_file:
+            try:
+                self.partial_file.flush()
+                os.fsync(self.partial_file.fileno())
+            except (OSError, ValueError):
+                pass
+            self.partial_file.close()
+            self.partial_file = None
+
+    def clear(self):
+        """Remove the checkpoint after a stream completed successfully"""
+        self.close()
+        for path in (self.header_path, self.partial_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self) -> Optional[Dict]:
+        """Return {'model', 'messages', 'partial'} of a leftover checkpoint, or None"""
+        if not os.path.exists(self.header_path):
+            return None
+        try:
+            with open(self.header_path, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+            partial = ""
+            if os.path.exists(self.partial_path):
+                with open(self.partial_path, 'r', encoding='utf-8', newline='') as f:
+                    partial = f.read()
+        except Exception as e:
+            print(f"Warning: Could not read stream checkpoint: {e}")
+            return None
+        if not partial:
+            return None
+        header["partial"] = partial
+        return header
@@ -0,0 +1,175 @@
+"""
+Template Store
+
+Instruction and chat message templates in one embedded SQLite database.
+Each Save, Create or Delete is a single-row transaction, so a crash can
+never lose or truncate the other templates. Labels are listed without
+reading the template texts, which are only loaded when selected, so
+startup does not depend on how many templates exist.
+
+Templates are searchable with SQLite full-text search (FTS5) when the
+SQLite build provides it, and with LIKE otherwise.
+
+The legacy instructions.txt / chat.txt files are imported once.
+"""
+
+import os
+import sqlite3
+import time
+from typing import List, Dict, Optional, Tuple
+
+# Template kinds
+INSTRUCTION = "instruction"
+CHAT = "chat"
+
+
+def parse_legacy_templates(file_path: str) -> Dict[str, str]:
+    """Parse the legacy '"label" :: "text"' format of instructions.txt and chat.txt"""
+    templates = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            # Parse format: "label" :: "text"
+            if ' :: ' in line:
+                parts = line.split(' :: ', 1)
+                if len(parts) == 2:
+                    label = parts[0].strip().strip('"')
+                    text = parts[1].strip().strip('"')
+                    # Handle escaped quotes and newlines
+                    text = text.replace('\\n', '\n').replace('\\"', '"')
+                    templates[label] = text
+    return templates
+
+
+class TemplateStore:
+    """SQLite-backed store of labeled templates, grouped by kind"""
+
+    def __init__(self, db_path: str = "templates.db"):
+        self.db_path = db_path
+        # Only used from the Tk thread; autocommit mode, transactions are explicit
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                label TEXT NOT NULL,
+                text TEXT NOT NULL DEFAULT '',
+                updated REAL NOT NULL,
+                UNIQUE (kind, label)
+            )""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.has_fts = self._create_fts()
+
+    def _create_fts(self) -> bool:
+        """Create the full-text index and the triggers that keep it in sync (if FTS5 is available)"""
+        try:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                exists = self.conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'templates_fts'").fetchone()
+                self.conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS templates_fts USING fts5(
+                        label, text, content='templates', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2')""")
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS templates_ai AFTER INSERT ON templates BEGIN
+                        INSERT INTO templates_fts(rowid, label, text) VALUES (new.id, new.label, new.text);
+                    END""")
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS templates_ad AFTER DELETE ON templates BEGIN
+                        INSERT INTO templates_fts(templates_fts, rowid, label, text)
+                        VALUES ('delete', old.id, old.label, old.text);
+                    END""")
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS templates_au AFTER UPDATE ON templates BEGIN
+                        INSERT INTO templates_fts(templates_fts, rowid, label, text)
+                        VALUES ('delete', old.id, old.label, old.text);
+                        INSERT INTO templates_fts(rowid, label, text) VALUES (new.id, new.label, new.text);
+                    END""")
+                if not exists:
+                    # Index templates stored before the index existed
+                    self.conn.execute("INSERT INTO templates_fts(templates_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"Warning: Full-text search unavailable, using simple search: {e}")
+            return False
+
+    def close(self):
+        self.conn.close()
+
+    # ---- templates -------------------------------------------------------
+
+    def labels(self, kind: str) -> List[str]:
+        """Sorted labels of a kind (template texts are not read)"""
+        rows = self.conn.execute("SELECT label FROM templates WHERE kind = ? ORDER BY label", (kind,))
+        return [row[0] for row in rows]
+
+    def get(self, kind: str, label: str) -> Optional[str]:
+        row = self.conn.execute("SELECT text FROM templates WHERE kind = ? AND label = ?", (kind, label)).fetchone()
+        return row[0] if row else None
+
+    def exists(self, kind: str, label: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM templates WHERE kind = ? AND label = ?",
+                                 (kind, label)).fetchone() is not None
+
+    def count(self, kind: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM templates WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def put(self, kind: str, label: str, text: str):
+        """Create or update one template (single-row transaction)"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("""
+                INSERT INTO templates (kind, label, text, updated) VALUES (?, ?, ?, ?)
+                ON CONFLICT (kind, label) DO UPDATE SET text = excluded.text, updated = excluded.updated
+                """, (kind, label, text, time.time()))
+
+    def delete(self, kind: str, label: str):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM templates WHERE kind = ? AND label = ?", (kind, label))
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 50) -> List[Tuple[str, str]]:
+        """Find templates whose label or text contains the query words.
+        Returns (kind, label) pairs, best matches first."""
+        query = query.strip()
+        if not query:
+            return []
+        if self.has_fts:
+            # Quote each word so user input is never parsed as FTS syntax; prefix match on each word
+            fts_query = " ".join('"' + word.replace('"', '""') + '"*' for word in query.split())
+            sql = ("SELECT t.kind, t.label FROM templates_fts JOIN templates t ON t.id = templates_fts.rowid "
+                   "WHERE templates_fts MATCH ?" + (" AND t.kind = ?" if kind else "") + " ORDER BY rank LIMIT ?")
+            params = [fts_query] + ([kind] if kind else []) + [limit]
+        else:
+            conditions = []
+            params = []
+            for word in query.split():
+                conditions.append("(label LIKE ? OR text LIKE ?)")
+                params += [f"%{word}%", f"%{word}%"]
+            sql = ("SELECT kind, label FROM templates WHERE " + " AND ".join(conditions)
+                   + (" AND kind = ?" if kind else "") + " ORDER BY kind, label LIMIT ?")
+            params += ([kind] if kind else []) + [limit]
+        return [(row[0], row[1]) for row in self.conn.execute(sql, params)]
+
+    # ---- one-time import -------------------------------------------------
+
+    def import_legacy_file(self, kind: str, file_path: str) -> int:
+        """Import a legacy text file once (later calls do nothing). Returns the number imported."""
+        marker = f"imported:{kind}"
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return 0
+        templates = parse_legacy_templates(file_path) if os.path.exists(file_path) else {}
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for label, text in templates.items():
+                # Existing rows win: they were edited after the file was written
+                self.conn.execute("INSERT OR IGNORE INTO templates (kind, label, text, updated) VALUES (?, ?, ?, ?)",
+                                  (kind, label, text, now))
+            self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, file_path))
+        return len(templates)
@@ -0,0 +1,54 @@
+from llm_providers import LLMModelRegistry, LLMProvider
+from llm_routing import AutoModelSelector, LatencyTelemetry
+
+
+class ModelsOnly(LLMProvider):
+    def __init__(self, models):
+        self.models = models
+
+    def get_available_models(self):
+        return self.models
+
+    def validate_model(self, model):
+        return model in self.models
+
+    def send_message(self, messages, model, max_tokens=64000, stream=False, stream_callback=None):
+        raise NotImplementedError
+
+
+def make_selector(telemetry):
+    registry = LLMModelRegistry()
+    registry.register_provider("claude", ModelsOnly(
+        ["claude-opus-4-5-20251101", "claude-sonnet-4-5-20250929", "claude-haiku-4-5-20251001"]))
+    return AutoModelSelector(registry, telemetry, target_seconds=90.0)
+
+
+def test_labels_with_different_answer_lengths_choose_different_models():
+    telemetry = LatencyTelemetry(file_path=None)
+    telemetry.record_output_ratio("summary", 100_000, 5_000)
+    telemetry.record_output_ratio("full report", 100_000, 150_000)
+    selector = make_selector(telemetry)
+
+    short, _ = selector.choose(100_000, 100_000, is_first=True, instruction_label="summary")
+    long, _ = selector.choose(100_000, 100_000, is_first=True, instruction_label="full report")
+    assert short == "claude-opus-4-5-20251101"
+    assert long == "claude-sonnet-4-5-20250929"
+
+
+def test_configured_ratio_wins_over_telemetry():
+    telemetry = LatencyTelemetry(file_path=None)
+    telemetry.record_output_ratio("summary", 100_000, 150_000)
+    selector = make_selector(telemetry)
+    selector.label_output_ratio["summary"] = 0.05
+    assert selector.estimate_output_chars(100_000, True, "summary") == 5_000
+    assert selector.estimate_output_chars(100_000, True, "unknown") == 40_000
+
+
+def test_output_ratios_persist(tmp_path):
+    path = str(tmp_path / "latency_telemetry.json")
+    telemetry = LatencyTelemetry(path)
+    telemetry.record("claude-opus-4-5-20251101", 2.0, 1000, 6.0)
+    telemetry.record_output_ratio("summary", 1000, 100)
+    reloaded = LatencyTelemetry(path)
+    assert reloaded.get_output_ratio("summary") == 0.1
+    assert reloaded.get("claude-opus-4-5-20251101")["ttft"] == 2.0
@@ -0,0 +1,63 @@
+import llm_routing
+from llm_routing import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def open_breaker(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_routing.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    breaker.record_failure("claude")
+    assert breaker.allow_request("claude")
+    breaker.record_failure("claude")
+    assert not breaker.allow_request("claude")
+    clock.now += 61
+    return breaker, clock
+
+
+def test_half_open_admits_a_single_trial(monkeypatch):
+    breaker, _ = open_breaker(monkeypatch)
+    assert not breaker.is_open("claude")
+    assert breaker.allow_request("claude")
+    # The trial is in flight: every other request is refused
+    assert breaker.is_open("claude")
+    assert not breaker.allow_request("claude")
+    breaker.record_success("claude")
+    assert breaker.allow_request("claude")
+    assert breaker.allow_request("claude")
+
+
+def test_failed_trial_reopens_the_circuit(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+    assert breaker.allow_request("claude")
+    breaker.record_failure("claude")
+    assert not breaker.allow_request("claude")
+    clock.now += 30
+    assert not breaker.allow_request("claude")
+    clock.now += 31
+    assert breaker.allow_request("claude")
+
+
+def test_cancelled_or_lost_trial_lets_another_through(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+    assert breaker.allow_request("claude")
+    breaker.record_cancelled("claude")
+    assert breaker.allow_request("claude")
+    # This trial never reports back: it is given up after reset_timeout
+    assert not breaker.allow_request("claude")
+    clock.now += 61
+    assert breaker.allow_request("claude")
+
+
+def test_providers_are_independent(monkeypatch):
+    breaker, _ = open_breaker(monkeypatch)
+    assert breaker.allow_request("claude")
+    assert breaker.allow_request("openai")
+    assert breaker.allow_request("openai")
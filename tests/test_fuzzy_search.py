@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from fuzzy_search import find_approximate
+from masking import NormalizedText
+from synthetic_reports import report_text
+
+
+@pytest.fixture(scope="module")
+def report_index():
+    # A report of realistic size, with every heading repeated throughout
+    return NormalizedText(report_text(4_000_000))
+
+
+def test_finds_misspelled_marker_ignoring_case_and_accents():
+    text = "PRÉAMBULE\nLes ANTÉCÉDENTS du patient.\nCONCLUSION"
+    candidates = find_approximate(NormalizedText(text), "antecedants")
+    assert candidates[0]['text'] == "ANTÉCÉDENTS"
+    assert candidates[0]['distance'] == 1
+
+
+def test_ranks_by_distance_then_position():
+    text = "antecedants ... antecedents ... antecedent ... antecedents"
+    candidates = find_approximate(NormalizedText(text), "antecedents", limit=5)
+    assert [(c['start'], c['distance']) for c in candidates] == [(16, 0), (47, 0), (0, 1), (32, 1)]
+
+
+def test_min_position_skips_earlier_matches():
+    text = "CONCLUSION\n" + "x" * 50 + "\nCONCLUSOIN"
+    candidates = find_approximate(NormalizedText(text), "conclusion", min_position=1)
+    assert [c['start'] for c in candidates] == [text.rindex("CONCLUSOIN")]
+
+
+def test_no_candidate_for_absent_marker():
+    assert find_approximate(NormalizedText("Rien de comparable ici."), "xyzzy plugh") == []
+
+
+@pytest.mark.parametrize("marker", ["documents presentes", "antecedants", "conclusoin", "patient vuu", "xyzzy plugh"])
+def test_search_in_large_report_is_fast(report_index, marker):
+    start = time.perf_counter()
+    candidates = find_approximate(report_index, marker, 2, limit=20)
+    elapsed = time.perf_counter() - start
+    assert len(candidates) <= 20
+    # About 30 ms on a laptop; the bound leaves room for slow CI machines
+    assert elapsed < 0.25, f"{marker!r} took {elapsed * 1000:.0f} ms"
@@ -0,0 +1,46 @@
+from masking import NameMatcher, OccurrenceStore, NormalizedText, find_name_occurrences, normalize_text
+from masking_profiles import ProfileStore
+from pipeline import mask_names
+
+TEXT = "Jean Dupont a vu M. Dupont, puis Jean-Pierre Le Gall et Le Gall."
+
+
+def masked_spans(store):
+    return [(start, start + length, store.names[slot]['normalized_name']) for start, length, slot in store]
+
+
+def profile_store(tmp_path, names):
+    profiles = ProfileStore(str(tmp_path / "masking_profiles.json"))
+    profiles.profiles["case"] = {"names": [{"name": name, "normalized": normalize_text(name), "id": i}
+                                           for i, name in enumerate(names, 1)],
+                                 "pii_values": [], "pii_categories": []}
+    return profiles
+
+
+def test_matcher_finds_what_each_name_search_finds():
+    names = ["Dupont", "Jean Dupont", "Jean-Pierre Le Gall", "Le Gall", "Pierre"]
+    found = NameMatcher(names).find(TEXT)
+    index = NormalizedText(TEXT)
+    assert found == {name: find_name_occurrences(index, name) for name in names}
+
+
+def test_profile_apply_follows_name_order_like_apply(tmp_path):
+    for names in (["Dupont", "Jean Dupont"], ["Jean Dupont", "Dupont"], ["Le Gall", "Jean-Pierre Le Gall"]):
+        expected = OccurrenceStore()
+        mask_names(TEXT, expected, names)
+        applied = OccurrenceStore()
+        profile_store(tmp_path, names).apply("case", TEXT, applied)
+        assert masked_spans(applied) == masked_spans(expected), names
+
+
+def test_saved_ids_match_the_store(tmp_path):
+    profiles = profile_store(tmp_path, ["Jean Dupont"])  # Gives NAME_1
+    store = OccurrenceStore()
+    mask_names(TEXT, store, ["Le Gall", "Jean Dupont", "Pierre"])  # Le Gall is NAME_1 here
+    profiles.update_from_store("case", store)
+
+    profile_ids = {entry["normalized"]: entry["id"] for entry in profiles.profiles["case"]["names"]}
+    store_ids = {info['normalized_name']: info['id'] for info in store.names if info}
+    assert profile_ids == store_ids
+    assert profile_ids["jean dupont"] == 1
+    assert len(set(profile_ids.values())) == len(profile_ids)
@@ -0,0 +1,70 @@
+from masking import OccurrenceStore, text_diff_opcodes
+
+
+def make_store():
+    store = OccurrenceStore()
+    for normalized, spans in (("dupont", [(0, 6), (20, 26)]), ("martin", [(10, 16)]), ("durand", [(30, 36)])):
+        slot = store.add_name(normalized, normalized.title())
+        store.add_occurrences(slot, spans)
+    return store
+
+
+def test_remove_names_drops_every_occurrence_in_one_pass():
+    store = make_store()
+    store.remove_names([store.get_slot("dupont"), store.get_slot("durand")])
+    assert list(store) == [(10, 6, store.get_slot("martin"))]
+    assert store.get_slot("dupont") is None and store.get_slot("durand") is None
+    store.renumber()
+    assert [info['masked'] for info in store.names if info] == ["[NAME_1]"]
+
+
+def test_remove_name_matches_remove_names():
+    one_by_one, batched = make_store(), make_store()
+    for slot in (0, 2):
+        one_by_one.remove_name(slot)
+    batched.remove_names([0, 2])
+    assert list(one_by_one) == list(batched)
+    assert one_by_one.names == batched.names
+
+
+def remap_store(old, new, names):
+    store = OccurrenceStore()
+    for name in names:
+        slot = store.add_name(name.lower(), name)
+        start = old.find(name)
+        spans = []
+        while start != -1:
+            spans.append((start, start + len(name)))
+            start = old.find(name, start + 1)
+        store.add_occurrences(slot, spans)
+    regions = store.remap(text_diff_opcodes(old, new), new)
+    return store, regions
+
+
+def test_remap_shifts_spans_around_an_edit():
+    old = "Dupont voit Martin puis Dupont."
+    new = "Le patient Dupont voit Martin puis Dupont."
+    store, regions = remap_store(old, new, ["Dupont", "Martin"])
+    assert regions == [(0, 11)]
+    assert [new[start:start + length] for start, length, _ in store] == ["Dupont", "Martin", "Dupont"]
+    assert [start for start, _, _ in store] == [11, 23, 35]
+
+
+def test_remap_drops_spans_touched_by_the_edit():
+    old = "Dupont voit Martin puis Dupont."
+    new = "Dupont voit Martine puis Dupont."
+    store, regions = remap_store(old, new, ["Dupont", "Martin"])
+    # "Martin" is unchanged text, but the inserted letter glued to it makes it another word
+    assert [new[start:start + length] for start, length, _ in store] == ["Dupont", "Dupont"]
+    assert regions == [(18, 19)]
+
+    new = "Dupont voit Marti puis Dupont."
+    store, _ = remap_store(old, new, ["Dupont", "Martin"])
+    assert [new[start:start + length] for start, length, _ in store] == ["Dupont", "Dupont"]
+
+
+def test_remap_of_an_unchanged_text_keeps_everything():
+    old = "Dupont voit Martin."
+    store, regions = remap_store(old, old, ["Dupont", "Martin"])
+    assert regions == []
+    assert [(start, length) for start, length, _ in store] == [(0, 6), (12, 6)]
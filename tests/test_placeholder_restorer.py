@@ -0,0 +1,45 @@
+import pytest
+
+from masking import OccurrenceStore, PlaceholderRestorer
+
+TEXT = "Jean Dupont voit M. Martin. DUPONT revient, Dupont repart."
+
+
+def make_restorer():
+    store = OccurrenceStore()
+    dupont = store.add_name("dupont", "Dupont")
+    store.add_occurrences(dupont, [(5, 11), (27, 33), (44, 50)])
+    martin = store.add_name("martin", "Martin")
+    store.add_occurrences(martin, [(20, 26)])
+    return PlaceholderRestorer.from_store(store, TEXT)
+
+
+def test_table_uses_the_most_frequent_spelling():
+    assert make_restorer().table == {"[NAME_1]": "Dupont", "[NAME_2]": "Martin"}
+
+
+ANSWER = "[NAME_1] a rencontré [NAME_2] ; [NAME_3] est inconnu, [crochets] restent."
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 13])
+def test_placeholders_split_across_chunks(chunk_size):
+    restorer = make_restorer()
+    streaming = restorer.stream()
+    chunks = [ANSWER[i:i + chunk_size] for i in range(0, len(ANSWER), chunk_size)]
+    restored = "".join(streaming.feed(chunk) for chunk in chunks) + streaming.flush()
+    assert restored == restorer.restore(ANSWER)
+    assert restored == "Dupont a rencontré Martin ; [NAME_3] est inconnu, [crochets] restent."
+
+
+def test_partial_placeholder_is_held_back_until_completed():
+    streaming = make_restorer().stream()
+    assert streaming.feed("Voir [NAM") == "Voir "
+    assert streaming.feed("E_2") == ""
+    assert streaming.feed("] demain") == "Martin demain"
+
+
+def test_flush_returns_an_unfinished_placeholder_as_is():
+    streaming = make_restorer().stream()
+    assert streaming.feed("Fin [NAME_") == "Fin "
+    assert streaming.flush() == "[NAME_"
+    assert streaming.flush() == ""
@@ -0,0 +1,159 @@
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from llm_providers import LLMModelRegistry, LLMProvider
+from service import PipelineService, ServiceError, start_service
+
+
+class ScriptedProvider(LLMProvider):
+    """Streams fixed chunks; with `release` set, waits for it after the first chunk"""
+
+    def __init__(self, chunks=("Le ", "rapport ", "masqué."), release=None):
+        self.chunks = chunks
+        self.release = release
+        self.first_chunk_sent = threading.Event()
+
+    def get_available_models(self):
+        return ["claude-sonnet-4-5-20250929"]
+
+    def validate_model(self, model):
+        return model in self.get_available_models()
+
+    def send_message(self, messages, model, max_tokens=64000, stream=False, stream_callback=None):
+        for i, chunk in enumerate(self.chunks):
+            if stream_callback:
+                stream_callback(chunk)
+            if i == 0:
+                self.first_chunk_sent.set()
+                if self.release is not None:
+                    assert self.release.wait(5)
+        return "".join(self.chunks)
+
+
+@pytest.fixture
+def service_for(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The router writes its latency telemetry in the working directory
+    services = []
+
+    def make(provider):
+        registry = LLMModelRegistry()
+        registry.register_provider("claude", provider)
+        service = PipelineService(registry, workers=1, llm_concurrency=1,
+                                  profiles_file=str(tmp_path / "masking_profiles.json"),
+                                  templates_file=str(tmp_path / "templates.db"))
+        services.append(service)
+        return service
+    yield make
+    for service in services:
+        service.close()
+
+
+def test_message_without_conversation_is_rejected(service_for):
+    service = service_for(ScriptedProvider())
+    doc_id = service.upload(text="Jean Dupont a été examiné.")["id"]
+    with pytest.raises(ServiceError) as error:
+        service.generate(doc_id, lambda event, data: None, message="Et ensuite ?")
+    assert error.value.status == 409
+
+    service.generate(doc_id, lambda event, data: None, instructions="Résume.")
+    service.generate(doc_id, lambda event, data: None, message="Et ensuite ?")
+    assert service.get(doc_id).status()["messages"] == 4
+
+
+def test_document_stays_available_while_the_answer_streams(service_for):
+    release = threading.Event()
+    provider = ScriptedProvider(release=release)
+    service = service_for(provider)
+    doc_id = service.upload(text="Jean Dupont a été examiné.")["id"]
+    service.mask(doc_id, ["Jean Dupont"], [])
+    chunks = []
+    thread = threading.Thread(target=service.generate, daemon=True,
+                              args=(doc_id, lambda event, data: chunks.append(data["text"])),
+                              kwargs={"instructions": "Résume.", "restore": True})
+    thread.start()
+    try:
+        assert provider.first_chunk_sent.wait(5)
+        document = service.get(doc_id)
+        assert document.lock.acquire(timeout=1)
+        document.lock.release()
+        assert service.unmask(doc_id, "[NAME_1]") == "Jean Dupont"
+        with pytest.raises(ServiceError) as error:
+            service.generate(doc_id, lambda event, data: None, instructions="Résume.")
+        assert error.value.status == 409
+    finally:
+        release.set()
+        thread.join(5)
+    assert "".join(chunks) == "Le rapport masqué."
+    assert service.get(doc_id).status()["messages"] == 2
+
+
+def test_message_without_conversation_over_http(service_for):
+    service = service_for(ScriptedProvider())
+    server, base_url = start_service(service)
+    try:
+        doc_id = service.upload(text="Jean Dupont a été examiné.")["id"]
+        request = urllib.request.Request(f"{base_url}/documents/{doc_id}/generate",
+                                         data=json.dumps({"message": "Et ensuite ?"}).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=5)
+        assert error.value.code == 409
+    finally:
+        server.shutdown()
+
+
+class DrippingProvider(ScriptedProvider):
+    """Streams chunks until the stream callback aborts it (a closed connection)"""
+
+    def __init__(self):
+        super().__init__(chunks=("Le ",) + ("rapport ",) * 2000)
+        self.aborted = threading.Event()
+
+    def send_message(self, messages, model, max_tokens=64000, stream=False, stream_callback=None):
+        try:
+            for i, chunk in enumerate(self.chunks):
+                stream_callback(chunk)
+                if i == 0:
+                    self.first_chunk_sent.set()
+                time.sleep(0.002)
+        except Exception:
+            self.aborted.set()
+            raise
+        return "".join(self.chunks)
+
+
+def test_client_disconnect_frees_the_llm_slot(service_for):
+    provider = DrippingProvider()
+    service = service_for(provider)
+    server, base_url = start_service(service)
+    try:
+        doc_id = service.upload(text="Jean Dupont a été examiné.")["id"]
+        body = json.dumps({"instructions": "Résume."}).encode()
+        client = socket.create_connection(server.server_address[:2], timeout=5)
+        client.sendall(f"POST /documents/{doc_id}/generate HTTP/1.1\r\nHost: test\r\n"
+                       f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        assert client.recv(4096).split(b"\r\n")[0].endswith(b" 200 OK")
+        client.close()  # The client goes away in the middle of the answer
+
+        assert provider.aborted.wait(5)
+        deadline = time.monotonic() + 5
+        while service.health()["llm_active"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.health()["llm_active"] == 0
+        assert service.get(doc_id).status()["messages"] == 0  # The lost answer is not kept
+
+        # The slot and the document are free for the next request
+        provider.chunks = ("Le ", "rapport.")
+        request = urllib.request.Request(f"{base_url}/documents/{doc_id}/generate", data=body,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            stream = response.read().decode("utf-8")
+        assert stream.endswith('event: done\ndata: {"text": "Le rapport."}\n\n')
+    finally:
+        server.shutdown()
@@ -0,0 +1,74 @@
+from masking import OccurrenceStore
+from session_journal import SessionJournal, masking_entries, restore_occurrences
+
+SOURCE = "Jean Dupont voit M. Martin. Dupont revient."
+
+
+def masked_store(names):
+    store = OccurrenceStore()
+    for name in names:
+        slot = store.add_name(name.lower(), name)
+        start = SOURCE.find(name)
+        spans = []
+        while start != -1:
+            spans.append((start, start + len(name)))
+            start = SOURCE.find(name, start + 1)
+        store.add_occurrences(slot, spans)
+    return store
+
+
+def test_snapshot_and_tail_are_replayed(tmp_path):
+    path = str(tmp_path / "session.db")
+    journal = SessionJournal(path)
+    journal.record_document("rapport.docx", SOURCE)
+    journal.record_masking(masked_store(["Dupont"]))
+    journal.compact()
+    # Deltas after the snapshot, and no close(): the process may have crashed
+    journal.record_masking(masked_store(["Dupont", "Martin"]))
+    journal.record_extraction(5, 27, None)
+    journal.record_chat({"role": "user", "content": "Résume [NAME_1]"})
+    journal.record_names_input("Dupont\nMartin")
+
+    restored = SessionJournal(path)
+    state = restored.load()
+    assert restored.pending == 4
+    assert state["source_path"] == "rapport.docx"
+    assert (state["view_start"], state["view_end"], state["edited"]) == (5, 27, False)
+    assert state["conversation"] == [{"role": "user", "content": "Résume [NAME_1]"}]
+    assert state["names_input"] == "Dupont\nMartin"
+    assert restored.get_blob("source") == SOURCE
+    store = OccurrenceStore()
+    restore_occurrences(store, state["masking"])
+    assert masking_entries(store) == masking_entries(masked_store(["Dupont", "Martin"]))
+
+
+def test_compaction_keeps_the_state_and_drops_the_deltas(tmp_path):
+    path = str(tmp_path / "session.db")
+    journal = SessionJournal(path, compact_every=5)
+    journal.record_document("rapport.docx", SOURCE)
+    for i in range(12):
+        journal.record_names_input(f"Dupont {i}")
+    # Compacted after the 5th and 10th deltas: two are left in the journal
+    assert journal.pending == 2
+    assert journal.conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0] == 2
+    journal.close()
+
+    state = SessionJournal(path).load()
+    assert state["names_input"] == "Dupont 11"
+    assert state["source_path"] == "rapport.docx" and state["view_end"] == len(SOURCE)
+
+
+def test_new_document_resets_the_session(tmp_path):
+    path = str(tmp_path / "session.db")
+    journal = SessionJournal(path)
+    journal.record_document("a.docx", SOURCE)
+    journal.record_extraction(0, 10, "edited text")
+    journal.record_chat({"role": "user", "content": "Bonjour"})
+    journal.record_document("b.docx", "Autre texte")
+
+    restored = SessionJournal(path)
+    state = restored.load()
+    assert state["source_path"] == "b.docx"
+    assert state["conversation"] == [] and state["edited"] is False
+    assert restored.get_blob("edited") is None
+    assert restored.get_blob("source") == "Autre texte"
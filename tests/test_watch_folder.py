@@ -0,0 +1,83 @@
+import os
+
+from masking_profiles import ProfileStore
+from watch_folder import JobQueue, WatchDaemon, PENDING, RUNNING, DONE, FAILED
+
+
+def status(queue, job_id):
+    return queue.conn.execute("SELECT status, attempts, next_attempt, error FROM jobs WHERE id = ?",
+                              (job_id,)).fetchone()
+
+
+def test_restart_resumes_running_jobs_and_skips_known_versions(tmp_path):
+    path = str(tmp_path / "watch_jobs.db")
+    queue = JobQueue(path)
+    assert queue.enqueue("/reports/a.docx", 100, 1.0)
+    assert queue.enqueue("/reports/b.docx", 200, 2.0)
+    job = queue.claim()
+    assert job == {"id": 1, "path": "/reports/a.docx", "attempts": 1}
+    queue.close()  # The daemon stopped while a.docx was running
+
+    queue = JobQueue(path)
+    assert not queue.enqueue("/reports/a.docx", 100, 1.0)  # Same version: not queued twice
+    assert queue.enqueue("/reports/a.docx", 150, 3.0)  # Edited since: a new job
+    assert queue.counts() == {PENDING: 2, RUNNING: 1}
+    assert queue.recover() == 1
+    assert queue.claim() == {"id": 1, "path": "/reports/a.docx", "attempts": 2}
+    queue.complete(1, "/reports/a.result.txt")
+    assert [queue.claim()["id"], queue.claim()["id"], queue.claim()] == [2, 3, None]
+    assert queue.counts() == {DONE: 1, RUNNING: 2}
+
+
+class FlakyDaemon(WatchDaemon):
+    """Fails the first `failures` attempts of every job"""
+
+    def __init__(self, tmp_path, failures, **kwargs):
+        super().__init__(str(tmp_path), router=None, model="", instructions="",
+                         profile_store=ProfileStore(str(tmp_path / "profiles.json")),
+                         queue=JobQueue(str(tmp_path / "watch_jobs.db")), **kwargs)
+        self.failures = failures
+
+    def process(self, path):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("provider unavailable")
+        return path + ".result.txt"
+
+
+def test_failed_jobs_are_retried_with_a_growing_delay(tmp_path, monkeypatch):
+    daemon = FlakyDaemon(tmp_path, failures=2, max_attempts=3, retry_delay=10.0)
+    daemon.queue.enqueue(os.path.join(str(tmp_path), "a.docx"), 1, 1.0)
+    clock = [1000.0]
+    monkeypatch.setattr("watch_folder.time.time", lambda: clock[0])
+
+    daemon.run_job(daemon.queue.claim())
+    assert status(daemon.queue, 1) == (PENDING, 1, 1010.0, "provider unavailable")
+    assert daemon.queue.claim() is None  # Not due yet
+    clock[0] = 1010.0
+    daemon.run_job(daemon.queue.claim())
+    assert status(daemon.queue, 1)[:3] == (PENDING, 2, 1030.0)
+    clock[0] = 1030.0
+    daemon.run_job(daemon.queue.claim())
+    assert status(daemon.queue, 1)[:2] == (DONE, 3)
+
+
+def test_jobs_give_up_after_max_attempts(tmp_path):
+    daemon = FlakyDaemon(tmp_path, failures=5, max_attempts=2, retry_delay=0.0)
+    daemon.queue.enqueue(os.path.join(str(tmp_path), "a.docx"), 1, 1.0)
+    daemon.run_job(daemon.queue.claim())
+    daemon.run_job(daemon.queue.claim())
+    assert status(daemon.queue, 1)[:2] == (FAILED, 2)
+    assert daemon.queue.claim() is None
+
+
+def test_files_are_queued_once_unchanged_between_two_scans(tmp_path):
+    daemon = FlakyDaemon(tmp_path, failures=0)
+    report = tmp_path / "a.docx"
+    report.write_bytes(b"part")
+    (tmp_path / "~$a.docx").write_bytes(b"lock")
+    assert daemon.scan() == 0
+    report.write_bytes(b"partial copy")  # Still being copied
+    assert daemon.scan() == 0
+    assert daemon.scan() == 1
+    assert daemon.scan() == 0
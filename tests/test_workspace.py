@@ -0,0 +1,41 @@
+import os
+
+from workspace import Workspace
+
+
+def make_workspace(tmp_path):
+    return Workspace(str(tmp_path / "session.db"), checkpoint_file=str(tmp_path / "stream_checkpoint"))
+
+
+def test_journal_file_is_created_by_the_first_delta(tmp_path):
+    workspace = make_workspace(tmp_path)
+    state = workspace.open()
+    assert not os.path.exists(workspace.session_path(state.doc_id))
+    state.session_journal.record_names_input("")  # Unchanged: nothing is written
+    assert not os.path.exists(workspace.session_path(state.doc_id))
+    state.session_journal.record_document("rapport.docx", "Jean Dupont a été examiné.")
+    assert os.path.exists(workspace.session_path(state.doc_id))
+
+
+def test_empty_documents_are_not_restored(tmp_path):
+    workspace = make_workspace(tmp_path)
+    loaded = workspace.open()
+    loaded.session_journal.record_document("rapport.docx", "Jean Dupont a été examiné.")
+    workspace.open()  # Never loaded
+    emptied = workspace.open()
+    emptied.session_journal.record_names_input("Dupont")  # Written, but no document
+    workspace.compact_all()
+    assert make_workspace(tmp_path).saved_document_ids() == [loaded.doc_id]
+
+
+def test_closing_a_document_deletes_its_journal(tmp_path):
+    workspace = make_workspace(tmp_path)
+    first = workspace.open()
+    first.session_journal.record_document("a.docx", "A")
+    second = workspace.open()
+    second.session_journal.record_document("b.docx", "B")
+    workspace.close(second)
+    assert not any(name.startswith("session-") for name in os.listdir(tmp_path))
+    workspace.close(first)
+    assert workspace.documents and workspace.active is workspace.documents[0]
+    assert make_workspace(tmp_path).saved_document_ids() == []
@@ -0,0 +1,324 @@
+"""
+Watch-Folder Daemon
+
+Watches a folder for new .docx reports and processes each one without the
+GUI: extraction between the configured markers, masking with a masking
+profile (and PII categories), the configured instruction sent to the LLM,
+and the unmasked answer written next to the source as <name>.result.txt.
+
+Jobs live in a SQLite queue (watch_jobs.db). A file is identified by its
+path, size and modification time, so a restart never processes the same
+version twice; jobs that were running when the daemon stopped are picked
+up again. Failed jobs are retried with a growing delay.
+
+Start with: python app.py --watch FOLDER --profile CASE [--start ... --end ...] [--concurrency 2]
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+from llm_routing import HedgedRouter, CircuitBreaker, LatencyTelemetry
+from masking import PII_CATEGORIES
+from masking_profiles import ProfileStore
+from template_store import TemplateStore, INSTRUCTION
+from pipeline import (read_docx_text, find_extraction_range, mask_document, masked_text, build_prompt,
+                      unmask, read_private_settings, build_registry)
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"  # Gave up after max_attempts
+
+
+class JobQueue:
+    """Persistent job queue; safe to use from several threads"""
+
+    def __init__(self, db_path: str = "watch_jobs.db"):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                output TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                UNIQUE (path, size, mtime)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_attempt)")
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, path: str, size: int, mtime: float) -> bool:
+        """Add a file version; returns False if that version was already queued"""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (path, size, mtime, status, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, size, mtime, PENDING, now, now))
+            return cursor.rowcount > 0
+
+    def recover(self) -> int:
+        """Make jobs left running by a stopped daemon pending again; returns how many"""
+        with self.lock:
+            cursor = self.conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE status = ?",
+                                       (PENDING, time.time(), RUNNING))
+            return cursor.rowcount
+
+    def claim(self) -> Optional[Dict]:
+        """Take the oldest job that is due and mark it running"""
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute(
+                    "SELECT id, path, attempts FROM jobs WHERE status = ? AND next_attempt <= ? ORDER BY id LIMIT 1",
+                    (PENDING, now)).fetchone()
+                if row is None:
+                    return None
+                self.conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                                  (RUNNING, now, row[0]))
+        return {"id": row[0], "path": row[1], "attempts": row[2] + 1}
+
+    def complete(self, job_id: int, output: str):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET status = ?, output = ?, error = NULL, updated = ? WHERE id = ?",
+                              (DONE, output, time.time(), job_id))
+
+    def fail(self, job_id: int, error: str, retry_delay: Optional[float]):
+        """Record a failure; retry after retry_delay seconds, or give up if it is None"""
+        now = time.time()
+        with self.lock:
+            if retry_delay is None:
+                self.conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                                  (FAILED, error, now, job_id))
+            else:
+                self.conn.execute("UPDATE jobs SET status = ?, error = ?, next_attempt = ?, updated = ? WHERE id = ?",
+                                  (PENDING, error, now + retry_delay, now, job_id))
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def result_path(source_path: str) -> str:
+    """report.docx -> report.result.txt (next to the source)"""
+    return os.path.splitext(source_path)[0] + ".result.txt"
+
+
+class WatchDaemon:
+    """Scans the folder, queues new reports and processes them with a pool of workers"""
+
+    def __init__(self, folder: str, router: HedgedRouter, model: str, instructions: str,
+                 profile_store: ProfileStore, profile: Optional[str] = None,
+                 start_word: str = "", end_word: str = "", pii_categories: Optional[List[str]] = None,
+                 queue: Optional[JobQueue] = None, concurrency: int = 2, max_attempts: int = 3,
+                 retry_delay: float = 60.0, jobs_per_minute: float = 0, poll_interval: float = 5.0):
+        self.folder = folder
+        self.router = router
+        self.model = model
+        self.instructions = instructions
+        self.profile_store = profile_store
+        self.profile = profile  # Masking profile of the case (its names and PII values are masked)
+        self.start_word = start_word  # Extraction markers (none: the whole document)
+        self.end_word = end_word
+        self.pii_categories = pii_categories or []
+        self.queue = queue or JobQueue(os.path.join(folder, "watch_jobs.db"))
+        self.concurrency = concurrency  # Jobs processed at the same time
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay  # Seconds before the first retry, doubled at each attempt
+        self.jobs_per_minute = jobs_per_minute  # Start at most this many jobs per minute (0: no limit)
+        self.poll_interval = poll_interval  # Seconds between folder scans
+        self.profile_lock = threading.Lock()  # New IDs are added to the profile one job at a time
+        self.rate_lock = threading.Lock()
+        self.next_start = 0.0
+        self.pending_sizes: Dict[str, tuple] = {}  # Files seen once: only queued when unchanged at the next scan
+        self.stop_event = threading.Event()
+
+    # ---- scanning --------------------------------------------------------
+
+    def scan(self) -> int:
+        """Queue the .docx files that have not changed since the previous scan. Returns how many were new."""
+        queued = 0
+        seen = {}
+        for entry in os.scandir(self.folder):
+            name = entry.name
+            # Skip Word lock files (~$report.docx) and anything that is not a .docx
+            if not entry.is_file() or not name.lower().endswith(".docx") or name.startswith("~$"):
+                continue
+            stat = entry.stat()
+            version = (stat.st_size, stat.st_mtime)
+            seen[entry.path] = version
+            # A file still being copied changes between two scans
+            if self.pending_sizes.get(entry.path) == version:
+                if self.queue.enqueue(os.path.abspath(entry.path), *version):
+                    queued += 1
+        self.pending_sizes = seen
+        return queued
+
+    # ---- processing ------------------------------------------------------
+
+    def wait_for_rate(self):
+        """Space job starts to respect jobs_per_minute"""
+        if not self.jobs_per_minute:
+            return
+        with self.rate_lock:
+            start = max(time.time(), self.next_start)
+            self.next_start = start + 60.0 / self.jobs_per_minute
+        self.stop_event.wait(max(0.0, start - time.time()))
+
+    def process(self, path: str) -> str:
+        """Run the whole pipeline on one report and write its result. Returns the result path."""
+        text = read_docx_text(path)
+        if self.start_word and self.end_word:
+            start, end, approximate = find_extraction_range(text, self.start_word, self.end_word)
+            if approximate:
+                print(f"Note: {os.path.basename(path)}: markers matched approximately")
+            extracted = text[start:end]
+        else:
+            extracted = text
+
+        if self.profile:
+            with self.profile_lock:
+                store = mask_document(extracted, pii_categories=self.pii_categories,
+                                      profile=self.profile_store.profiles.get(self.profile))
+                self.profile_store.update_from_store(self.profile, store)
+        else:
+            store = mask_document(extracted, pii_categories=self.pii_categories)
+
+        prompt = build_prompt(self.instructions, masked_text(extracted, store))
+        # Streamed like in the app, so the shared latency telemetry gets real first-token
+        # times and output rates (nobody reads the chunks here)
+        response_text = self.router.send_message(messages=[{"role": "user", "content": prompt}],
+                                                 model=self.model, max_tokens=64000, stream=True)
+        output = result_path(path)
+        tmp_path = output + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(unmask(response_text, store, extracted))
+        os.replace(tmp_path, output)
+        return output
+
+    def run_job(self, job: Dict):
+        try:
+            output = self.process(job["path"])
+        except Exception as e:
+            retry = job["attempts"] < self.max_attempts
+            delay = self.retry_delay * (2 ** (job["attempts"] - 1)) if retry else None
+            self.queue.fail(job["id"], str(e), delay)
+            print(f"Warning: {os.path.basename(job['path'])} failed (attempt {job['attempts']}): {e}"
+                  + ("" if retry else " - giving up"))
+            return
+        self.queue.complete(job["id"], output)
+        print(f"Done: {output}")
+
+    def worker(self):
+        while not self.stop_event.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.stop_event.wait(min(1.0, self.poll_interval))
+                continue
+            self.wait_for_rate()
+            self.run_job(job)
+
+    def run(self):
+        """Scan and process until stopped (Ctrl+C or stop())"""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"Resuming {recovered} interrupted job(s)")
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for _ in range(self.concurrency):
+                pool.submit(self.worker)
+            try:
+                while not self.stop_event.is_set():
+                    self.scan()
+                    self.stop_event.wait(self.poll_interval)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.stop_event.set()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Process the .docx reports dropped in a folder")
+    parser.add_argument("folder")
+    parser.add_argument("--start", default="", help="Start marker (default: whole document)")
+    parser.add_argument("--end", default="", help="End marker")
+    parser.add_argument("--profile", default=None, help="Masking profile of the case")
+    parser.add_argument("--pii", default="", help="PII categories to mask, comma-separated (e.g. PHONE,EMAIL)")
+    parser.add_argument("--instruction-label", default=None,
+                        help="Instruction template to send (default: 'basic', or the built-in instruction)")
+    parser.add_argument("--model", default=None, help="Model (default: first available)")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--retry-delay", type=float, default=60.0, help="Seconds before the first retry")
+    parser.add_argument("--jobs-per-minute", type=float, default=0, help="0: no limit")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--private", default="private.txt", help="API keys file")
+    parser.add_argument("--standin", action="store_true", help="Use the offline LLM stand-in")
+    args = parser.parse_args(argv)
+
+    settings = read_private_settings(args.private)
+    if args.standin:
+        from llm_standin import start_standin_server
+        _, standin_url = start_standin_server()
+        settings = {"claude_api_key": "standin", "claude_base_url": standin_url,
+                    "openai_api_key": "standin", "openai_base_url": standin_url}
+    registry = build_registry(settings)
+    model = args.model or next(iter(registry.get_all_models()), None)
+    if not model:
+        print(f"Error: No LLM provider configured in '{args.private}'.")
+        return
+
+    pii_categories = [c.strip().upper() for c in args.pii.split(",") if c.strip()]
+    unknown = [c for c in pii_categories if c not in PII_CATEGORIES]
+    if unknown:
+        print(f"Error: Unknown PII categories: {', '.join(unknown)} (known: {', '.join(PII_CATEGORIES)})")
+        return
+
+    profile_store = ProfileStore("masking_profiles.json")
+    profile_store.load()
+    if args.profile and args.profile not in profile_store.profiles:
+        print(f"Error: Unknown masking profile '{args.profile}'.")
+        return
+    template_store = TemplateStore("templates.db")
+    instructions = template_store.get(INSTRUCTION, args.instruction_label or "basic")
+    labels = template_store.labels(INSTRUCTION)
+    template_store.close()
+    if instructions is None and args.instruction_label:
+        print(f"Error: Unknown instruction template '{args.instruction_label}'"
+              + (f" (known: {', '.join(labels)})" if labels else ""))
+        return
+
+    router = HedgedRouter(registry, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=120.0),
+                          telemetry=LatencyTelemetry("latency_telemetry.json"))
+    daemon = WatchDaemon(
+        args.folder, router, model, instructions or "", profile_store, profile=args.profile,
+        start_word=args.start, end_word=args.end,
+        pii_categories=pii_categories,
+        concurrency=args.concurrency, max_attempts=args.max_attempts, retry_delay=args.retry_delay,
+        jobs_per_minute=args.jobs_per_minute, poll_interval=args.poll_interval
+    )
+    print(f"Watching {os.path.abspath(args.folder)} (Ctrl+C to stop)")
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
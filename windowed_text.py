@@ -0,0 +1,262 @@
+"""
+Windowed Text View
+
+A scrolled text pane for very large texts. Tk lays out every line of a Text
+widget, so inserting a 10 MB report takes seconds and scrolling it is
+sluggish. This view keeps the full text in a model (a string, or a
+PieceTable for the masking preview) and only puts a window of it in the
+widget: the visible region plus a margin on each side. When the view
+scrolls close to the edge of the window, the window moves; the scrollbar
+shows the position in the whole text, not in the window.
+
+Positions are offsets in the full text. Tags are kept as offset ranges of
+the full text and applied to whatever part is in the widget, and edits made
+in the widget are written back into the model before the window moves.
+Texts shorter than the window are shown whole, as in a plain ScrolledText.
+"""
+
+import bisect
+import tkinter as tk
+from tkinter import ttk
+from typing import List, Dict, Tuple, Callable, Optional
+
+
+class WindowedText(ttk.Frame):
+    """Text widget with a vertical scrollbar that only holds a window of its text"""
+
+    def __init__(self, master, window_chars: int = 100_000, on_modify: Optional[Callable[[], None]] = None, **text_options):
+        super().__init__(master)
+        self.window_chars = window_chars  # Characters put in the widget (visible region + margins)
+        self.edge_margin = window_chars // 4  # Move the window when the view gets this close to its edge
+        self.snap_distance = 2000  # Window edges are moved to a line break within this distance
+        self.on_modify = on_modify  # Called when the user edits the text
+        self.source = ""  # The full text: a str or a PieceTable (anything with len() and slice())
+        self.window_start = 0
+        self.window_end = 0
+        self.window_modified = False  # The widget holds edits not yet written to the model
+        self.tags: Dict[str, Tuple[List[int], List[int]]] = {}  # Tag -> sorted (starts, ends) in the full text
+        self.recenter_pending = False
+
+        self.text = tk.Text(self, **text_options)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.text.configure(yscrollcommand=self.on_text_scrolled)
+        self.text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.text.bind('<<Modified>>', self.on_text_modified)
+
+    # ---- Content ---------------------------------------------------------------
+
+    def __len__(self) -> int:
+        if self.window_modified:
+            return len(self.source) - (self.window_end - self.window_start) + self.window_length()
+        return len(self.source)
+
+    def set_text(self, source, top: int = 0):
+        """Show a new text (str or PieceTable), with offset `top` at the top of the view"""
+        self.source = source
+        self.window_start = self.window_end = 0
+        self.window_modified = False
+        self.tags = {tag: ([], []) for tag in self.tags}  # Like an insert in Tk, a new text drops the tags
+        self.load_window(top)
+
+    def get_text(self) -> str:
+        """The full text, including the edits made in the widget"""
+        self.sync_window()
+        return self.source if isinstance(self.source, str) else self.source.text()
+
+    def clear(self):
+        self.set_text("")
+
+    def append(self, text: str):
+        """Add text at the end and scroll to it"""
+        full_text = self.get_text()
+        self.set_text(full_text + text, top=len(full_text))
+        self.see_end()
+
+    def is_windowed(self) -> bool:
+        return self.window_start > 0 or self.window_end < len(self.source)
+
+    # ---- Window ----------------------------------------------------------------
+
+    def snap_to_line(self, position: int, forward: bool) -> int:
+        """Move a window edge to a nearby line start, so lines are never cut in the widget"""
+        if position <= 0 or position >= len(self.source):
+            return position
+        if forward:
+            found = self.source_slice(position, position + self.snap_distance).find("\n")
+            return position + found + 1 if found >= 0 else position
+        start = max(0, position - self.snap_distance)
+        found = self.source_slice(start, position).rfind("\n")
+        return start + found + 1 if found >= 0 else position
+
+    def source_slice(self, start: int, end: int) -> str:
+        if isinstance(self.source, str):
+            return self.source[start:end]
+        return self.source.slice(start, end)
+
+    def load_window(self, center: int, top: Optional[int] = None):
+        """Put the window around offset `center` in the widget and show offset `top` (default: center)"""
+        self.sync_window()
+        length = len(self.source)
+        top = center if top is None else top
+        if length <= self.window_chars:
+            start, end = 0, length
+        else:
+            start = max(0, min(center - self.window_chars // 2, length - self.window_chars))
+            end = self.snap_to_line(start + self.window_chars, forward=True)
+            start = self.snap_to_line(start, forward=False)
+        insert_offset = self.offset_of(tk.INSERT) if self.window_end > self.window_start else None
+
+        self.window_start, self.window_end = start, end
+        self.text.delete(1.0, tk.END)
+        if end > start:
+            self.text.insert(1.0, self.source_slice(start, end))
+        # Programmatic changes are not edits (the <<Modified>> event comes later and is ignored)
+        self.text.edit_modified(False)
+        self.window_modified = False
+        for tag in self.tags:
+            self.apply_tag(tag)
+        if insert_offset is not None and start <= insert_offset <= end:
+            self.text.mark_set(tk.INSERT, self.index_of(insert_offset))
+        else:
+            self.text.mark_set(tk.INSERT, self.index_of(max(start, min(top, end))))
+        self.text.yview(self.index_of(max(start, min(top, end))))
+
+    def window_length(self) -> int:
+        return self.chars_between(1.0, "end-1c")
+
+    def chars_between(self, index1, index2) -> int:
+        count = self.text.count(index1, index2, "chars")
+        if isinstance(count, tuple):
+            count = count[0]
+        return int(count or 0)
+
+    def sync_window(self):
+        """Write the edits made in the widget back into the full text (and its tags)"""
+        if not self.window_modified:
+            return
+        window_text = self.text.get(1.0, "end-1c")
+        if not isinstance(self.source, str):
+            self.source = self.source.text()
+        old_end = self.window_end
+        self.source = self.source[:self.window_start] + window_text + self.source[old_end:]
+        self.window_end = self.window_start + len(window_text)
+        shift = self.window_end - old_end
+        # Ranges inside the window are read back from the widget (the edits moved them)
+        for tag, (starts, ends) in self.tags.items():
+            first = bisect.bisect_right(ends, self.window_start)
+            last = bisect.bisect_left(starts, old_end)
+            inside = self.text.tag_ranges(tag)
+            new_starts = [self.offset_of(index) for index in inside[0::2]]
+            new_ends = [self.offset_of(index) for index in inside[1::2]]
+            starts[first:last] = new_starts
+            ends[first:last] = new_ends
+            after = first + len(new_starts)
+            for i in range(after, len(starts)):
+                starts[i] += shift
+                ends[i] += shift
+        self.window_modified = False
+
+    def index_of(self, offset: int) -> str:
+        """Tk index of a full-text offset (the offset must be in the window)"""
+        return f"1.0+{offset - self.window_start}c"
+
+    def offset_of(self, index) -> int:
+        """Full-text offset of a Tk index"""
+        return self.window_start + self.chars_between(1.0, index)
+
+    def see_offset(self, offset: int):
+        """Scroll so that a full-text offset is visible, moving the window if needed"""
+        if not self.window_start <= offset <= self.window_end or (
+                self.is_windowed() and self.near_window_edge(offset)):
+            self.load_window(offset)
+        self.text.see(self.index_of(offset))
+
+    def see_end(self):
+        self.see_offset(len(self))
+
+    def near_window_edge(self, offset: int) -> bool:
+        return ((self.window_start > 0 and offset - self.window_start < self.edge_margin)
+                or (self.window_end < len(self.source) and self.window_end - offset < self.edge_margin))
+
+    # ---- Scrolling -------------------------------------------------------------
+
+    def on_text_scrolled(self, first, last):
+        """yscrollcommand of the widget: show the position in the full text and move the
+        window when the view gets close to one of its edges"""
+        first, last = float(first), float(last)
+        length = len(self.source)
+        window_length = self.window_end - self.window_start
+        if not length or window_length == length:
+            self.scrollbar.set(first, last)
+            return
+        # Characters are assumed to be spread evenly over the lines of the window
+        self.scrollbar.set((self.window_start + first * window_length) / length,
+                           (self.window_start + last * window_length) / length)
+        if not self.recenter_pending and self.near_window_edge(self.window_start + int(first * window_length)):
+            self.recenter_pending = True
+            self.after_idle(self.recenter)
+
+    def recenter(self):
+        """Move the window around the visible region, keeping the same text at the top"""
+        self.recenter_pending = False
+        top = self.offset_of("@0,0")
+        if self.near_window_edge(top):
+            self.load_window(top)
+
+    def on_scrollbar(self, *args):
+        """Scrollbar command: positions are fractions of the full text"""
+        if args and args[0] == tk.MOVETO and self.is_windowed():
+            offset = int(float(args[1]) * len(self.source))
+            if self.window_start <= offset <= self.window_end and not self.near_window_edge(offset):
+                self.text.yview_moveto((offset - self.window_start) / max(self.window_end - self.window_start, 1))
+            else:
+                self.load_window(offset)
+            return
+        self.text.yview(*args)
+
+    # ---- Edits and tags ----------------------------------------------------------
+
+    def on_text_modified(self, event=None):
+        """Record a user edit (programmatic changes reset the flag before this runs)"""
+        if not self.text.edit_modified():
+            return
+        self.text.edit_modified(False)
+        self.window_modified = True
+        if self.on_modify:
+            self.on_modify()
+
+    def add_tag(self, tag: str, ranges: List[Tuple[int, int]]):
+        """Tag sorted, non-overlapping (start, end) ranges of the full text"""
+        self.sync_window()
+        starts, ends = self.tags.setdefault(tag, ([], []))
+        merged = sorted(list(zip(starts, ends)) + list(ranges))
+        starts[:] = [start for start, _ in merged]
+        ends[:] = [end for _, end in merged]
+        self.apply_tag(tag)
+
+    def remove_tag(self, tag: str):
+        self.tags[tag] = ([], [])
+        self.text.tag_remove(tag, 1.0, tk.END)
+
+    def apply_tag(self, tag: str):
+        """Tag the ranges that are in the window (one Tk call)"""
+        self.text.tag_remove(tag, 1.0, tk.END)
+        starts, ends = self.tags[tag]
+        indexes = []
+        for i in range(bisect.bisect_right(ends, self.window_start), len(starts)):
+            if starts[i] >= self.window_end:
+                break
+            indexes.append(self.index_of(max(starts[i], self.window_start)))
+            indexes.append(self.index_of(min(ends[i], self.window_end)))
+        if indexes:
+            self.text.tag_add(tag, *indexes)
+
+    def tag_configure(self, tag: str, **options):
+        self.text.tag_configure(tag, **options)
+
+    def count(self, index1, index2, *options):
+        """Text.count on the widget (what Tk holds, i.e. the window)"""
+        return self.text.count(index1, index2, *options)
@@ -0,0 +1,160 @@
+"""
+Workspace
+
+Several documents open side by side, typically the reports of one case.
+Each document keeps its own extraction, masking, conversation and session
+journal in a DocumentState; the provider pool, the masking profile, the
+templates and the caches keyed by text stay shared on the app. Switching
+documents only swaps which DocumentState the app reads, nothing is parsed
+or masked again.
+"""
+
+import glob
+import os
+import re
+from typing import List, Dict, Optional
+
+from document import TextDocument, PieceTable
+from masking import OccurrenceStore
+from session_journal import SessionJournal
+from stream_checkpoint import StreamCheckpoint
+
+
+class DocumentState:
+    """Everything that belongs to one open document"""
+
+    def __init__(self, doc_id: int):
+        self.doc_id = doc_id
+        self.document = TextDocument()
+        self.masked_pieces = PieceTable()
+        self.extracted_text_dirty = False  # True when extracted_text_area was edited by the user
+        self.masking_preview_stale = False  # True when masking_preview_area does not show masked_pieces yet
+        self.occurrences = OccurrenceStore()  # Masked occurrences (columnar) and the masked-name table
+        self.changes_listbox_slots = []  # Name slot shown at each changes listbox row
+        self.live_mask_index = None  # NormalizedText of extracted_text, built once per text
+        self.live_mask_cache = {}  # Normalized name -> occurrences found in live_mask_index
+        self.name_suggestions = []  # Candidates found in extracted_text
+        self.name_suggestions_text = None  # Text the suggestions were computed for
+        self.conversation_history = []  # List of messages: [{"role": "user"/"assistant", "content": "..."}]
+        self.is_first_message = True  # Track if this is the first API call
+        self.resume_state = None  # {'model', 'partial'} of an interrupted answer
+        self.stream_checkpoint: Optional[StreamCheckpoint] = None  # Streamed answer of this document, on disk
+        self.session_journal: Optional[SessionJournal] = None
+        self.journaled_edited_text = None  # Edited extraction last written to the journal
+        # Widget contents kept while another document is shown
+        self.view: Dict[str, str] = {"file_path": "", "start_word": None, "end_word": None,
+                                     "names": "", "result": ""}
+
+    @property
+    def label(self) -> str:
+        if self.view["file_path"]:
+            return f"{self.doc_id}. {os.path.basename(self.view['file_path'])}"
+        return f"{self.doc_id}. (no document)"
+
+
+class DocumentAttribute:
+    """Attribute of WordProcessorApp stored on the active DocumentState of its workspace"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return getattr(obj.workspace.active, self.name)
+
+    def __set__(self, obj, value):
+        setattr(obj.workspace.active, self.name, value)
+
+
+class Workspace:
+    """The open documents and the active one; each document has its own session journal
+    and stream checkpoint files"""
+
+    def __init__(self, session_file: str = "session.db", compact_every: int = 200,
+                 checkpoint_file: str = "stream_checkpoint"):
+        self.session_file = session_file
+        self.compact_every = compact_every
+        self.checkpoint_file = checkpoint_file
+        self.documents: List[DocumentState] = []
+        self.active: Optional[DocumentState] = None
+
+    def session_path(self, doc_id: int) -> str:
+        """session.db for the first document, session-<id>.db for the others"""
+        if doc_id == 1:
+            return self.session_file
+        root, ext = os.path.splitext(self.session_file)
+        return f"{root}-{doc_id}{ext}"
+
+    def checkpoint_path(self, doc_id: int) -> str:
+        """stream_checkpoint for the first document, stream_checkpoint-<id> for the others"""
+        if doc_id == 1:
+            return self.checkpoint_file
+        return f"{self.checkpoint_file}-{doc_id}"
+
+    def saved_document_ids(self) -> List[int]:
+        """IDs of the documents journaled by a previous run"""
+        ids = [1] if os.path.exists(self.session_file) else []
+        root, ext = os.path.splitext(self.session_file)
+        pattern = re.compile(re.escape(os.path.basename(root)) + r"-(\d+)" + re.escape(ext) + "$")
+        for path in glob.glob(f"{glob.escape(root)}-*{ext}"):
+            match = pattern.match(os.path.basename(path))
+            if match:
+                ids.append(int(match.group(1)))
+        return sorted(ids)
+
+    def open(self, doc_id: Optional[int] = None) -> DocumentState:
+        """Add a document (a new empty one unless doc_id names a saved one) and make it active"""
+        new = doc_id is None
+        if new:
+            used = [state.doc_id for state in self.documents] + self.saved_document_ids()
+            doc_id = max(used, default=0) + 1
+        state = DocumentState(doc_id)
+        state.stream_checkpoint = StreamCheckpoint(self.checkpoint_path(doc_id))
+        if new:
+            # A leftover of a document whose journal is gone cannot be resumed
+            state.stream_checkpoint.clear()
+        try:
+            state.session_journal = SessionJournal(self.session_path(doc_id), self.compact_every)
+        except Exception as e:
+            print(f"Warning: Session journal unavailable, the document will not be restored: {e}")
+        self.documents.append(state)
+        self.active = state
+        return state
+
+    def select(self, index: int) -> DocumentState:
+        self.active = self.documents[index]
+        return self.active
+
+    def index(self) -> int:
+        return self.documents.index(self.active)
+
+    def discard(self, state: DocumentState):
+        """Remove a document and delete its journal and stream checkpoint"""
+        state.stream_checkpoint.clear()
+        if state.session_journal is not None:
+            state.session_journal.delete()
+        position = self.documents.index(state)
+        self.documents.remove(state)
+        if state is self.active:
+            self.active = self.documents[min(position, len(self.documents) - 1)] if self.documents else None
+
+    def close(self, state: DocumentState):
+        """Close a document (see discard); the workspace always keeps one document"""
+        self.discard(state)
+        if not self.documents:
+            self.open()
+
+    def compact_all(self):
+        """Compact every journal so the next launch reads one snapshot per document.
+        Journals of documents that hold nothing (no document loaded) are deleted instead,
+        so the next launch does not reopen them"""
+        for state in self.documents:
+            journal = state.session_journal
+            if journal is None:
+                continue
+            if journal.get_blob("source") is None:
+                journal.delete()
+            else:
+                journal.compact()
+                journal.close()